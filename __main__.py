@@ -0,0 +1,8 @@
+"""
+Command-line entry point: python -m <plugin package> --help
+"""
+import sys
+
+from .dem_downscaling_cli import main
+
+sys.exit(main())
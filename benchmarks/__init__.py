@@ -0,0 +1,3 @@
+"""
+Benchmark and profiling tools for the DEM downscaling engines (not part of the plugin package)
+"""
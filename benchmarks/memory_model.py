@@ -0,0 +1,159 @@
+"""
+Validate the memory model against measured peaks
+
+Runs downscale_dem with a MemoryProfiler on synthetic DEMs for every engine,
+zoom factor, nodata pattern and dtype, and compares the measured peak of the
+arrays allocated by the run (tracemalloc) with estimate_memory_usage. Prints
+one row per workload with the measured and estimated peaks of every phase and
+exits with status 1 if any run peak is outside the tolerance.
+
+Usage (from the plugin directory):
+    python -m benchmarks.memory_model
+    python -m benchmarks.memory_model --sizes 256 512 --zooms 2 4 8 --tolerance 0.1 --output model.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+from dem_downscaling_profiling import MemoryProfiler  # noqa: E402
+
+try:
+    from .terrain import make_dem, write_dem, DTYPES
+    from .run_benchmarks import available_engines, environment_info, RESULTS_DIR
+except ImportError:
+    from terrain import make_dem, write_dem, DTYPES
+    from run_benchmarks import available_engines, environment_info, RESULTS_DIR
+
+
+# The model is an upper bound for iteration 2+; runs need at least 2 iterations
+ITERATIONS = 3
+
+# Phases the model predicts
+MODEL_PHASES = ('spatial_dependence', 'elevation_constraint', 'update')
+
+# Tracing allocations makes the pixel loops very slow: the loop engine is only
+# measured on inputs up to this size
+LOOP_SIZE = 32
+
+
+def measure(engine, size, zoom, nodata, dtype, work_dir, seed=0):
+    """Profile one run and compare it with the model; returns a record"""
+    goc, nodata_value = make_dem(size, size, nodata=nodata, dtype=dtype, seed=seed)
+    input_file = write_dem(os.path.join(work_dir, 'input.tif'), goc, nodata_value)
+    del goc
+
+    info = algorithm.get_raster_info(input_file)
+    estimate = algorithm.estimate_memory_usage(
+        size, size, zoom, engine=engine, dtype=info['dtype'], nodata=info['nodata_value'] is not None
+    )
+    with MemoryProfiler() as profiler:
+        algorithm.downscale_dem(
+            input_file, os.path.join(work_dir, 'output.tif'), zoom, 4.0,
+            threshold=0.0, max_iterations=ITERATIONS, engine=engine, profiler=profiler
+        )
+    profile = profiler.as_dict()
+
+    measured = profile['peak_traced_mb']
+    return {
+        'engine': engine,
+        'size': size,
+        'zoom': zoom,
+        'nodata': nodata,
+        'dtype': dtype,
+        'measured_mb': measured,
+        'estimated_mb': estimate['total_mb'],
+        'error': (estimate['total_mb'] - measured) / measured if measured > 0 else 0.0,
+        'peak_rss_mb': profile['peak_rss_mb'],
+        'phases': {
+            phase: {
+                'measured_mb': profile['phases'][phase]['peak_traced_mb'] if phase in profile['phases'] else None,
+                'estimated_mb': estimate['phases_mb'][phase]
+            }
+            for phase in MODEL_PHASES
+        }
+    }
+
+
+def within_tolerance(record, tolerance, slack_mb):
+    """Relative error within tolerance, or absolute error within slack_mb (fixed overheads of tiny runs)"""
+    return abs(record['error']) <= tolerance or abs(record['estimated_mb'] - record['measured_mb']) <= slack_mb
+
+
+def format_table(records, tolerance, slack_mb):
+    header = (f"{'engine':<10} {'size':>5} {'zoom':>4} {'nodata':<8} {'dtype':<8} "
+              f"{'sd meas/est':>15} {'ec meas/est':>15} {'peak MB':>8} {'model MB':>9} {'error':>7}")
+    lines = [header, '-' * len(header)]
+    for record in records:
+        phases = record['phases']
+        flag = '' if within_tolerance(record, tolerance, slack_mb) else '  <-- outside tolerance'
+        lines.append(
+            f"{record['engine']:<10} {record['size']:>5} {record['zoom']:>4} {record['nodata']:<8} {record['dtype']:<8} "
+            f"{phases['spatial_dependence']['measured_mb']:>7.1f}/{phases['spatial_dependence']['estimated_mb']:<7.1f} "
+            f"{phases['elevation_constraint']['measured_mb']:>7.1f}/{phases['elevation_constraint']['estimated_mb']:<7.1f} "
+            f"{record['measured_mb']:>8.1f} {record['estimated_mb']:>9.1f} {record['error']:>+7.1%}{flag}"
+        )
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Compare estimate_memory_usage with profiled peaks.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256], help="Input edge lengths (default: 64 256)")
+    parser.add_argument('--zooms', type=int, nargs='+', default=[2, 4, 8], help="Zoom factors (default: 2 4 8)")
+    parser.add_argument('--engines', nargs='+', choices=algorithm.ENGINES, help="Engines (default: all available)")
+    parser.add_argument('--nodata', nargs='+', choices=('none', 'coastal'), default=['none', 'coastal'],
+                        help="Nodata patterns (default: none coastal)")
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, default=list(DTYPES), help="Input data types (default: all)")
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help="Largest accepted relative error of the run peak (default: 0.15)")
+    parser.add_argument('--slack-mb', type=float, default=0.5,
+                        help="Absolute error always accepted, for interpreter overheads on tiny inputs (default: 0.5)")
+    parser.add_argument('--output', help="JSON result file (default: benchmarks/results/memory_model_<timestamp>.json)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    engines = [engine for engine in (args.engines or available_engines()) if engine in available_engines()]
+
+    work_dir = tempfile.mkdtemp(prefix='dem_memory_model_')
+    records = []
+    try:
+        for engine in engines:
+            sizes = sorted({min(size, LOOP_SIZE) for size in args.sizes}) if engine == 'loop' else args.sizes
+            for size in sizes:
+                for zoom in args.zooms:
+                    for nodata in args.nodata:
+                        for dtype in args.dtypes:
+                            print(f"{engine} {size}px z{zoom} {nodata} {dtype}", file=sys.stderr)
+                            records.append(measure(engine, size, zoom, nodata, dtype, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(format_table(records, args.tolerance, args.slack_mb))
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"memory_model_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'tolerance': args.tolerance, 'slack_mb': args.slack_mb,
+                   'records': records}, f, indent=1)
+    print(f"\nResults written to {output}", file=sys.stderr)
+
+    outside = [record for record in records if not within_tolerance(record, args.tolerance, args.slack_mb)]
+    if outside:
+        print(f"{len(outside)} of {len(records)} workloads outside the {args.tolerance:.0%} tolerance", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
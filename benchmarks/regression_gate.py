@@ -0,0 +1,259 @@
+"""
+Performance regression gate
+
+Runs a fixed set of CPU workloads, measures per-phase throughput and the peak
+memory of a profiled run, and compares them with the committed baseline
+(benchmarks/baseline.json). Prints a diff per metric and exits with status 1
+if any throughput dropped or any peak grew by more than its tolerance, or if a
+baseline workload or metric was not measured.
+
+Only the vectorized CPU engine is gated, and every workload runs on arrays in
+memory: raster I/O depends on the disk and the GDAL build, and the peak memory
+of a run is reached in the iterations, not while reading or writing. The gate
+therefore gives the same results with any GDAL build (GDAL must still be
+installed, as the plugin modules import it). Throughput depends on the CPU: the
+gate warns when the baseline was recorded on other hardware; re-record it with
+--update-baseline on the machine (or CI runner type) that runs the gate.
+
+Usage (from the plugin directory):
+    python -m benchmarks.regression_gate
+    python -m benchmarks.regression_gate --update-baseline     # after an intended change
+    python -m benchmarks.regression_gate --speed-tolerance 0.3 --output gate.json
+"""
+import argparse
+import json
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+from dem_downscaling_profiling import MemoryProfiler  # noqa: E402
+
+try:
+    from .run_benchmarks import benchmark_workload, environment_info, workload_name
+    from .memory_model import ITERATIONS
+    from .terrain import make_dem
+except ImportError:
+    from run_benchmarks import benchmark_workload, environment_info, workload_name
+    from memory_model import ITERATIONS
+    from terrain import make_dem
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+ENGINE = 'vectorized'
+
+# Fixed workloads: never change them without re-recording the baseline
+GATE_WORKLOADS = [
+    {'engine': ENGINE, 'size': size, 'zoom': 4, 'nodata': nodata, 'terrain': 'fractal', 'dtype': 'float32', 'seed': 0}
+    for size in (256, 512)
+    for nodata in ('none', 'coastal')
+]
+
+# Relative change accepted before a metric counts as a regression
+DEFAULT_TOLERANCES = {
+    'speed': 0.25,   # throughput may drop by up to 25% (timing noise)
+    'memory': 0.10   # peak memory may grow by up to 10%
+}
+
+# compare() statuses that fail the gate: a workload or metric of the baseline
+# that is no longer measured would otherwise hide a regression
+FAILING_STATUSES = ('regression', 'missing')
+
+# Metric name -> (kind, True if higher is better). 'info' metrics are reported
+# but never fail the gate: initialize takes milliseconds and is too noisy
+METRICS = {
+    'initialize_mpix_per_s': ('info', True),
+    'spatial_dependence_mpix_per_s': ('speed', True),
+    'elevation_constraint_mpix_per_s': ('speed', True),
+    'iteration_mpix_per_s': ('speed', True),
+    'peak_memory_mb': ('memory', False)
+}
+
+
+def profiled_peak_mb(workload):
+    """Peak memory allocated by downscale_array on the workload's DEM (tracemalloc)"""
+    goc, nodata_value = make_dem(workload['size'], workload['size'], workload['terrain'], workload['nodata'],
+                                 workload['dtype'], workload['seed'])
+    nodata_mask_orig = algorithm.build_nodata_mask(goc, nodata_value)
+    with MemoryProfiler(sample_rss=False) as profiler:
+        algorithm.downscale_array(
+            goc, workload['zoom'], 4.0, nodata_value=nodata_value, nodata_mask_orig=nodata_mask_orig,
+            threshold=0.0, max_iterations=ITERATIONS, engine=workload['engine'], profiler=profiler
+        )
+    return profiler.as_dict()['peak_traced_mb']
+
+
+def measure_workload(workload, repeat=5):
+    """Throughput of every phase (output Mpix/s) and the profiled peak memory of one workload"""
+    record = benchmark_workload(workload, None, repeat=repeat, full_run=False, write=False)
+    output_mpix = record['output_mpix']
+    metrics = {
+        f'{phase}_mpix_per_s': output_mpix / seconds if seconds > 0 else None
+        for phase, seconds in record['phases_s'].items()
+    }
+    metrics['iteration_mpix_per_s'] = record['iteration_mpix_per_s']
+    metrics['peak_memory_mb'] = profiled_peak_mb(workload)
+    return metrics
+
+
+def run_gate_workloads(repeat=5, progress=None):
+    """Measure every gate workload; returns {workload name: metrics}"""
+    algorithm.active_engine(ENGINE)  # fail early without SciPy
+    results = {}
+    for index, workload in enumerate(GATE_WORKLOADS, 1):
+        name = workload_name(workload)
+        if progress:
+            progress(f"[{index}/{len(GATE_WORKLOADS)}] {name}")
+        results[name] = measure_workload(workload, repeat=repeat)
+    return results
+
+
+def compare(baseline, current, tolerances):
+    """
+    Compare current metrics with the baseline
+
+    Returns:
+    --------
+    list : one dict per metric with workload, metric, baseline, current, change
+        (relative, positive = better) and status ('ok', 'improved', 'regression',
+        'info', 'new' or 'missing'). See FAILING_STATUSES
+    """
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        for metric, (kind, higher_is_better) in METRICS.items():
+            old = baseline.get(name, {}).get(metric)
+            new = current.get(name, {}).get(metric)
+            row = {'workload': name, 'metric': metric, 'baseline': old, 'current': new, 'change': None}
+            if old is None or new is None:
+                row['status'] = 'new' if old is None else 'missing'
+                rows.append(row)
+                continue
+            change = (new - old) / old if old else 0.0
+            if not higher_is_better:
+                change = -change
+            row['change'] = change
+            if kind == 'info':
+                row['status'] = 'info'
+            elif change < -tolerances[kind]:
+                row['status'] = 'regression'
+            elif change > tolerances[kind]:
+                row['status'] = 'improved'
+            else:
+                row['status'] = 'ok'
+            rows.append(row)
+    return rows
+
+
+def format_diff(rows):
+    """Plain-text diff of compare() rows"""
+    header = f"{'workload':<44} {'metric':<32} {'baseline':>10} {'current':>10} {'change':>8}  status"
+    lines = [header, '-' * len(header)]
+    for row in rows:
+        old = f"{row['baseline']:.2f}" if row['baseline'] is not None else '-'
+        new = f"{row['current']:.2f}" if row['current'] is not None else '-'
+        change = f"{row['change']:+.1%}" if row['change'] is not None else '-'
+        status = row['status'].upper() if row['status'] in FAILING_STATUSES else row['status']
+        lines.append(f"{row['workload']:<44} {row['metric']:<32} {old:>10} {new:>10} {change:>8}  {status}")
+    return "\n".join(lines)
+
+
+def environment_differs(baseline_env, current_env):
+    """Keys of the machine description that differ from the baseline's"""
+    keys = ('machine', 'processor', 'cpu_count', 'numpy')
+    return [key for key in keys if baseline_env.get(key) != current_env.get(key)]
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        raise Exception(f"Baseline file not found: {path} (record one with --update-baseline)")
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if not baseline.get('workloads'):
+        raise Exception(f"Baseline {path} has no measurements: record them with --update-baseline "
+                        f"on the machine that runs the gate")
+    return baseline
+
+
+def gate_environment():
+    """environment_info() without the GDAL version: the gate does no raster I/O"""
+    info = environment_info()
+    info.pop('gdal', None)
+    return info
+
+
+def save_baseline(path, results, tolerances):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'environment': gate_environment(),
+            'tolerances': tolerances,
+            'workloads': results
+        }, f, indent=1, sort_keys=True)
+        f.write("\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Compare benchmark throughput and peak memory with a stored baseline.")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument('--update-baseline', action='store_true',
+                        help="Record the current measurements as the new baseline instead of comparing")
+    parser.add_argument('--speed-tolerance', type=float,
+                        help=f"Accepted throughput drop (default: from the baseline, else {DEFAULT_TOLERANCES['speed']})")
+    parser.add_argument('--memory-tolerance', type=float,
+                        help=f"Accepted peak memory growth (default: from the baseline, else {DEFAULT_TOLERANCES['memory']})")
+    parser.add_argument('--repeat', type=int, default=5, help="Repetitions per phase; the best time is kept (default: 5)")
+    parser.add_argument('--output', help="Also write the measurements and the diff as JSON to this file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    baseline = None if args.update_baseline else load_baseline(args.baseline)
+
+    tolerances = dict(DEFAULT_TOLERANCES)
+    if baseline is not None:
+        tolerances.update(baseline.get('tolerances', {}))
+    if args.speed_tolerance is not None:
+        tolerances['speed'] = args.speed_tolerance
+    if args.memory_tolerance is not None:
+        tolerances['memory'] = args.memory_tolerance
+
+    results = run_gate_workloads(repeat=args.repeat, progress=lambda message: print(message, file=sys.stderr))
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results, tolerances)
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    differing = environment_differs(baseline.get('environment', {}), gate_environment())
+    if differing:
+        print(f"Warning: the baseline was recorded on a different machine ({', '.join(differing)} differ); "
+              f"throughput comparisons may not be meaningful", file=sys.stderr)
+
+    rows = compare(baseline['workloads'], results, tolerances)
+    print(format_diff(rows))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'environment': gate_environment(), 'tolerances': tolerances,
+                       'workloads': results, 'diff': rows}, f, indent=1)
+
+    regressions = [row for row in rows if row['status'] == 'regression']
+    missing = [row for row in rows if row['status'] == 'missing']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond tolerance "
+              f"(speed {tolerances['speed']:.0%}, memory {tolerances['memory']:.0%})", file=sys.stderr)
+    if missing:
+        print(f"\n{len(missing)} baseline metric(s) not measured; re-record the baseline "
+              f"if the workloads changed on purpose", file=sys.stderr)
+    if regressions or missing:
+        return 1
+    print(f"\nNo regressions (speed tolerance {tolerances['speed']:.0%}, "
+          f"memory tolerance {tolerances['memory']:.0%})", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
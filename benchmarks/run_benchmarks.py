@@ -0,0 +1,291 @@
+"""
+Benchmark suite for the DEM downscaling engines
+
+Times initialize, spatial_dependence, elevation_constraint, create_raster and a
+full downscale_dem run on deterministic synthetic DEMs, for every combination
+of engine, size, zoom factor, nodata pattern, terrain type and dtype of a suite.
+Results are written as JSON (one record per workload plus a description of the
+environment) and printed as a table.
+
+Usage (from the plugin directory):
+    python -m benchmarks.run_benchmarks --suite quick
+    python -m benchmarks.run_benchmarks --sizes 256 512 --zooms 4 --engines vectorized --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+
+try:
+    from .terrain import make_dem, write_dem, NODATA_PATTERNS, TERRAIN_TYPES, DTYPES
+except ImportError:
+    from terrain import make_dem, write_dem, NODATA_PATTERNS, TERRAIN_TYPES, DTYPES
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Sizes are input edge lengths in pixels
+SUITES = {
+    'quick': {
+        'sizes': [128, 256],
+        'zooms': [2, 4],
+        'nodata': ['none', 'coastal'],
+        'terrains': ['fractal'],
+        'dtypes': ['float32']
+    },
+    'standard': {
+        'sizes': [128, 256, 512],
+        'zooms': [2, 4],
+        'nodata': list(NODATA_PATTERNS),
+        'terrains': list(TERRAIN_TYPES),
+        'dtypes': list(DTYPES)
+    },
+    'large': {
+        'sizes': [512, 1024, 2048],
+        'zooms': [4],
+        'nodata': ['none', 'coastal'],
+        'terrains': ['fractal'],
+        'dtypes': ['float32']
+    }
+}
+
+# The pixel-by-pixel engine takes minutes per iteration on large grids: it is
+# only timed per phase, on inputs up to this size
+LOOP_MAX_SIZE = 128
+
+
+def available_engines():
+    """Engines that can run in this environment"""
+    engines = []
+    for engine in algorithm.ENGINES:
+        try:
+            algorithm.active_engine(engine)
+            engines.append(engine)
+        except ValueError:
+            pass
+    return engines
+
+
+def environment_info():
+    """Description of the machine and software the numbers were measured on"""
+    info = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'engine_version': algorithm.ENGINE_VERSION,
+        'engines': available_engines(),
+        'gpu_device': str(algorithm.GPU_DEVICE) if algorithm.GPU_AVAILABLE else None
+    }
+    if algorithm.PSUTIL_AVAILABLE:
+        info['memory_total_mb'] = algorithm.psutil.virtual_memory().total / (1024 * 1024)
+    try:
+        from osgeo import gdal
+        info['gdal'] = gdal.__version__
+    except (ImportError, AttributeError):
+        pass
+    return info
+
+
+def build_workloads(sizes, zooms, engines, nodata, terrains, dtypes, seed=0):
+    """Cartesian product of the workload dimensions (loop engine only on small sizes)"""
+    workloads = []
+    for engine in engines:
+        for size in sizes:
+            if engine == 'loop' and size > LOOP_MAX_SIZE:
+                continue
+            for zoom in zooms:
+                for pattern in nodata:
+                    for terrain in terrains:
+                        for dtype in dtypes:
+                            workloads.append({
+                                'engine': engine, 'size': size, 'zoom': zoom, 'nodata': pattern,
+                                'terrain': terrain, 'dtype': dtype, 'seed': seed
+                            })
+    return workloads
+
+
+def workload_name(workload):
+    return (f"{workload['engine']}-{workload['size']}px-z{workload['zoom']}-{workload['nodata']}-"
+            f"{workload['terrain']}-{workload['dtype']}")
+
+
+def time_best(func, repeat):
+    """Best wall time of repeat calls and the result of the last call"""
+    best = float('inf')
+    result = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def benchmark_workload(workload, work_dir, repeat=3, rsme=4.0, threshold=0.001, max_iterations=1000, full_run=True,
+                       write=True):
+    """
+    Time the phases and (optionally) a full run of one workload
+
+    Without write, create_raster is not timed and nothing touches the disk.
+
+    Returns:
+    --------
+    dict : the workload, phase times in seconds, output_mpix, iteration_mpix_per_s
+        (output megapixels per second of one spatial dependence + elevation
+        constraint step) and, with full_run, wall time, iterations, converged and
+        full_mpix_per_s_per_iteration
+    """
+    engine = workload['engine']
+    zoom = workload['zoom']
+    size = workload['size']
+    use_gpu = engine == 'gpu'
+    use_vectorized = engine != 'loop'
+
+    goc, nodata_value = make_dem(size, size, workload['terrain'], workload['nodata'], workload['dtype'], workload['seed'])
+    nodata_mask_orig = algorithm.build_nodata_mask(goc, nodata_value)
+
+    phases = {}
+    phases['initialize'], (dscal, nodata_mask_down) = time_best(
+        lambda: algorithm.initialize(goc, zoom, nodata_mask_orig), repeat)
+    dscal = dscal.astype(np.float64)
+    phases['spatial_dependence'], _ = time_best(
+        lambda: algorithm.spatial_dependence(dscal, nodata_mask_down, use_vectorized=use_vectorized, use_gpu=use_gpu),
+        1 if engine == 'loop' else repeat)
+    phases['elevation_constraint'], _ = time_best(
+        lambda: algorithm.elevation_constraint(dscal, goc, rsme, nodata_mask_orig, nodata_mask_down,
+                                               use_vectorized=use_vectorized, use_gpu=use_gpu),
+        1 if engine == 'loop' else repeat)
+
+    if write:
+        geot = (500000.0, 30.0 / zoom, 0.0, 2000000.0, 0.0, -30.0 / zoom)
+        output_file = os.path.join(work_dir, 'phase_output.tif')
+        phases['create_raster'], _ = time_best(
+            lambda: algorithm.create_raster(output_file, dscal, geot, '', nodata_value), repeat)
+
+    output_mpix = dscal.size / 1e6
+    step_seconds = phases['spatial_dependence'] + phases['elevation_constraint']
+    record = dict(workload)
+    record.update({
+        'name': workload_name(workload),
+        'phases_s': phases,
+        'output_mpix': output_mpix,
+        'iteration_mpix_per_s': output_mpix / step_seconds if step_seconds > 0 else None
+    })
+
+    if full_run and engine != 'loop':
+        input_file = write_dem(os.path.join(work_dir, 'input.tif'), goc, nodata_value)
+        t0 = time.perf_counter()
+        result = algorithm.downscale_dem(
+            input_file, os.path.join(work_dir, 'output.tif'), zoom, rsme,
+            threshold=threshold, max_iterations=max_iterations, engine=engine
+        )
+        wall = time.perf_counter() - t0
+        record['full'] = {
+            'wall_s': wall,
+            'iterations': result['iterations'],
+            'converged': bool(result['converged']),
+            'mpix_per_s_per_iteration': output_mpix * result['iterations'] / wall if wall > 0 else None
+        }
+    return record
+
+
+def run_benchmarks(workloads, repeat=3, max_iterations=1000, full_run=True, progress=None):
+    """Run every workload in a scratch directory and return the list of records"""
+    work_dir = tempfile.mkdtemp(prefix='dem_benchmark_')
+    records = []
+    try:
+        for index, workload in enumerate(workloads, 1):
+            if progress:
+                progress(f"[{index}/{len(workloads)}] {workload_name(workload)}")
+            records.append(benchmark_workload(
+                workload, work_dir, repeat=repeat, max_iterations=max_iterations, full_run=full_run
+            ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return records
+
+
+def format_table(records):
+    """Plain-text table of benchmark records"""
+    header = (f"{'workload':<46} {'init s':>8} {'sd s':>8} {'ec s':>8} {'write s':>8} "
+              f"{'Mpix/s/it':>10} {'iter':>5} {'full s':>8}")
+    lines = [header, '-' * len(header)]
+    for record in records:
+        phases = record['phases_s']
+        full = record.get('full')
+        throughput = record['iteration_mpix_per_s']
+        lines.append(
+            f"{record['name']:<46} {phases['initialize']:>8.4f} {phases['spatial_dependence']:>8.4f} "
+            f"{phases['elevation_constraint']:>8.4f} {phases['create_raster']:>8.4f} "
+            f"{throughput if throughput is not None else float('nan'):>10.2f} "
+            f"{full['iterations'] if full else '-':>5} "
+            f"{full['wall_s'] if full else float('nan'):>8.2f}"
+        )
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the DEM downscaling engines on synthetic terrain.")
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick', help="Predefined workload grid (default: quick)")
+    parser.add_argument('--sizes', type=int, nargs='+', help="Input edge lengths in pixels (overrides the suite)")
+    parser.add_argument('--zooms', type=int, nargs='+', help="Zoom factors (overrides the suite)")
+    parser.add_argument('--engines', nargs='+', choices=algorithm.ENGINES, help="Engines (default: all available)")
+    parser.add_argument('--nodata', nargs='+', choices=NODATA_PATTERNS, help="Nodata patterns (overrides the suite)")
+    parser.add_argument('--terrains', nargs='+', choices=TERRAIN_TYPES, help="Terrain types (overrides the suite)")
+    parser.add_argument('--dtypes', nargs='+', choices=DTYPES, help="Input data types (overrides the suite)")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions per phase; the best time is kept (default: 3)")
+    parser.add_argument('--max-iterations', type=int, default=1000, help="Iteration cap of full runs (default: 1000)")
+    parser.add_argument('--no-full-run', action='store_true', help="Only time the individual phases")
+    parser.add_argument('--seed', type=int, default=0, help="Terrain seed (default: 0)")
+    parser.add_argument('--output', help="JSON result file (default: benchmarks/results/benchmark_<timestamp>.json)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    suite = SUITES[args.suite]
+    engines = args.engines or available_engines()
+    unavailable = [engine for engine in engines if engine not in available_engines()]
+    if unavailable:
+        print(f"Skipping unavailable engine(s): {', '.join(unavailable)}", file=sys.stderr)
+        engines = [engine for engine in engines if engine not in unavailable]
+
+    workloads = build_workloads(
+        args.sizes or suite['sizes'], args.zooms or suite['zooms'], engines,
+        args.nodata or suite['nodata'], args.terrains or suite['terrains'], args.dtypes or suite['dtypes'],
+        seed=args.seed
+    )
+    records = run_benchmarks(
+        workloads, repeat=args.repeat, max_iterations=args.max_iterations, full_run=not args.no_full_run,
+        progress=lambda message: print(message, file=sys.stderr)
+    )
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'suite': args.suite, 'records': records}, f, indent=1)
+
+    print(format_table(records))
+    print(f"\nResults written to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
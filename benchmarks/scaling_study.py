@@ -0,0 +1,263 @@
+"""
+Strong- and weak-scaling study of the parallel engines
+
+Strong scaling keeps the DEM size fixed and runs with 1..N workers; weak scaling
+grows the DEM area in proportion to the number of workers. Every run does the
+same number of iterations per tile (threshold 0), so the work is exactly
+proportional to the area. Per run the study records wall time, the busy and
+stall time of each pipeline stage, peak memory and the parallel efficiency:
+
+- strong: T(1) / (N * T(N))
+- weak:   T(1) / T(N), corrected for the area rounding to whole tiles
+
+Usage (from the plugin directory):
+    python -m benchmarks.scaling_study --mode strong --size 1024 --workers 1 2 4 8
+    python -m benchmarks.scaling_study --mode both --engine chunks --tile-size 256 --plot scaling.png
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+from dem_downscaling_pipeline import downscale_dem_pipelined  # noqa: E402
+
+try:
+    from .terrain import make_dem, write_dem
+    from .run_benchmarks import environment_info, RESULTS_DIR
+except ImportError:
+    from terrain import make_dem, write_dem
+    from run_benchmarks import environment_info, RESULTS_DIR
+
+try:
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    MATPLOTLIB_AVAILABLE = True
+except ImportError:
+    MATPLOTLIB_AVAILABLE = False
+
+
+# Parallel engines: pipelined = one writer thread, chunks = every worker writes its own chunks
+ENGINES = ('pipelined', 'chunks')
+
+
+class PeakMemorySampler:
+    """
+    Context manager sampling the resident set size of this process in a thread
+
+    Falls back to the process-wide maximum from getrusage (which never goes
+    down between runs) when psutil is not installed.
+    """
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.baseline_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def rss_mb():
+        if algorithm.PSUTIL_AVAILABLE:
+            return algorithm.psutil.Process().memory_info().rss / (1024 * 1024)
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self.rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline_mb = self.peak_mb = self.rss_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, self.rss_mb())
+        return False
+
+    @property
+    def increase_mb(self):
+        return self.peak_mb - self.baseline_mb
+
+
+def weak_size(base_size, workers, tile_size):
+    """Edge length whose area is workers times base_size squared, rounded to whole tiles"""
+    edge = base_size * math.sqrt(workers)
+    return max(tile_size, int(round(edge / tile_size)) * tile_size)
+
+
+def run_point(engine, size, workers, work_dir, zoom=4, rsme=4.0, iterations=20, tile_size=256, halo=16, seed=0):
+    """One timed run of the engine; returns a record with wall time, stage times and memory"""
+    goc, nodata_value = make_dem(size, size, seed=seed)
+    input_file = write_dem(os.path.join(work_dir, f'input_{size}.tif'), goc, nodata_value)
+    output_file = os.path.join(work_dir, 'output.tif')
+    if os.path.exists(output_file):
+        os.remove(output_file)
+
+    with PeakMemorySampler() as memory:
+        t0 = time.perf_counter()
+        result = downscale_dem_pipelined(
+            input_file, output_file, zoom, rsme,
+            threshold=0.0, max_iterations=iterations,
+            tile_size=tile_size, halo=halo, workers=workers,
+            output_mode='single' if engine == 'pipelined' else 'chunks'
+        )
+        wall = time.perf_counter() - t0
+    stats = result['pipeline_stats']
+    return {
+        'engine': engine,
+        'size': size,
+        'workers': workers,
+        'zoom': zoom,
+        'iterations': iterations,
+        'tile_size': tile_size,
+        'tiles': result['tiles'],
+        'wall_s': wall,
+        'busy_s': stats['busy_seconds'],
+        'stall_s': stats['stall_seconds'],
+        'output_mpix_per_s': stats['output_mpix_per_s'],
+        'peak_rss_mb': memory.peak_mb,
+        'rss_increase_mb': memory.increase_mb
+    }
+
+
+def add_efficiency(records, mode):
+    """Speed-up and parallel efficiency relative to the 1-worker (or smallest) run"""
+    reference = min(records, key=lambda record: record['workers'])
+    for record in records:
+        scale = record['workers'] / reference['workers']
+        if mode == 'strong':
+            # Same work on more workers
+            record['speedup'] = reference['wall_s'] / record['wall_s']
+        else:
+            # Tile rounding makes the area only roughly proportional to the workers:
+            # compare against the time the reference would need for this area
+            work = (record['size'] / reference['size']) ** 2
+            record['speedup'] = work * reference['wall_s'] / record['wall_s']
+        record['efficiency'] = record['speedup'] / scale
+    return records
+
+
+def run_study(mode, engine, size, worker_counts, zoom=4, iterations=20, tile_size=256, halo=16, progress=None):
+    """Run one scaling series ('strong' or 'weak') and return its records"""
+    work_dir = tempfile.mkdtemp(prefix='dem_scaling_')
+    records = []
+    try:
+        for workers in sorted(set(worker_counts)):
+            run_size = size if mode == 'strong' else weak_size(size, workers, tile_size)
+            if progress:
+                progress(f"{mode}: {engine}, {workers} worker(s), {run_size}x{run_size} px")
+            record = run_point(engine, run_size, workers, work_dir, zoom=zoom, iterations=iterations,
+                               tile_size=tile_size, halo=halo)
+            record['mode'] = mode
+            records.append(record)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return add_efficiency(records, mode)
+
+
+def format_table(records):
+    header = (f"{'mode':<6} {'engine':<9} {'workers':>7} {'size':>6} {'wall s':>8} {'speedup':>8} {'eff':>6} "
+              f"{'compute s':>9} {'read s':>7} {'write s':>7} {'starved s':>9} {'Mpix/s':>7} {'peak MB':>8}")
+    lines = [header, '-' * len(header)]
+    for record in records:
+        busy = record['busy_s']
+        lines.append(
+            f"{record['mode']:<6} {record['engine']:<9} {record['workers']:>7} {record['size']:>6} "
+            f"{record['wall_s']:>8.2f} {record['speedup']:>8.2f} {record['efficiency']:>6.2f} "
+            f"{busy.get('compute', 0.0):>9.2f} {busy.get('read', 0.0):>7.2f} {busy.get('write', 0.0):>7.2f} "
+            f"{record['stall_s'].get('compute_starved', 0.0):>9.2f} {record['output_mpix_per_s']:>7.2f} "
+            f"{record['peak_rss_mb']:>8.0f}"
+        )
+    return "\n".join(lines)
+
+
+def plot(records, path):
+    """Speed-up and efficiency curves per mode"""
+    figure, (ax_speedup, ax_efficiency) = plt.subplots(1, 2, figsize=(11, 4.5))
+    for mode in ('strong', 'weak'):
+        series = [record for record in records if record['mode'] == mode]
+        if not series:
+            continue
+        workers = [record['workers'] for record in series]
+        ax_speedup.plot(workers, [record['speedup'] for record in series], marker='o', label=mode)
+        ax_efficiency.plot(workers, [record['efficiency'] for record in series], marker='o', label=mode)
+    max_workers = max(record['workers'] for record in records)
+    ax_speedup.plot([1, max_workers], [1, max_workers], linestyle=':', color='grey', label='ideal')
+    ax_speedup.set_xlabel('workers')
+    ax_speedup.set_ylabel('speed-up')
+    ax_efficiency.axhline(1.0, linestyle=':', color='grey')
+    ax_efficiency.set_xlabel('workers')
+    ax_efficiency.set_ylabel('parallel efficiency')
+    ax_efficiency.set_ylim(0, 1.1)
+    for ax in (ax_speedup, ax_efficiency):
+        ax.legend()
+        ax.grid(True, alpha=0.3)
+    figure.tight_layout()
+    figure.savefig(path, dpi=120)
+
+
+def build_parser():
+    default_workers = [n for n in (1, 2, 4, 8, 16) if n <= (os.cpu_count() or 1)]
+    parser = argparse.ArgumentParser(description="Strong- and weak-scaling study of the parallel engines.")
+    parser.add_argument('--mode', choices=('strong', 'weak', 'both'), default='both', help="Scaling series (default: both)")
+    parser.add_argument('--engine', choices=ENGINES, default='pipelined', help="Parallel engine (default: pipelined)")
+    parser.add_argument('--size', type=int, default=1024,
+                        help="Input edge in pixels (strong), or per worker (weak) (default: 1024)")
+    parser.add_argument('--workers', type=int, nargs='+', default=default_workers,
+                        help=f"Worker counts (default: {' '.join(map(str, default_workers))})")
+    parser.add_argument('--zoom', type=int, default=4, help="Zoom factor (default: 4)")
+    parser.add_argument('--iterations', type=int, default=20, help="Iterations per tile (default: 20)")
+    parser.add_argument('--tile-size', type=int, default=256, help="Tile edge in input pixels (default: 256)")
+    parser.add_argument('--halo', type=int, default=16, help="Tile halo in input pixels (default: 16)")
+    parser.add_argument('--output', help="JSON result file (default: benchmarks/results/scaling_<timestamp>.json)")
+    parser.add_argument('--plot', help="Write speed-up/efficiency curves to this image (requires matplotlib)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    modes = ('strong', 'weak') if args.mode == 'both' else (args.mode,)
+    records = []
+    for mode in modes:
+        records.extend(run_study(
+            mode, args.engine, args.size, args.workers, zoom=args.zoom, iterations=args.iterations,
+            tile_size=args.tile_size, halo=args.halo, progress=lambda message: print(message, file=sys.stderr)
+        ))
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"scaling_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'records': records}, f, indent=1)
+
+    print(format_table(records))
+    print(f"\nResults written to {output}", file=sys.stderr)
+    if args.plot:
+        if MATPLOTLIB_AVAILABLE:
+            plot(records, args.plot)
+            print(f"Plot written to {args.plot}", file=sys.stderr)
+        else:
+            print("matplotlib is not installed - skipping the plot", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""
+Deterministic synthetic DEMs for benchmarks
+
+All generators take a seed, so the same arguments give bit-identical terrain on
+every machine and benchmark numbers stay comparable between runs.
+"""
+import numpy as np
+
+
+NODATA_VALUE = -9999
+NODATA_PATTERNS = ('none', 'random', 'coastal')
+TERRAIN_TYPES = ('fractal', 'flat')
+DTYPES = ('float32', 'int16')
+
+
+def fractal_terrain(width, height, seed=0, hurst=0.8, relief=800.0, base=100.0):
+    """
+    Fractal (fractional Brownian) surface by spectral synthesis
+
+    Parameters:
+    -----------
+    width, height : int
+        Size in pixels
+    seed : int
+        Random seed
+    hurst : float
+        Roughness (0 = very rough, 1 = smooth)
+    relief : float
+        Elevation range in metres
+    base : float
+        Lowest elevation in metres
+
+    Returns:
+    --------
+    numpy.ndarray : float64 elevations
+    """
+    rng = np.random.default_rng(seed)
+    ky = np.fft.fftfreq(height)[:, None]
+    kx = np.fft.rfftfreq(width)[None, :]
+    k = np.hypot(kx, ky)
+    k[0, 0] = 1.0
+    amplitude = k ** -(hurst + 1.0)
+    amplitude[0, 0] = 0.0
+    phase = rng.uniform(0.0, 2.0 * np.pi, size=k.shape)
+    spectrum = amplitude * rng.normal(size=k.shape) * np.exp(1j * phase)
+    surface = np.fft.irfft2(spectrum, s=(height, width))
+    surface -= surface.min()
+    span = surface.max()
+    if span > 0:
+        surface /= span
+    return base + relief * surface
+
+
+def add_flat_areas(dem, fraction=0.3):
+    """Flatten the lowest fraction of a surface to one level (plains, lakes, reservoirs)"""
+    level = np.quantile(dem, fraction)
+    return np.maximum(dem, level)
+
+
+def nodata_mask(width, height, pattern='none', fraction=0.2, seed=0):
+    """
+    Synthetic nodata mask
+
+    'random' scatters single void pixels (e.g. radar shadow or cloud gaps),
+    'coastal' makes one contiguous sea area with an irregular coastline.
+
+    Returns:
+    --------
+    numpy.ndarray or None : boolean mask (True = nodata), None for 'none'
+    """
+    if pattern == 'none':
+        return None
+    if pattern == 'random':
+        rng = np.random.default_rng(seed + 1)
+        return rng.random((height, width)) < fraction
+    if pattern == 'coastal':
+        # Smooth field tilted towards one edge, so the sea is contiguous
+        field = fractal_terrain(width, height, seed=seed + 2, hurst=0.9, relief=1.0, base=0.0)
+        field += np.linspace(0.0, 1.5, width)[None, :]
+        return field < np.quantile(field, fraction)
+    raise ValueError(f"Unknown nodata pattern: {pattern} (expected one of {', '.join(NODATA_PATTERNS)})")
+
+
+def make_dem(width, height, terrain='fractal', nodata='none', dtype='float32', seed=0, nodata_fraction=0.2):
+    """
+    Synthetic DEM for one benchmark workload
+
+    Returns:
+    --------
+    tuple : (data, nodata_value) - nodata_value is None without a nodata pattern
+    """
+    if terrain == 'fractal':
+        dem = fractal_terrain(width, height, seed=seed)
+    elif terrain == 'flat':
+        dem = add_flat_areas(fractal_terrain(width, height, seed=seed))
+    else:
+        raise ValueError(f"Unknown terrain type: {terrain} (expected one of {', '.join(TERRAIN_TYPES)})")
+
+    if dtype == 'int16':
+        dem = np.round(dem).astype(np.int16)
+    elif dtype == 'float32':
+        dem = dem.astype(np.float32)
+    else:
+        raise ValueError(f"Unknown dtype: {dtype} (expected one of {', '.join(DTYPES)})")
+
+    mask = nodata_mask(width, height, nodata, fraction=nodata_fraction, seed=seed)
+    if mask is None:
+        return dem, None
+    dem[mask] = NODATA_VALUE
+    return dem, NODATA_VALUE
+
+
+def write_dem(path, data, nodata_value=None, pixel_size=30.0, epsg=32648):
+    """Write a synthetic DEM as a GeoTIFF in a UTM projection"""
+    from osgeo import gdal, osr
+
+    gdal_type = gdal.GDT_Int16 if data.dtype == np.int16 else gdal.GDT_Float32
+    height, width = data.shape
+    ds = gdal.GetDriverByName('GTiff').Create(path, width, height, 1, gdal_type, options=['TILED=YES'])
+    if ds is None:
+        raise Exception(f"Error creating benchmark DEM: {path}")
+    ds.SetGeoTransform((500000.0, pixel_size, 0.0, 2000000.0, 0.0, -pixel_size))
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    ds.SetProjection(srs.ExportToWkt())
+    band = ds.GetRasterBand(1)
+    if nodata_value is not None:
+        band.SetNoDataValue(nodata_value)
+    band.WriteArray(data)
+    ds = None
+    return path
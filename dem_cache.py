@@ -0,0 +1,490 @@
+"""
+On-disk caches for the DEM downscaling plugin
+
+LruFileCache keeps entries as sub-directories of a cache directory together with
+an index of their sizes and last access times, and evicts the least recently
+used entries once the total size exceeds a cap. The index is shared by every
+process using the directory (e.g. the CLI worker pool) and guarded by a lock
+file.
+
+StagingCache converts input DEMs once into a tiled, uncompressed (or fast-codec)
+float32 GeoTIFF plus a precomputed nodata mask, so repeated runs on the same DEM
+skip decoding slow source formats and rebuilding the mask.
+
+ResultCache keeps downscaled outputs keyed by the input content, the algorithm
+parameters and the engine, so a repeated request is answered by linking or
+copying the earlier output instead of running the iterations again.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import numpy as np
+from osgeo import gdal
+
+try:
+    from .dem_downscaling_algorithm import open_raster, build_nodata_mask, active_engine, ENGINE_VERSION
+except ImportError:
+    from dem_downscaling_algorithm import open_raster, build_nodata_mask, active_engine, ENGINE_VERSION
+
+
+def default_cache_dir(name):
+    """
+    Default location of a named cache
+
+    Uses $DEM_DOWNSCALING_CACHE_DIR if set, otherwise ~/.cache/dem_downscaling.
+    """
+    base = os.environ.get('DEM_DOWNSCALING_CACHE_DIR')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache', 'dem_downscaling')
+    return os.path.join(base, name)
+
+
+def file_signature(path):
+    """Identity of a file on disk: absolute path, size and modification time"""
+    st = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns
+    }
+
+
+def hash_key(*parts):
+    """Stable hex key for JSON-serialisable parts"""
+    payload = json.dumps(parts, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()[:40]
+
+
+def file_content_hash(path, chunk_size=4 * 1024 * 1024):
+    """SHA-256 of the bytes of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def raster_metadata(path):
+    """Georeferencing and layout of a raster, including what sidecar files may override"""
+    ds = open_raster(path)
+    band = ds.GetRasterBand(1)
+    nodata_value = band.GetNoDataValue()
+    meta = {
+        'width': ds.RasterXSize,
+        'height': ds.RasterYSize,
+        'geotransform': list(ds.GetGeoTransform()),
+        'projection': ds.GetProjection(),
+        'nodata_value': None if nodata_value is None else float(nodata_value)
+    }
+    ds = None
+    return meta
+
+
+def link_or_copy(src, dst, link=True):
+    """
+    Make dst a hard link to src, or a copy if linking is disabled or fails
+    (e.g. across file systems). dst is replaced atomically if it exists.
+    """
+    tmp_dst = os.path.join(os.path.dirname(os.path.abspath(dst)), f".{os.path.basename(dst)}.{os.getpid()}.tmp")
+    if os.path.exists(tmp_dst):
+        os.remove(tmp_dst)
+    linked = False
+    if link:
+        try:
+            os.link(src, tmp_dst)
+            linked = True
+        except OSError:
+            pass
+    if not linked:
+        shutil.copy2(src, tmp_dst)
+    os.replace(tmp_dst, dst)
+    return linked
+
+
+def directory_size(path):
+    """Total size in bytes of the files below path"""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+class InterProcessLock:
+    """
+    Exclusive lock on a file, held across processes
+
+    Uses flock on POSIX and msvcrt.locking on Windows. Each acquisition opens
+    the file anew, so threads of one process exclude each other as well.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass  # LK_LOCK gives up after about 10 seconds
+        except BaseException:
+            self._file.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+        return False
+
+
+class LruFileCache:
+    """
+    Directory of cache entries with least-recently-used eviction under a size cap
+
+    Changes of the index happen under a lock file, so processes sharing the
+    directory never lose each other's updates. Eviction and purge also count
+    entry directories that are missing from the index. A hit only touches the
+    modification time of the entry directory, which counts as its last access;
+    hit counts are written with the next change of the index.
+    """
+
+    INDEX_NAME = 'index.json'
+    LOCK_NAME = 'index.lock'
+
+    def __init__(self, cache_dir, max_size_mb):
+        self.cache_dir = cache_dir
+        self.max_size_mb = max_size_mb
+        self._lock = threading.Lock()
+        self._pending_hits = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, self.INDEX_NAME)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, InterProcessLock(os.path.join(self.cache_dir, self.LOCK_NAME)):
+            yield
+
+    def _load_index(self):
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Drop entries whose directory disappeared (e.g. cleaned up by hand)
+        return {key: entry for key, entry in index.items() if os.path.isdir(self.entry_dir(key))}
+
+    def _save_index(self, index):
+        # Write atomically so readers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self._index_path())
+
+    def _entry_keys_on_disk(self):
+        # Entries are the non-hidden sub-directories; .building-* are entries under construction
+        return [
+            name for name in os.listdir(self.cache_dir)
+            if not name.startswith('.') and os.path.isdir(self.entry_dir(name))
+        ]
+
+    def _reconcile(self, index):
+        """
+        Bring the index in line with the entry directories on disk
+
+        Directories missing from the index are added with their size, and the
+        modification time of every directory (touched on hits) updates its
+        last access time.
+        """
+        for key in self._entry_keys_on_disk():
+            try:
+                mtime = os.stat(self.entry_dir(key)).st_mtime
+            except OSError:
+                continue
+            entry = index.get(key)
+            if entry is None:
+                index[key] = {
+                    'size_bytes': directory_size(self.entry_dir(key)),
+                    'created': mtime,
+                    'last_access': mtime,
+                    'hits': 0,
+                    'meta': {}
+                }
+            else:
+                entry['last_access'] = max(entry['last_access'], mtime)
+        return index
+
+    def _record_pending_hits(self, index):
+        for key, hits in self._pending_hits.items():
+            if key in index:
+                index[key]['hits'] = index[key].get('hits', 0) + hits
+        self._pending_hits = {}
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """Return the entry metadata for key and mark it as recently used, or None on a miss"""
+        entry = self._load_index().get(key)
+        if entry is None:
+            return None
+        try:
+            os.utime(self.entry_dir(key))
+        except OSError:
+            return None  # evicted concurrently
+        with self._lock:
+            self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        entry['last_access'] = time.time()
+        return entry
+
+    def new_entry_dir(self):
+        """Temporary directory to build an entry in before commit()"""
+        return tempfile.mkdtemp(dir=self.cache_dir, prefix='.building-')
+
+    def commit(self, key, build_dir, meta=None):
+        """Move a fully built entry into place, record it and evict old entries"""
+        size = directory_size(build_dir)
+        with self._locked():
+            target = self.entry_dir(key)
+            if os.path.isdir(target):
+                # Another process built the same entry first
+                shutil.rmtree(build_dir, ignore_errors=True)
+            else:
+                os.replace(build_dir, target)
+            index = self._reconcile(self._load_index())
+            self._record_pending_hits(index)
+            now = time.time()
+            index[key] = {
+                'size_bytes': size,
+                'created': now,
+                'last_access': now,
+                'hits': 0,
+                'meta': meta or {}
+            }
+            self._evict(index, keep=key)
+            self._save_index(index)
+            return index[key]
+
+    def _evict(self, index, keep=None):
+        # index must be reconciled with the disk, so unindexed entries count as well
+        limit = self.max_size_mb * 1024 * 1024
+        total = sum(entry['size_bytes'] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_access']):
+            if total <= limit:
+                break
+            if key == keep:
+                continue
+            total -= index[key]['size_bytes']
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            del index[key]
+
+    def entries(self):
+        """List of (key, entry) pairs, most recently used first"""
+        index = self._reconcile(self._load_index())
+        return sorted(index.items(), key=lambda item: item[1]['last_access'], reverse=True)
+
+    def total_size_mb(self):
+        return sum(entry['size_bytes'] for _, entry in self.entries()) / (1024 * 1024)
+
+    def purge(self):
+        """Remove every entry, including entry directories missing from the index"""
+        with self._locked():
+            for key in set(self._load_index()) | set(self._entry_keys_on_disk()):
+                shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            self._pending_hits = {}
+            self._save_index({})
+
+
+class StagingCache(LruFileCache):
+    """
+    Cache of inputs converted to an optimized local layout
+
+    Entries are keyed by the source path, size, modification time and band, so
+    an edited source file is staged again automatically.
+    """
+
+    RASTER_NAME = 'staged.tif'
+    MASK_NAME = 'nodata_mask.npy'
+
+    def __init__(self, cache_dir=None, max_size_mb=2048, codec=None):
+        """
+        Parameters:
+        -----------
+        cache_dir : str or None
+            Cache directory (default: default_cache_dir('staging'))
+        max_size_mb : float
+            Size cap; least recently used entries are evicted beyond it
+        codec : str or None
+            GeoTIFF compression of staged rasters (None = uncompressed, e.g. 'ZSTD' or 'LZW')
+        """
+        LruFileCache.__init__(self, cache_dir or default_cache_dir('staging'), max_size_mb)
+        self.codec = codec
+
+    def stage(self, path, band=1, progress_callback=None):
+        """
+        Return the staged copy of a band, converting it on a cache miss
+
+        Returns:
+        --------
+        tuple : (staged_file, nodata_mask) - nodata_mask is a read-only memory-mapped
+            boolean array, or None when the source has no nodata value
+        """
+        key = hash_key('staging', file_signature(path), band, self.codec)
+        entry = self.lookup(key)
+        if entry is None:
+            if progress_callback:
+                progress_callback(f"Staging {os.path.basename(path)} into local cache...", 1)
+            build_dir = self.new_entry_dir()
+            try:
+                self._convert(path, band, build_dir)
+            except Exception:
+                shutil.rmtree(build_dir, ignore_errors=True)
+                raise
+            entry = self.commit(key, build_dir, meta={'source': os.path.abspath(path), 'band': band})
+        elif progress_callback:
+            progress_callback(f"Using staged copy of {os.path.basename(path)} from cache", 1)
+
+        entry_dir = self.entry_dir(key)
+        mask_file = os.path.join(entry_dir, self.MASK_NAME)
+        nodata_mask = np.load(mask_file, mmap_mode='r') if os.path.exists(mask_file) else None
+        return os.path.join(entry_dir, self.RASTER_NAME), nodata_mask
+
+    def _convert(self, path, band, build_dir):
+        # SPARSE_OK keeps all-nodata blocks unallocated, so skip_empty_blocks still
+        # recognizes them in the staged copy (see block_is_empty)
+        creation_options = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'SPARSE_OK=TRUE', 'BIGTIFF=IF_SAFER']
+        if self.codec:
+            creation_options.append(f'COMPRESS={self.codec}')
+        staged_file = os.path.join(build_dir, self.RASTER_NAME)
+        out = gdal.Translate(
+            staged_file, path, format='GTiff', outputType=gdal.GDT_Float32,
+            bandList=[band], creationOptions=creation_options
+        )
+        if out is None:
+            raise Exception(f"Error staging raster: {path}")
+        out = None
+
+        ds = open_raster(staged_file)
+        raster_band = ds.GetRasterBand(1)
+        nodata_mask = build_nodata_mask(raster_band.ReadAsArray(), raster_band.GetNoDataValue())
+        ds = None
+        if nodata_mask is not None:
+            np.save(os.path.join(build_dir, self.MASK_NAME), nodata_mask)
+
+
+class ResultCache(LruFileCache):
+    """
+    Cache of downscaled outputs
+    
+    Entries are keyed by a hash of the input file content, its georeferencing,
+    the algorithm parameters, the engine and ENGINE_VERSION, so the output path
+    plays no role and a changed input or parameter never hits a stale entry.
+    
+    With link=True outputs are hard-linked to the cached files where possible,
+    which costs no extra disk space. Tools that modify such an output in place
+    would also modify the cached copy; use link=False if outputs are edited.
+    """
+    
+    RASTER_NAME = 'result.tif'
+    RESULT_NAME = 'result.json'
+    
+    def __init__(self, cache_dir=None, max_size_mb=4096, link=True):
+        """
+        Parameters:
+        -----------
+        cache_dir : str or None
+            Cache directory (default: default_cache_dir('results'))
+        max_size_mb : float
+            Size cap; least recently used entries are evicted beyond it
+        link : bool
+            Hard-link outputs to cache entries instead of copying them
+        """
+        LruFileCache.__init__(self, cache_dir or default_cache_dir('results'), max_size_mb)
+        self.link = link
+        self._content_hashes = {}
+    
+    def _content_hash(self, path):
+        # Hash each file version once per cache object (batch runs often share inputs)
+        signature = file_signature(path)
+        memo_key = (signature['path'], signature['size'], signature['mtime_ns'])
+        if memo_key not in self._content_hashes:
+            self._content_hashes[memo_key] = file_content_hash(path)
+        return self._content_hashes[memo_key]
+    
+    def key_for(self, input_file, engine=None, **params):
+        """Cache key for downscaling input_file on engine with the given numeric algorithm parameters"""
+        params = {name: float(value) for name, value in params.items()}
+        return hash_key(
+            'result', ENGINE_VERSION, active_engine(engine),
+            self._content_hash(input_file), raster_metadata(input_file), params
+        )
+    
+    def fetch(self, key, output_file):
+        """
+        Produce output_file from the cache entry for key
+        
+        Returns:
+        --------
+        dict or None : the downscale_dem result of the cached run (with
+            output_file replaced and cached=True), or None on a miss
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None
+        entry_dir = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, self.RESULT_NAME), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            link_or_copy(os.path.join(entry_dir, self.RASTER_NAME), output_file, self.link)
+        except OSError:
+            # Entry damaged or removed concurrently: treat as a miss
+            return None
+        result['output_file'] = output_file
+        result['input_size'] = tuple(result['input_size'])
+        result['output_size'] = tuple(result['output_size'])
+        result['cached'] = True
+        return result
+    
+    def store(self, key, output_file, result):
+        """Add a finished output and its downscale_dem result dict to the cache"""
+        build_dir = self.new_entry_dir()
+        try:
+            link_or_copy(output_file, os.path.join(build_dir, self.RASTER_NAME), self.link)
+            with open(os.path.join(build_dir, self.RESULT_NAME), 'w', encoding='utf-8') as f:
+                json.dump(result, f, default=lambda value: value.item() if isinstance(value, np.generic) else str(value))
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        return self.commit(key, build_dir, meta={
+            'output_file': os.path.abspath(output_file),
+            'iterations': result['iterations']
+        })
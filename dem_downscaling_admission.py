@@ -0,0 +1,96 @@
+"""
+Memory-aware admission of concurrent downscaling jobs
+
+AdmissionQueue decides which queued jobs may start. It works with a fixed
+memory budget, taken once when the queue is created, and reserves the estimated
+memory of every running job against it: a job that was just started has not
+allocated its arrays yet, so the memory the system currently reports as free
+would count it twice.
+
+The queue holds any objects with a memory_mb attribute; DownscalingTaskScheduler
+uses it for QgsTask objects.
+"""
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+MB = 1024 * 1024
+
+# Budget assumed when psutil is not available
+DEFAULT_AVAILABLE_MB = 4096
+
+
+def available_memory_mb():
+    """Memory currently available to new allocations, in MB"""
+    if PSUTIL_AVAILABLE:
+        return psutil.virtual_memory().available / MB
+    return DEFAULT_AVAILABLE_MB
+
+
+class AdmissionQueue:
+    """
+    FIFO queue of jobs started while their reserved memory fits the budget
+
+    Parameters:
+    -----------
+    budget_mb : float
+        Memory that running jobs may reserve in total
+    max_concurrent : int
+        Maximum number of running jobs
+
+    A job is admitted when the memory_mb of the running jobs plus its own fits
+    into budget_mb, or when nothing else is running (so a job larger than the
+    budget still runs, alone). Jobs start in submission order: a large job at
+    the head of the queue is not overtaken by smaller ones.
+    """
+
+    def __init__(self, budget_mb, max_concurrent):
+        self.budget_mb = budget_mb
+        self.max_concurrent = max(1, max_concurrent)
+        self.running = []
+        self.pending = []
+
+    @classmethod
+    def for_available_memory(cls, memory_fraction, max_concurrent):
+        """Queue whose budget is memory_fraction of the memory available now"""
+        return cls(available_memory_mb() * memory_fraction, max_concurrent)
+
+    @property
+    def reserved_mb(self):
+        """Memory reserved by the running jobs"""
+        return sum(job.memory_mb for job in self.running)
+
+    def fits(self, job):
+        if not self.running:
+            return True
+        if len(self.running) >= self.max_concurrent:
+            return False
+        return self.reserved_mb + job.memory_mb <= self.budget_mb
+
+    def add(self, job):
+        self.pending.append(job)
+
+    def remove(self, job):
+        """Forget a finished or cancelled job, freeing its reservation"""
+        if job in self.running:
+            self.running.remove(job)
+        if job in self.pending:
+            self.pending.remove(job)
+
+    def admit(self):
+        """
+        Move the jobs that fit from the head of the queue to the running ones
+
+        Returns:
+        --------
+        list : jobs to start, in order
+        """
+        started = []
+        while self.pending and self.fits(self.pending[0]):
+            job = self.pending.pop(0)
+            self.running.append(job)
+            started.append(job)
+        return started
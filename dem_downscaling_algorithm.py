@@ -14,6 +14,9 @@ to increase DEM resolution.
 import numpy as np
 from osgeo import gdal
 import os
+import json
+import threading
+import time
 
 try:
     from scipy import ndimage
@@ -27,6 +30,19 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
+try:
+    from .dem_downscaling_profiling import PhaseTimer, TraceRecorder, combine_recorders, format_timings, profile_phase
+    from .dem_downscaling_progress import (
+        IterationStats, PhaseEventRecorder, ProgressWarning, StatusMessage, iteration_fraction, message_callback,
+        progress_emitter
+    )
+except ImportError:
+    from dem_downscaling_profiling import PhaseTimer, TraceRecorder, combine_recorders, format_timings, profile_phase
+    from dem_downscaling_progress import (
+        IterationStats, PhaseEventRecorder, ProgressWarning, StatusMessage, iteration_fraction, message_callback,
+        progress_emitter
+    )
+
 # GPU support with CuPy
 GPU_AVAILABLE = False
 GPU_DEVICE = None
@@ -163,9 +179,147 @@ except Exception as e:
     cp = None
 
 
-def estimate_memory_usage(width, height, zoom_factor):
+# Version of the numerical engine. Bump it whenever a change alters the values
+# produced for the same input and parameters, so cached results are invalidated.
+ENGINE_VERSION = "1.0"
+
+
+ENGINES = ('gpu', 'vectorized', 'loop')
+
+
+def active_engine(engine=None):
+    """
+    Name of the implementation the iterations run on: 'gpu', 'vectorized' or 'loop'
+    
+    engine=None picks the fastest available one. Raises ValueError if the
+    requested engine is not available in this environment.
+    """
+    if engine is None:
+        if GPU_AVAILABLE:
+            return 'gpu'
+        if SCIPY_AVAILABLE:
+            return 'vectorized'
+        return 'loop'
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine} (expected one of {', '.join(ENGINES)})")
+    if engine == 'gpu' and not GPU_AVAILABLE:
+        raise ValueError(f"GPU engine not available: {GPU_ERROR_MSG}")
+    if engine == 'vectorized' and not SCIPY_AVAILABLE:
+        raise ValueError("Vectorized engine not available: SciPy is not installed")
+    return engine
+
+
+class DownscalingCancelled(Exception):
+    """Raised inside a downscaling run when its CancellationToken was cancelled"""
+
+
+class CancellationToken:
+    """
+    Cooperative cancellation and pause/resume for a downscaling run
+    
+    The algorithm calls check() between phases and iterations and periodically
+    inside the pixel loops. check() raises DownscalingCancelled once cancel()
+    was called, and blocks without using CPU while the token is paused.
+    finish() ends the iterations after the current one instead: the run writes
+    the surface reached so far, e.g. once it has effectively converged.
+    The token may be controlled from any thread.
     """
-    Estimate memory usage for DEM processing
+    
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._finish = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+    
+    def cancel(self):
+        """Request cancellation (also wakes up a paused run so it can exit)"""
+        self._cancelled.set()
+        self._running.set()
+    
+    def finish(self):
+        """
+        Stop iterating after the current iteration and keep the result so far
+
+        The request stays set: tiled runs share one token between their tiles,
+        so tiles started afterwards stop after their first iteration. Their
+        results are marked stopped_early; the dialog only offers finish() for
+        whole-DEM runs.
+        """
+        self._finish.set()
+    
+    def pause(self):
+        self._running.clear()
+    
+    def resume(self):
+        self._running.set()
+    
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+    
+    @property
+    def is_paused(self):
+        return not self._running.is_set()
+    
+    @property
+    def finish_requested(self):
+        return self._finish.is_set()
+    
+    def check(self):
+        """Raise DownscalingCancelled if cancelled; block while paused"""
+        if not self._running.is_set():
+            self._running.wait()
+        if self._cancelled.is_set():
+            raise DownscalingCancelled("Processing cancelled")
+
+
+# Bytes per output pixel allocated at the peak of each iteration phase, on top of
+# the input, the nodata masks and dscal. Measured with
+# dem_downscaling_profiling.MemoryProfiler on iteration 2+, when dscal is float64
+# and the previous iteration's usd, uec and u are still referenced;
+# benchmarks/memory_model.py re-measures them and compares with this model.
+MEMORY_MODEL = {
+    # spatial_dependence_vectorized: masked copy, neighbour counts and sums,
+    # safe counts, quotient, vexp and usd (float64) plus boolean masks
+    'vectorized': {
+        'spatial_dependence': 24 + 51,
+        'elevation_constraint': 16 + 8 + 33,
+        'update': 32
+    },
+    # The GPU computes spatial dependence on the device and returns usd as
+    # float32; the elevation constraint runs on the CPU (vectorized)
+    'gpu': {
+        'spatial_dependence': 20 + 6,
+        'elevation_constraint': 16 + 4 + 33,
+        'update': 28
+    },
+    # Pixel loops only allocate their output array
+    'loop': {
+        'spatial_dependence': 24 + 8,
+        'elevation_constraint': 16 + 8 + 8,
+        'update': 32
+    }
+}
+
+# Extra bytes per output pixel when the DEM has nodata (masked block copy in the
+# vectorized elevation constraint, expanded original mask)
+MEMORY_MODEL_NODATA_EXTRA = {'vectorized': 9, 'gpu': 9, 'loop': 0}
+
+# Per-block temporaries (sums, counts, means, differences) of the vectorized
+# elevation constraint, in bytes per input pixel
+MEMORY_MODEL_BLOCK_BYTES = 40
+
+# Device memory of spatial_dependence_gpu: about nine float32 arrays plus masks
+MEMORY_MODEL_GPU_DEVICE = 38
+
+
+def estimate_memory_usage(width, height, zoom_factor, engine=None, dtype='float32', nodata=True):
+    """
+    Estimate peak memory usage for DEM processing
+    
+    Per-engine model of the arrays the iterations allocate (see MEMORY_MODEL);
+    the peak is the largest of the spatial dependence, elevation constraint and
+    update phases. GDAL block caches and other native allocations are not included.
     
     Parameters:
     -----------
@@ -175,30 +329,59 @@ def estimate_memory_usage(width, height, zoom_factor):
         Height of input DEM in pixels
     zoom_factor : int
         Zoom factor for downscaling
+    engine : str or None
+        'gpu', 'vectorized' or 'loop' (default: the engine that would run, see active_engine)
+    dtype : str or numpy.dtype
+        Data type of the input band (see get_raster_info). It only changes the
+        input buffer: the iterations work in float64 whatever the input type,
+        so dscal, usd, uec and the temporaries are the same for every dtype
+    nodata : bool
+        Whether the input has a nodata value (masks are built and kept)
     
     Returns:
     --------
-    dict : Memory estimates in MB
+    dict : Memory estimates in MB - input_mb (input band and mask), output_mb
+        (float64 dscal and its nodata mask), temp_mb (phase temporaries at the
+        peak), total_mb (peak), phases_mb (peak of each phase), peak_phase,
+        gpu_mb (device memory, 0 for CPU engines), engine and output_size
     """
-    # Input DEM (float32 = 4 bytes per pixel)
-    input_mem = (width * height * 4) / (1024 * 1024)
+    if engine is None:
+        engine = active_engine()
+    elif engine not in MEMORY_MODEL:
+        raise ValueError(f"Unknown engine: {engine} (expected one of {', '.join(ENGINES)})")
+    mb = 1024 * 1024
     
-    # Downscaled DEM (zoom_factor^2 larger)
+    input_pixels = width * height
     output_width = width * zoom_factor
     output_height = height * zoom_factor
-    output_mem = (output_width * output_height * 4) / (1024 * 1024)
+    output_pixels = output_width * output_height
+    
+    # Input band and its nodata mask
+    input_mem = input_pixels * (np.dtype(dtype).itemsize + (1 if nodata else 0)) / mb
     
-    # Temporary arrays during processing (usd, uec, u)
-    temp_mem = output_mem * 3
+    # Downscaled DEM (float64 from the first update on) and the expanded nodata mask
+    output_mem = output_pixels * (8 + (1 if nodata else 0)) / mb
     
-    # Total estimated memory
-    total_mem = input_mem + output_mem + temp_mem
+    phases_mb = {}
+    for phase, bytes_per_pixel in MEMORY_MODEL[engine].items():
+        phase_bytes = bytes_per_pixel * output_pixels
+        if phase == 'elevation_constraint' and engine != 'loop':
+            phase_bytes += MEMORY_MODEL_BLOCK_BYTES * input_pixels
+            if nodata:
+                phase_bytes += MEMORY_MODEL_NODATA_EXTRA[engine] * output_pixels
+        phases_mb[phase] = input_mem + output_mem + phase_bytes / mb
+    peak_phase = max(phases_mb, key=phases_mb.get)
+    total_mem = phases_mb[peak_phase]
     
     return {
         'input_mb': input_mem,
         'output_mb': output_mem,
-        'temp_mb': temp_mem,
+        'temp_mb': total_mem - input_mem - output_mem,
         'total_mb': total_mem,
+        'phases_mb': phases_mb,
+        'peak_phase': peak_phase,
+        'gpu_mb': MEMORY_MODEL_GPU_DEVICE * output_pixels / mb if engine == 'gpu' else 0.0,
+        'engine': engine,
         'output_size': (output_width, output_height)
     }
 
@@ -298,8 +481,135 @@ def get_raster_band(fn, band=1, access=gdal.GA_ReadOnly):
     return band_array, nodata_value
 
 
+def get_raster_band_mapped(fn, band=1):
+    """
+    Expose a band as a NumPy view through GDAL virtual memory instead of copying it
+    
+    Tries a zero-copy mapping of the file first (uncompressed GeoTIFF and raw formats
+    such as BIL/ENVI), then a paged virtual memory mapping that decodes blocks on
+    demand, and finally falls back to a regular ReadAsArray copy.
+    
+    Parameters:
+    -----------
+    fn : str
+        Path to the raster file
+    band : int
+        Band number (1-based)
+    
+    Returns:
+    --------
+    tuple : (band_array, nodata_value, ds) - ds backs the mapping and must be kept
+        referenced for as long as band_array is used
+    """
+    ds = open_raster(fn)
+    raster_band = ds.GetRasterBand(band)
+    nodata_value = raster_band.GetNoDataValue()
+    band_array = None
+    
+    try:
+        band_array = raster_band.GetVirtualMemAutoArray(gdal.GF_Read)
+    except Exception:
+        band_array = None
+    
+    if band_array is None:
+        try:
+            band_array = ds.GetVirtualMemArray(gdal.GF_Read, band_list=[band])
+            if band_array is not None and band_array.ndim == 3:
+                band_array = band_array[0]
+        except Exception:
+            band_array = None
+    
+    if band_array is None:
+        band_array = raster_band.ReadAsArray()
+    
+    return band_array, nodata_value, ds
+
+
+def _has_mask_band(raster_band):
+    """True when the band carries an explicit (per-dataset or alpha) validity mask"""
+    flags = raster_band.GetMaskFlags()
+    return bool(flags & (gdal.GMF_PER_DATASET | gdal.GMF_ALPHA)) and not flags & gdal.GMF_ALL_VALID
+
+
+def block_is_empty(raster_band, xoff, yoff, xsize, ysize):
+    """
+    Check whether a window holds no valid data without decoding it
+    
+    Uses GDAL data coverage information (unwritten blocks of sparse files) and,
+    when present, the band's mask band. Only bands with a nodata value are
+    considered, since empty blocks have to be filled with it.
+    """
+    if raster_band.GetNoDataValue() is None:
+        return False
+    
+    try:
+        flags, _ = raster_band.GetDataCoverageStatus(xoff, yoff, xsize, ysize)
+        if flags == gdal.GDAL_DATA_COVERAGE_STATUS_EMPTY:
+            return True
+    except Exception:
+        # Coverage status needs GDAL >= 2.2
+        pass
+    
+    if _has_mask_band(raster_band):
+        mask = raster_band.GetMaskBand().ReadAsArray(xoff, yoff, xsize, ysize)
+        return not mask.any()
+    
+    return False
+
+
+def get_raster_band_sparse(fn, band=1):
+    """
+    Read a band block by block, skipping blocks that hold no valid data
+    
+    Empty blocks (see block_is_empty) are never decoded: they are filled with the
+    nodata value and marked in the mask directly. For the other blocks the nodata
+    mask is built block by block and combined with the band's mask band if any.
+    
+    Returns:
+    --------
+    tuple : (band_array, nodata_value, nodata_mask, empty_blocks) - without a nodata
+        value this falls back to a plain read with nodata_mask None
+    """
+    ds = open_raster(fn)
+    raster_band = ds.GetRasterBand(band)
+    nodata_value = raster_band.GetNoDataValue()
+    if nodata_value is None:
+        band_array = raster_band.ReadAsArray()
+        ds = None
+        return band_array, nodata_value, None, 0
+    
+    from osgeo import gdal_array
+    width, height = ds.RasterXSize, ds.RasterYSize
+    block_x, block_y = raster_band.GetBlockSize()
+    # Whole-row strips are read in chunks of rows to keep the number of calls small
+    block_y = max(block_y, 256) if block_x == width else block_y
+    dtype = gdal_array.GDALTypeCodeToNumericTypeCode(raster_band.DataType)
+    band_array = np.full((height, width), nodata_value, dtype=dtype)
+    nodata_mask = np.ones((height, width), dtype=bool)
+    has_mask_band = _has_mask_band(raster_band)
+    empty_blocks = 0
+    
+    for yoff in range(0, height, block_y):
+        ysize = min(block_y, height - yoff)
+        for xoff in range(0, width, block_x):
+            xsize = min(block_x, width - xoff)
+            if block_is_empty(raster_band, xoff, yoff, xsize, ysize):
+                empty_blocks += 1
+                continue
+            block = raster_band.ReadAsArray(xoff, yoff, xsize, ysize)
+            block_mask = build_nodata_mask(block, nodata_value)
+            if has_mask_band:
+                block_mask |= raster_band.GetMaskBand().ReadAsArray(xoff, yoff, xsize, ysize) == 0
+            band_array[yoff:yoff + ysize, xoff:xoff + xsize] = block
+            nodata_mask[yoff:yoff + ysize, xoff:xoff + xsize] = block_mask
+    
+    ds = None
+    return band_array, nodata_value, nodata_mask, empty_blocks
+
+
 def get_raster_info(fn):
     """Get raster information including nodata value"""
+    from osgeo import gdal_array
     ds = open_raster(fn)
     raster_band = ds.GetRasterBand(1)
     info = {
@@ -307,6 +617,7 @@ def get_raster_info(fn):
         'height': ds.RasterYSize,
         'bands': ds.RasterCount,
         'data_type': raster_band.DataType,
+        'dtype': np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(raster_band.DataType)).name,
         'nodata_value': raster_band.GetNoDataValue(),
         'file_size_mb': os.path.getsize(fn) / (1024 * 1024)
     }
@@ -330,6 +641,37 @@ def get_projection(fn, access=gdal.GA_ReadOnly):
     return proj
 
 
+def build_nodata_mask(data, nodata_value):
+    """Return boolean mask of nodata (and NaN) pixels, or None when the raster has no nodata value"""
+    if nodata_value is None:
+        return None
+    return (data == nodata_value) | np.isnan(data)
+
+
+def downscaled_geo_transform(geot, zoom_factor):
+    """Return the GeoTransform of a raster downscaled by zoom_factor"""
+    return [
+        geot[0],
+        geot[1] / zoom_factor,
+        geot[2],
+        geot[3],
+        geot[4],
+        geot[5] / zoom_factor
+    ]
+
+
+def window_geo_transform(geot, xoff, yoff):
+    """Return the GeoTransform of a window starting at pixel (xoff, yoff) of a raster with GeoTransform geot"""
+    return [
+        geot[0] + xoff * geot[1] + yoff * geot[2],
+        geot[1],
+        geot[2],
+        geot[3] + xoff * geot[4] + yoff * geot[5],
+        geot[4],
+        geot[5]
+    ]
+
+
 def initialize(data, zoom, nodata_mask=None, progress_callback=None):
     """
     Initialize downscaling data
@@ -350,7 +692,7 @@ def initialize(data, zoom, nodata_mask=None, progress_callback=None):
     return band, None
 
 
-def spatial_dependence(dtin, nodata_mask=None, progress_callback=None, use_vectorized=True, use_gpu=None):
+def spatial_dependence(dtin, nodata_mask=None, progress_callback=None, use_vectorized=True, use_gpu=None, cancel_token=None):
     """
     Calculate spatial dependence maximization function value
     With progress callback to update progress
@@ -365,6 +707,8 @@ def spatial_dependence(dtin, nodata_mask=None, progress_callback=None, use_vecto
         If True, try to use GPU (requires CuPy and CUDA GPU)
         If False, use CPU only
         If None, auto-detect (use GPU if available)
+    cancel_token : CancellationToken or None
+        Checked once per row in the pixel-by-pixel loop
     """
     # Auto-detect GPU if not specified
     if use_gpu is None:
@@ -404,6 +748,8 @@ def spatial_dependence(dtin, nodata_mask=None, progress_callback=None, use_vecto
     processed = 0
 
     for i in range(0, width):
+        if cancel_token is not None:
+            cancel_token.check()
         for j in range(0, height):
             # Skip nodata pixels
             if nodata_mask is not None and nodata_mask[i, j]:
@@ -591,7 +937,7 @@ def spatial_dependence_gpu(dtin, nodata_mask=None, progress_callback=None):
     return usd
 
 
-def elevation_constraint(dtin, goc, rsme, nodata_mask_orig=None, nodata_mask_down=None, progress_callback=None, use_vectorized=True, use_gpu=None):
+def elevation_constraint(dtin, goc, rsme, nodata_mask_orig=None, nodata_mask_down=None, progress_callback=None, use_vectorized=True, use_gpu=None, cancel_token=None):
     """
     Elevation constraint function
     With progress callback to update progress
@@ -606,6 +952,8 @@ def elevation_constraint(dtin, goc, rsme, nodata_mask_orig=None, nodata_mask_dow
         If True, try to use GPU (requires CuPy and CUDA GPU)
         If False, use CPU only
         If None, auto-detect (use GPU if available)
+    cancel_token : CancellationToken or None
+        Checked once per row of original pixels in the pixel-by-pixel loop
     """
     # Auto-detect GPU if not specified
     if use_gpu is None:
@@ -661,6 +1009,8 @@ def elevation_constraint(dtin, goc, rsme, nodata_mask_orig=None, nodata_mask_dow
     processed = 0
     
     for i in range(0, goc_w):
+        if cancel_token is not None:
+            cancel_token.check()
         for j in range(0, goc_h):
             # Skip if original pixel is nodata
             if nodata_mask_orig is not None and nodata_mask_orig[i, j]:
@@ -795,41 +1145,309 @@ def elevation_constraint_vectorized(dtin, goc, rsme, nodata_mask_orig=None, noda
     return uec
 
 
-def create_raster(fn, data, geot, proj, nodata_value=None, driver_fmt="GTiff", progress_callback=None):
-    """Write result to raster file with nodata value preserved"""
+def create_raster(fn, data, geot, proj, nodata_value=None, driver_fmt="GTiff", progress_callback=None, creation_options=None, sparse=False):
+    """
+    Write result to raster file with nodata value preserved
+    
+    The output is always written with WriteArray: a newly created GeoTIFF has
+    no strips allocated yet, so whether writes through a GDAL virtual memory
+    mapping reach the file depends on the GDAL build.
+    
+    With sparse=True a tiled GeoTIFF is created with SPARSE_OK and blocks holding
+    only nodata are not written at all; GDAL reads them back as nodata.
+    """
+    if sparse:
+        creation_options = list(creation_options or []) + ['TILED=YES', 'SPARSE_OK=TRUE']
+    
     if progress_callback:
         progress_callback("Writing output file...", 90)
     
     driver = gdal.GetDriverByName(driver_fmt)
     if driver is None:
         raise Exception(f"Driver {driver_fmt} not available")
+    
+    # Replace rather than overwrite an existing file in place, which would also
+    # change other hard links to it (e.g. a result cache entry)
+    if os.path.isfile(fn):
+        os.remove(fn)
         
     outds = driver.Create(
         fn,
         xsize=data.shape[1],
         ysize=data.shape[0],
         bands=1,
-        eType=gdal.GDT_Float32
+        eType=gdal.GDT_Float32,
+        options=creation_options or []
     )
     outds.SetGeoTransform(geot)
     outds.SetProjection(proj)
     
-    # Write data
-    outds.GetRasterBand(1).WriteArray(data)
-    
     # Set nodata value (use original if provided, otherwise use -9999 as default)
     if nodata_value is not None:
         outds.GetRasterBand(1).SetNoDataValue(nodata_value)
     else:
         outds.GetRasterBand(1).SetNoDataValue(-9999)
     
+    if sparse and nodata_value is not None:
+        out_band = outds.GetRasterBand(1)
+        block_x, block_y = out_band.GetBlockSize()
+        for yoff in range(0, data.shape[0], block_y):
+            for xoff in range(0, data.shape[1], block_x):
+                block = data[yoff:yoff + block_y, xoff:xoff + block_x]
+                if build_nodata_mask(block, nodata_value).all():
+                    continue
+                out_band.WriteArray(block, xoff, yoff)
+    else:
+        outds.GetRasterBand(1).WriteArray(data)
+    
     outds = None
     
     if progress_callback:
         progress_callback("Completed!", 100)
 
 
-def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, progress_callback=None, max_iterations=1000):
+def default_checkpoint_file(output_file):
+    """Checkpoint file used for an output when none is given explicitly"""
+    return output_file + ".checkpoint.npz"
+
+
+def default_trace_file(output_file):
+    """Trace file written next to an output by downscale_dem(..., trace=True)"""
+    return output_file + ".trace.json"
+
+
+def checkpoint_metadata(input_file, zoom_factor, rsme, nodata_value):
+    """Inputs and parameters a checkpoint is only valid for"""
+    st = os.stat(input_file)
+    return {
+        'input_file': os.path.abspath(input_file),
+        'input_size': st.st_size,
+        'input_mtime_ns': st.st_mtime_ns,
+        'zoom_factor': int(zoom_factor),
+        'rsme': float(rsme),
+        'nodata_value': None if nodata_value is None else float(nodata_value)
+    }
+
+
+def save_checkpoint(fn, dscal, iteration, energy_old, energy_history, meta):
+    """Write the state of a run to an .npz file (atomically, so a crash never leaves a broken checkpoint)"""
+    tmp_fn = fn + ".tmp.npz"
+    np.savez(
+        tmp_fn,
+        dscal=dscal,
+        iteration=iteration,
+        energy_old=energy_old,
+        energy_history=np.asarray(energy_history, dtype=np.float64),
+        meta=json.dumps(meta)
+    )
+    os.replace(tmp_fn, fn)
+
+
+def load_checkpoint(fn, expected_meta=None):
+    """
+    Read a checkpoint written by save_checkpoint
+    
+    Raises ValueError if expected_meta is given and the checkpoint was written for
+    a different input file (path, size, modification time) or different parameters.
+    
+    Returns:
+    --------
+    dict : dscal, iteration, energy_old, energy_history, meta
+    """
+    with np.load(fn) as data:
+        meta = json.loads(str(data['meta']))
+        if expected_meta is not None and meta != expected_meta:
+            mismatched = sorted(k for k in set(meta) | set(expected_meta) if meta.get(k) != expected_meta.get(k))
+            raise ValueError(
+                f"Checkpoint {fn} does not match this run (different: {', '.join(mismatched)}). "
+                f"Delete it or start without resume."
+            )
+        return {
+            'dscal': data['dscal'],
+            'iteration': int(data['iteration']),
+            'energy_old': float(data['energy_old']),
+            'energy_history': data['energy_history'].tolist(),
+            'meta': meta
+        }
+
+
+def downscale_array(goc, zoom_factor, rsme, nodata_value=None, nodata_mask_orig=None, threshold=0.001, progress_callback=None, max_iterations=1000, cancel_token=None,
+                    initial_dscal=None, start_iteration=0, initial_energy=None, energy_history=None,
+                    checkpoint_callback=None, checkpoint_interval=0, nodata_mask_down=None, engine=None, profiler=None,
+                    timer=None, tracer=None, progress_range=(10, 90)):
+    """
+    Run the downscaling iterations on a DEM held in memory
+    
+    Parameters:
+    -----------
+    goc : numpy.ndarray
+        Original DEM array
+    zoom_factor : int
+        Resolution increase factor
+    rsme : float
+        RSME parameter for elevation constraint
+    nodata_value : float or None
+        Nodata value written into nodata sub-pixels
+    nodata_mask_orig : numpy.ndarray or None
+        Boolean nodata mask of goc (see build_nodata_mask)
+    threshold, progress_callback, max_iterations, cancel_token :
+        As for downscale_dem
+    initial_dscal : numpy.ndarray or None
+        Start from this downscaled surface (warm start) instead of the blocky
+        surface produced by initialize
+    start_iteration, initial_energy, energy_history :
+        Iteration counter, previous energy and energy history to continue from
+    checkpoint_callback : callable or None
+        Called as checkpoint_callback(dscal, iteration, energy, energy_history)
+        every checkpoint_interval iterations
+    nodata_mask_down : numpy.ndarray or None
+        Precomputed nodata mask of the downscaled grid (nodata_mask_orig expanded
+        by zoom_factor), e.g. shared between runs on the same input
+    engine : str or None
+        Force 'gpu', 'vectorized' or 'loop' (default: fastest available, see active_engine)
+    profiler : dem_downscaling_profiling.MemoryProfiler or None
+        Record peak memory of initialize and of every iteration step
+    timer : dem_downscaling_profiling.PhaseTimer or None
+        Accumulate the time of initialize, of every iteration and of its steps
+        (spatial_dependence, elevation_constraint, energy, update,
+        nodata_restore, checkpoint)
+    tracer : dem_downscaling_profiling.TraceRecorder or None
+        Record the same phases as spans on the calling thread
+    progress_range : tuple
+        Percentages the iterations are reported between; the percentage of an
+        IterationStats event grows with the iterations used and with how close
+        the energy change is to the threshold (see iteration_fraction)
+    
+    Returns:
+    --------
+    tuple : (dscal, info) - downscaled array and dict with iterations, final_energy,
+        converged, stopped_early (CancellationToken.finish() ended the
+        iterations) and energy_history
+    """
+    engine = active_engine(engine)
+    use_gpu = engine == 'gpu'
+    use_vectorized = engine != 'loop'
+    emit = progress_emitter(progress_callback)
+    # Steps report plain strings; their hard-coded percentages say nothing about the whole run
+    step_callback = message_callback(emit, keep_percentage=True)
+    recorder = combine_recorders(profiler, timer, tracer, PhaseEventRecorder(emit) if emit else None)
+    pixels = int(goc.size) * zoom_factor * zoom_factor
+    
+    # Initialize downscaling data (with nodata mask)
+    if initial_dscal is None:
+        with profile_phase(recorder, 'initialize', engine=engine, pixels=pixels):
+            dscal, expanded_mask = initialize(goc, zoom_factor, nodata_mask_orig, step_callback)
+    else:
+        expected_shape = (goc.shape[0] * zoom_factor, goc.shape[1] * zoom_factor)
+        if initial_dscal.shape != expected_shape:
+            raise ValueError(
+                f"Initial surface has shape {initial_dscal.shape}, expected {expected_shape}"
+            )
+        dscal = np.array(initial_dscal, dtype=np.float64)
+        expanded_mask = None
+    if nodata_mask_down is None:
+        if expanded_mask is None and nodata_mask_orig is not None:
+            expanded_mask = np.repeat(np.repeat(nodata_mask_orig, zoom_factor, axis=0), zoom_factor, axis=1)
+        nodata_mask_down = expanded_mask
+    
+    # Set nodata values in downscaled DEM
+    if nodata_mask_down is not None and nodata_value is not None:
+        dscal[nodata_mask_down] = nodata_value
+    
+    # Vòng lặp tối ưu hóa
+    Energy_old = 100000000000.0 if initial_energy is None else initial_energy
+    Energy_dif = 100000000.0
+    Energy_new = initial_energy
+    iteration = start_iteration
+    energy_history = list(energy_history) if energy_history is not None else []
+    # First energy change between two computed energies, the reference for the convergence progress
+    reference_delta = None
+    progress_start, progress_end = progress_range
+    fraction_done = 0.0
+    stopped_early = False
+    
+    while abs(Energy_dif) > threshold and iteration < max_iterations:
+        if cancel_token is not None:
+            cancel_token.check()
+            if cancel_token.finish_requested and iteration > start_iteration:
+                stopped_early = True
+                if emit:
+                    emit(StatusMessage(f"Stopped after iteration {iteration} on request", progress_end))
+                break
+        iteration += 1
+        iteration_start = time.perf_counter()
+        
+        with profile_phase(recorder, 'iteration', iteration=iteration):
+            if step_callback:
+                step_callback(f"Iteration {iteration}: Calculating spatial dependence...")
+            
+            with profile_phase(recorder, 'spatial_dependence'):
+                usd = spatial_dependence(dscal, nodata_mask_down, step_callback, use_vectorized=use_vectorized, use_gpu=use_gpu, cancel_token=cancel_token)
+            
+            if cancel_token is not None:
+                cancel_token.check()
+            
+            if step_callback:
+                step_callback(f"Iteration {iteration}: Applying elevation constraints...")
+            
+            with profile_phase(recorder, 'elevation_constraint'):
+                uec = elevation_constraint(dscal, goc, rsme, nodata_mask_orig, nodata_mask_down, step_callback, use_vectorized=use_vectorized, use_gpu=use_gpu, cancel_token=cancel_token)
+            
+            with profile_phase(recorder, 'energy'):
+                Energy_new = abs(usd).sum() + abs(uec).sum()
+            
+            with profile_phase(recorder, 'update'):
+                u = usd + uec
+                dscal = dscal + u
+            
+            # Preserve nodata values after each iteration
+            with profile_phase(recorder, 'nodata_restore'):
+                if nodata_mask_down is not None and nodata_value is not None:
+                    dscal[nodata_mask_down] = nodata_value
+            
+            Energy_dif = Energy_old - Energy_new
+            if reference_delta is None and (len(energy_history) > 0 or initial_energy is not None):
+                reference_delta = abs(Energy_dif)
+            Energy_old = Energy_new
+            energy_history.append(float(Energy_new))
+            
+            if checkpoint_callback is not None and checkpoint_interval and iteration % checkpoint_interval == 0:
+                with profile_phase(recorder, 'checkpoint'):
+                    checkpoint_callback(dscal, iteration, Energy_old, energy_history)
+        
+        if emit:
+            fraction_done = max(fraction_done, iteration_fraction(
+                iteration, max_iterations, Energy_dif, reference_delta, threshold
+            ))
+            emit(IterationStats(
+                iteration, max_iterations, float(Energy_new), float(Energy_dif),
+                time.perf_counter() - iteration_start, threshold=threshold, pixels=pixels,
+                percentage=progress_start + (progress_end - progress_start) * fraction_done
+            ))
+    
+    if iteration >= max_iterations and not stopped_early:
+        warning = f"Reached maximum iterations ({max_iterations}). Algorithm may not have converged."
+        if tracer is not None:
+            tracer.instant('warning', message=warning)
+        if emit:
+            emit(ProgressWarning(warning, progress_end))
+    
+    # Ensure nodata values are preserved in final output
+    if nodata_mask_down is not None and nodata_value is not None:
+        dscal[nodata_mask_down] = nodata_value
+    
+    return dscal, {
+        'iterations': iteration,
+        'final_energy': Energy_new,
+        'converged': abs(Energy_dif) <= threshold,
+        'stopped_early': stopped_early,
+        'energy_history': energy_history
+    }
+
+
+def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, progress_callback=None, max_iterations=1000, io_mode='copy', staging_cache=None, skip_empty_blocks=False, cancel_token=None,
+                  checkpoint_file=None, checkpoint_interval=25, resume=False, continue_from=None, result_cache=None, engine=None,
+                  profiler=None, timing_per_iteration=False, trace=False):
     """
     Main function to downscale DEM with detailed progress reporting
     
@@ -845,15 +1463,94 @@ def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, p
         RSME parameter for elevation constraint
     threshold : float
         Loop stopping threshold (default: 0.001)
-    progress_callback : callable
-        Callback function to update progress (receives message, percentage)
+    progress_callback : callable or dem_downscaling_progress.ProgressListener
+        Callback function to update progress (receives message, percentage), or
+        a ProgressListener receiving typed events (phases, IterationStats,
+        warnings; see dem_downscaling_progress)
     max_iterations : int
         Maximum number of iterations to prevent infinite loops
+    io_mode : str
+        'copy' reads and writes rasters through ReadAsArray/WriteArray.
+        'mmap' maps the input band through GDAL virtual memory, saving a
+        full-size copy of the input (see get_raster_band_mapped); the output is
+        written with WriteArray in both modes
+    staging_cache : dem_cache.StagingCache or None
+        If given, the input is read from its staged float32 copy and the nodata
+        mask precomputed at staging time is reused
+    skip_empty_blocks : bool
+        Read the input block by block, never decoding blocks that GDAL reports as
+        empty, and write the output as a sparse GeoTIFF (see get_raster_band_sparse)
+    cancel_token : CancellationToken or None
+        Checked between phases and iterations; cancelling it makes downscale_dem
+        raise DownscalingCancelled, pausing it suspends the run, finish() ends
+        the iterations early and writes the surface reached so far
+    checkpoint_file : str or None
+        Write the state of the run (dscal, iteration counter, energy history) to
+        this .npz file every checkpoint_interval iterations. Removed when the run
+        completes. See default_checkpoint_file
+    resume : bool
+        Continue from checkpoint_file if it exists. The checkpoint must have been
+        written for the same input file and zoom/rsme; threshold and
+        max_iterations may differ
+    continue_from : str or None
+        Start iterating from an existing downscaled output of the same input
+        instead of the blocky initial surface, e.g. to refine it with a tighter threshold
+    result_cache : dem_cache.ResultCache or None
+        If given and an earlier run with the same input content and parameters is
+        cached, its output is linked or copied to output_file instead of being
+        recomputed; otherwise the new output is added to the cache. Not used with
+        resume or continue_from, whose results depend on the starting state
+    engine : str or None
+        Force 'gpu', 'vectorized' or 'loop' (default: fastest available)
+    profiler : dem_downscaling_profiling.MemoryProfiler or None
+        Started profiler recording the peak memory of every phase (read,
+        initialize, spatial_dependence, elevation_constraint, update, write);
+        its summary is returned as 'memory_profile'. Tracing allocations slows
+        the run down noticeably
+    timing_per_iteration : bool
+        Also return the time of every step of every iteration in
+        result['timings']['iterations']
+    trace : bool
+        Record every phase and iteration as a span and write them as a Chrome
+        trace-event file next to the output (see default_trace_file), for
+        chrome://tracing, Perfetto or speedscope
     
     Returns:
     --------
-    dict : Result information (iterations, final_energy, output_file, memory_info)
+    dict : Result information (iterations, final_energy, output_file, memory_info,
+        cached - True if the output was taken from result_cache, timings - time
+        per phase, see dem_downscaling_profiling.PhaseTimer, memory_profile with
+        a profiler, trace_file with trace)
     """
+    if io_mode not in ('copy', 'mmap'):
+        raise ValueError(f"Unknown io_mode: {io_mode} (expected 'copy' or 'mmap')")
+    
+    # Plain-string reports below become StatusMessage events; iterations report typed events
+    emit = progress_emitter(progress_callback)
+    progress_callback = message_callback(emit)
+    timer = PhaseTimer(per_iteration=timing_per_iteration)
+    tracer = TraceRecorder(process_name=f"downscale {os.path.basename(input_file)}") if trace else None
+    recorder = combine_recorders(profiler, timer, tracer, PhaseEventRecorder(emit) if emit else None)
+    
+    if resume or continue_from is not None:
+        result_cache = None
+    cache_key = None
+    if result_cache is not None:
+        cache_key = result_cache.key_for(
+            input_file, engine=active_engine(engine),
+            zoom_factor=zoom_factor, rsme=rsme, threshold=threshold, max_iterations=max_iterations
+        )
+        with profile_phase(recorder, 'cache_fetch'):
+            cached_result = result_cache.fetch(cache_key, output_file)
+        if cached_result is not None:
+            # Timings of this call, not of the run that produced the cached output
+            cached_result['timings'] = timer.as_dict()
+            if tracer is not None:
+                cached_result['trace_file'] = tracer.write(default_trace_file(output_file))
+            if progress_callback:
+                progress_callback(f"Reused cached result ({cached_result['iterations']} iterations)", 100)
+            return cached_result
+    
     # Get raster info and estimate memory
     if progress_callback:
         device_info = ""
@@ -891,7 +1588,10 @@ def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, p
     mem_estimate = estimate_memory_usage(
         raster_info['width'], 
         raster_info['height'], 
-        zoom_factor
+        zoom_factor,
+        engine=active_engine(engine),
+        dtype=raster_info['dtype'],
+        nodata=raster_info['nodata_value'] is not None
     )
     
     # Check available memory
@@ -901,6 +1601,13 @@ def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, p
         available_memory_mb = 4096  # Default assumption of 4GB if psutil not available
     
     if mem_estimate['total_mb'] > available_memory_mb * 0.8:
+        runtime_est = estimate_runtime(
+            raster_info['width'],
+            raster_info['height'],
+            zoom_factor,
+            use_gpu=GPU_AVAILABLE,
+            use_vectorized=SCIPY_AVAILABLE
+        )
         warning_msg = (
             f"Warning: Estimated memory usage ({mem_estimate['total_mb']:.1f} MB) "
             f"may exceed available memory ({available_memory_mb:.1f} MB).\n"
@@ -910,104 +1617,130 @@ def downscale_dem(input_file, output_file, zoom_factor, rsme, threshold=0.001, p
             f"Estimated runtime: {runtime_est['formatted_time']}"
         )
         # Return warning but continue (user can cancel if needed)
-        if progress_callback:
-            progress_callback(warning_msg, 0)
+        if emit:
+            emit(ProgressWarning(warning_msg, 0))
     
     # Read original DEM data and nodata value
-    if progress_callback:
-        progress_callback("Loading DEM data into memory...", 2)
-    goc, nodata_value = get_raster_band(input_file)
+    if cancel_token is not None:
+        cancel_token.check()
     
-    # Create nodata mask for original DEM
-    if nodata_value is not None:
-        nodata_mask_orig = (goc == nodata_value) | np.isnan(goc)
+    if staging_cache is not None:
+        with profile_phase(recorder, 'stage'):
+            source_file, staged_mask = staging_cache.stage(input_file, progress_callback=progress_callback)
     else:
-        nodata_mask_orig = None
+        source_file, staged_mask = input_file, None
+    
+    if progress_callback:
+        progress_callback("Loading DEM data into memory...", 2)
+    with profile_phase(recorder, 'read'):
+        sparse_mask = None
+        if io_mode == 'mmap':
+            # input_ds keeps the mapping alive until downscale_dem returns
+            goc, nodata_value, input_ds = get_raster_band_mapped(source_file)
+        elif skip_empty_blocks:
+            goc, nodata_value, sparse_mask, empty_blocks = get_raster_band_sparse(source_file)
+            if progress_callback and empty_blocks:
+                progress_callback(f"Skipped {empty_blocks} empty input blocks", 2)
+        else:
+            goc, nodata_value = get_raster_band(source_file)
+    
+    # Create nodata mask for original DEM (staged and sparse reads come with a precomputed mask)
+    with profile_phase(recorder, 'mask'):
+        if staging_cache is not None:
+            nodata_mask_orig = staged_mask
+        elif sparse_mask is not None:
+            nodata_mask_orig = sparse_mask
+        else:
+            nodata_mask_orig = build_nodata_mask(goc, nodata_value)
     
     # Get geo transform and projection information
     geotgoc = get_geo_transform(input_file)
     projgoc = get_projection(input_file)
     
     # Calculate new geo transform for downscaled DEM
-    geotnew = [
-        geotgoc[0],
-        geotgoc[1] / zoom_factor,
-        geotgoc[2],
-        geotgoc[3],
-        geotgoc[4],
-        geotgoc[5] / zoom_factor
-    ]
-    
-    # Initialize downscaling data (with nodata mask)
-    dscal, nodata_mask_down = initialize(goc, zoom_factor, nodata_mask_orig, progress_callback)
-    
-    # Set nodata values in downscaled DEM
-    if nodata_mask_down is not None and nodata_value is not None:
-        dscal[nodata_mask_down] = nodata_value
-    
-    # Vòng lặp tối ưu hóa
-    Energy_old = 100000000000.0
-    Energy_dif = 100000000.0
-    iteration = 0
-    
-    while abs(Energy_dif) > threshold and iteration < max_iterations:
-        iteration += 1
-        
-        if progress_callback:
-            progress_callback(
-                f"Iteration {iteration}: Calculating spatial dependence...",
-                70 + int((iteration / max_iterations) * 10)  # 70-80% range
-            )
-        
-        # Auto-detect GPU availability
-        use_gpu = GPU_AVAILABLE
-        usd = spatial_dependence(dscal, nodata_mask_down, progress_callback, use_vectorized=True, use_gpu=use_gpu)
-        
+    geotnew = downscaled_geo_transform(geotgoc, zoom_factor)
+    
+    # Starting state: fresh, resumed from a checkpoint or continued from an earlier output
+    start_state = {}
+    if checkpoint_file is not None:
+        run_meta = checkpoint_metadata(input_file, zoom_factor, rsme, nodata_value)
+        if resume and os.path.exists(checkpoint_file):
+            checkpoint = load_checkpoint(checkpoint_file, expected_meta=run_meta)
+            start_state = {
+                'initial_dscal': checkpoint['dscal'],
+                'start_iteration': checkpoint['iteration'],
+                'initial_energy': checkpoint['energy_old'],
+                'energy_history': checkpoint['energy_history']
+            }
+            if progress_callback:
+                progress_callback(f"Resuming from checkpoint at iteration {checkpoint['iteration']}", 5)
+    if continue_from is not None and not start_state:
+        previous, _ = get_raster_band(continue_from)
+        start_state = {'initial_dscal': previous}
         if progress_callback:
-            progress_callback(
-                f"Iteration {iteration}: Applying elevation constraints...",
-                80
-            )
-        
-        uec = elevation_constraint(dscal, goc, rsme, nodata_mask_orig, nodata_mask_down, progress_callback, use_vectorized=True, use_gpu=use_gpu)
-        
-        u = usd + uec
-        Energy_new = abs(usd).sum() + abs(uec).sum()
-        dscal = dscal + u
-        
-        # Preserve nodata values after each iteration
-        if nodata_mask_down is not None and nodata_value is not None:
-            dscal[nodata_mask_down] = nodata_value
-        
-        Energy_dif = Energy_old - Energy_new
-        Energy_old = Energy_new
-        
-        if progress_callback:
-            progress_callback(
-                f"Iteration {iteration}/{max_iterations}: Energy = {Energy_new:.6f}, "
-                f"Change = {Energy_dif:.6f}",
-                85
-            )
+            progress_callback(f"Continuing from existing output {os.path.basename(continue_from)}", 5)
     
-    if iteration >= max_iterations:
-        warning = f"Reached maximum iterations ({max_iterations}). Algorithm may not have converged."
+    def write_checkpoint(dscal, iteration, energy, energy_history):
+        save_checkpoint(checkpoint_file, dscal, iteration, energy, energy_history, run_meta)
         if progress_callback:
-            progress_callback(warning, 85)
+            progress_callback(f"Checkpoint saved at iteration {iteration}", None)
+    
+    dscal, run_info = downscale_array(
+        goc, zoom_factor, rsme,
+        nodata_value=nodata_value,
+        nodata_mask_orig=nodata_mask_orig,
+        threshold=threshold,
+        progress_callback=emit,
+        max_iterations=max_iterations,
+        cancel_token=cancel_token,
+        checkpoint_callback=write_checkpoint if checkpoint_file is not None else None,
+        checkpoint_interval=checkpoint_interval,
+        engine=engine,
+        profiler=profiler,
+        timer=timer,
+        tracer=tracer,
+        **start_state
+    )
     
-    # Ensure nodata values are preserved in final output
-    if nodata_mask_down is not None and nodata_value is not None:
-        dscal[nodata_mask_down] = nodata_value
+    if cancel_token is not None:
+        cancel_token.check()
     
     # Write result to file with nodata value preserved
-    create_raster(output_file, dscal, geotnew, projgoc, nodata_value, progress_callback=progress_callback)
+    with profile_phase(recorder, 'write'):
+        create_raster(output_file, dscal, geotnew, projgoc, nodata_value, progress_callback=progress_callback, sparse=skip_empty_blocks)
     
-    return {
-        'iterations': iteration,
-        'final_energy': Energy_new,
+    # The run is complete, its checkpoint is no longer needed
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        os.remove(checkpoint_file)
+    
+    result = {
+        'iterations': run_info['iterations'],
+        'final_energy': run_info['final_energy'],
         'output_file': output_file,
         'memory_estimate_mb': mem_estimate['total_mb'],
         'input_size': (raster_info['width'], raster_info['height']),
         'output_size': mem_estimate['output_size'],
-        'converged': abs(Energy_dif) <= threshold,
-        'nodata_preserved': nodata_value is not None
+        'converged': run_info['converged'],
+        'stopped_early': run_info['stopped_early'],
+        'nodata_preserved': nodata_value is not None,
+        'energy_history': run_info['energy_history'],
+        'cached': False,
+        'timings': timer.as_dict()
     }
+    if progress_callback:
+        progress_callback(f"Time per phase: {format_timings(result['timings'])}", 100)
+    if profiler is not None:
+        result['memory_profile'] = profiler.as_dict()
+    # A run stopped early is not the result of its parameters
+    if result_cache is not None and not run_info['stopped_early']:
+        result_cache.store(cache_key, output_file, result)
+    if tracer is not None:
+        tracer.metadata.update({
+            'input_file': input_file,
+            'engine': active_engine(engine),
+            'zoom_factor': zoom_factor,
+            'input_size': result['input_size'],
+            'iterations': result['iterations']
+        })
+        result['trace_file'] = tracer.write(default_trace_file(output_file))
+    return result
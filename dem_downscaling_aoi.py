@@ -0,0 +1,344 @@
+"""
+Area-of-interest processing
+
+downscale_dem_aoi downscales only the parts of a DEM inside an extent or inside
+polygons (e.g. corridors or project areas). Each part is read as a window plus
+a convergence margin, downscaled with the tiled engine and written into an
+output covering the AOI only, with pixels outside the polygons set to nodata.
+Parts whose windows are disjoint are processed in parallel; parts closer than
+two margins are merged and processed together.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+try:
+    from .dem_downscaling_algorithm import (
+        open_raster, get_raster_info, downscaled_geo_transform, window_geo_transform
+    )
+    from .dem_downscaling_pipeline import (
+        extent_to_window, read_window, downscale_array_tiled, DEFAULT_CREATION_OPTIONS, _default_workers
+    )
+    from .dem_downscaling_progress import TileDone, message_callback, progress_emitter
+except ImportError:
+    from dem_downscaling_algorithm import (
+        open_raster, get_raster_info, downscaled_geo_transform, window_geo_transform
+    )
+    from dem_downscaling_pipeline import (
+        extent_to_window, read_window, downscale_array_tiled, DEFAULT_CREATION_OPTIONS, _default_workers
+    )
+    from dem_downscaling_progress import TileDone, message_callback, progress_emitter
+
+
+def load_aoi_geometries(aoi_file, target_wkt, layer_name=None, where=None):
+    """
+    Read polygons from a vector file and transform them into the raster CRS
+
+    Parameters:
+    -----------
+    aoi_file : str
+        Any OGR-readable vector file (GeoPackage, Shapefile, GeoJSON, ...)
+    target_wkt : str
+        WKT of the raster CRS
+    layer_name : str or None
+        Layer to read (default: first layer)
+    where : str or None
+        OGR attribute filter selecting features
+
+    Returns:
+    --------
+    list : WKT geometries in the raster CRS
+    """
+    ds = ogr.Open(aoi_file)
+    if ds is None:
+        raise Exception(f"Cannot open AOI file: {aoi_file}")
+    layer = ds.GetLayerByName(layer_name) if layer_name else ds.GetLayer(0)
+    if layer is None:
+        raise Exception(f"AOI layer not found: {layer_name}")
+    if where:
+        layer.SetAttributeFilter(where)
+
+    transform = None
+    source_srs = layer.GetSpatialRef()
+    if source_srs is not None and target_wkt:
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromWkt(target_wkt)
+        if not source_srs.IsSame(target_srs):
+            source_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            target_srs.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+            transform = osr.CoordinateTransformation(source_srs, target_srs)
+
+    geometries = []
+    for feature in layer:
+        geometry = feature.GetGeometryRef()
+        if geometry is None:
+            continue
+        geometry = geometry.Clone()
+        if transform is not None:
+            geometry.Transform(transform)
+        geometries.append(geometry.ExportToWkt())
+    ds = None
+    return geometries
+
+
+def polygon_parts(geometries):
+    """Split multi-polygons and collections into single polygons (WKT)"""
+    parts = []
+    for wkt in geometries:
+        geometry = ogr.CreateGeometryFromWkt(wkt)
+        if geometry is None or geometry.IsEmpty():
+            continue
+        if geometry.GetGeometryCount() > 0 and ogr.GT_Flatten(geometry.GetGeometryType()) in (
+                ogr.wkbMultiPolygon, ogr.wkbGeometryCollection):
+            parts.extend(geometry.GetGeometryRef(i).ExportToWkt() for i in range(geometry.GetGeometryCount()))
+        else:
+            parts.append(wkt)
+    return parts
+
+
+def geometry_extent(wkt):
+    """(xmin, ymin, xmax, ymax) of a WKT geometry"""
+    xmin, xmax, ymin, ymax = ogr.CreateGeometryFromWkt(wkt).GetEnvelope()
+    return xmin, ymin, xmax, ymax
+
+
+def _grow(window, margin, width, height):
+    xoff, yoff, xsize, ysize = window
+    x0, y0 = max(0, xoff - margin), max(0, yoff - margin)
+    x1, y1 = min(width, xoff + xsize + margin), min(height, yoff + ysize + margin)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _union(windows):
+    x0 = min(w[0] for w in windows)
+    y0 = min(w[1] for w in windows)
+    x1 = max(w[0] + w[2] for w in windows)
+    y1 = max(w[1] + w[3] for w in windows)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def _overlap(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def group_windows(windows, margin):
+    """
+    Merge windows whose margin-grown boxes overlap
+
+    Returns:
+    --------
+    list : (window, member_indices) per group; groups are disjoint, so they can
+        be downscaled independently
+    """
+    groups = [(window, [i]) for i, window in enumerate(windows)]
+    merged = True
+    while merged:
+        merged = False
+        for a in range(len(groups)):
+            for b in range(a + 1, len(groups)):
+                grown_a = (groups[a][0][0] - margin, groups[a][0][1] - margin,
+                           groups[a][0][2] + 2 * margin, groups[a][0][3] + 2 * margin)
+                grown_b = (groups[b][0][0] - margin, groups[b][0][1] - margin,
+                           groups[b][0][2] + 2 * margin, groups[b][0][3] + 2 * margin)
+                if _overlap(grown_a, grown_b):
+                    groups[a] = (_union([groups[a][0], groups[b][0]]), groups[a][1] + groups[b][1])
+                    del groups[b]
+                    merged = True
+                    break
+            if merged:
+                break
+    return groups
+
+
+def rasterize_mask(geometries, geot, xsize, ysize, projection=''):
+    """Boolean array that is True for pixels whose centre lies inside any of the WKT geometries"""
+    mask_ds = gdal.GetDriverByName('MEM').Create('', xsize, ysize, 1, gdal.GDT_Byte)
+    mask_ds.SetGeoTransform(geot)
+    if projection:
+        mask_ds.SetProjection(projection)
+    vector_ds = ogr.GetDriverByName('Memory').CreateDataSource('')
+    layer = vector_ds.CreateLayer('aoi', geom_type=ogr.wkbUnknown)
+    for wkt in geometries:
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(ogr.CreateGeometryFromWkt(wkt))
+        layer.CreateFeature(feature)
+    gdal.RasterizeLayer(mask_ds, [1], layer, burn_values=[1])
+    mask = mask_ds.GetRasterBand(1).ReadAsArray().astype(bool)
+    mask_ds = None
+    vector_ds = None
+    return mask
+
+
+def downscale_dem_aoi(input_file, output_file, zoom_factor, rsme, extent=None, aoi_geometries=None, aoi_file=None,
+                      aoi_layer=None, margin=16, threshold=0.001, progress_callback=None, max_iterations=1000,
+                      workers=None, tile_size=512, creation_options=None, cancel_token=None):
+    """
+    Downscale only an area of interest of a DEM
+
+    Exactly one of extent, aoi_geometries and aoi_file defines the AOI. The
+    output covers the bounding box of the AOI (snapped outward to input pixel
+    edges) with the matching geo transform. With polygons, output pixels whose
+    centre lies outside every polygon are nodata. If the run fails or is
+    cancelled, the partially written output is removed.
+
+    Parameters:
+    -----------
+    input_file, output_file, zoom_factor, rsme, threshold, progress_callback, max_iterations, cancel_token :
+        As for downscale_dem
+    extent : tuple or None
+        (xmin, ymin, xmax, ymax) in the raster CRS, e.g. the map canvas extent
+    aoi_geometries : list or None
+        Polygon or multi-polygon WKT strings in the raster CRS
+    aoi_file : str or None
+        Vector file with AOI polygons in any CRS (see load_aoi_geometries)
+    aoi_layer : str or None
+        Layer of aoi_file (default: first layer)
+    margin : int
+        Input pixels read around every part so the iterations converge at its edges
+    workers : int or None
+        Threads shared by the parts (default: cores - 1, at most 4)
+    tile_size : int
+        Parts larger than this are downscaled tile by tile
+    creation_options : list or None
+        GeoTIFF creation options (default: DEFAULT_CREATION_OPTIONS)
+
+    Returns:
+    --------
+    dict : Result information as for downscale_dem plus parts, groups and
+        aoi_window (input pixels covered by the output)
+    """
+    if sum(value is not None for value in (extent, aoi_geometries, aoi_file)) != 1:
+        raise ValueError("Give exactly one of extent, aoi_geometries and aoi_file")
+    if workers is None:
+        workers = _default_workers()
+    emit = progress_emitter(progress_callback)
+    progress_callback = message_callback(emit)
+    t0 = time.perf_counter()
+
+    raster_info = get_raster_info(input_file)
+    width, height = raster_info['width'], raster_info['height']
+    src_ds = open_raster(input_file)
+    geot = src_ds.GetGeoTransform()
+    proj = src_ds.GetProjection()
+    src_ds = None
+
+    if aoi_file is not None:
+        aoi_geometries = load_aoi_geometries(aoi_file, proj, layer_name=aoi_layer)
+    if extent is not None:
+        parts = [None]
+        part_windows = [extent_to_window(geot, extent, width, height)]
+    else:
+        parts = polygon_parts(aoi_geometries)
+        part_windows = [extent_to_window(geot, geometry_extent(part), width, height) for part in parts]
+    kept = [i for i, window in enumerate(part_windows) if window is not None]
+    if not kept:
+        raise ValueError("The area of interest does not overlap the input DEM")
+    parts = [parts[i] for i in kept]
+    part_windows = [part_windows[i] for i in kept]
+
+    groups = group_windows(part_windows, margin)
+    aoi_window = _union(part_windows)
+    ax, ay, aw, ah = aoi_window
+    geotnew = downscaled_geo_transform(window_geo_transform(geot, ax, ay), zoom_factor)
+    nodata_value = raster_info['nodata_value']
+    out_nodata = nodata_value if nodata_value is not None else -9999
+
+    if progress_callback:
+        progress_callback(
+            f"Area of interest: {len(parts)} part(s) in {len(groups)} independent window(s), "
+            f"{aw}x{ah} of {width}x{height} input pixels", 1
+        )
+
+    if creation_options is None:
+        creation_options = DEFAULT_CREATION_OPTIONS
+
+    # Parallelism goes to the independent parts first, then to the tiles inside them
+    outer_workers = max(1, min(workers, len(groups)))
+    inner_workers = max(1, workers // outer_workers)
+
+    def run(group):
+        window, members = group
+        gx, gy, gxs, gys = window
+        rx, ry, rxs, rys = _grow(window, margin, width, height)
+        goc, _, _, _ = read_window(input_file, rx, ry, rxs, rys)
+        dscal, info = downscale_array_tiled(
+            goc, zoom_factor, rsme,
+            nodata_value=nodata_value, threshold=threshold, max_iterations=max_iterations,
+            tile_size=tile_size, halo=margin, workers=inner_workers, cancel_token=cancel_token
+        )
+        core = dscal[(gy - ry) * zoom_factor:(gy - ry + gys) * zoom_factor,
+                     (gx - rx) * zoom_factor:(gx - rx + gxs) * zoom_factor]
+        if extent is None:
+            core_geot = downscaled_geo_transform(window_geo_transform(geot, gx, gy), zoom_factor)
+            inside = rasterize_mask([parts[i] for i in members], core_geot, core.shape[1], core.shape[0], proj)
+            core = np.where(inside, core, out_nodata)
+        return window, core.astype(np.float32), info
+
+    iterations = 0
+    converged = True
+    stopped_early = False
+    completed = False
+    try:
+        if os.path.isfile(output_file):
+            os.remove(output_file)
+        outds = gdal.GetDriverByName("GTiff").Create(
+            output_file, xsize=aw * zoom_factor, ysize=ah * zoom_factor, bands=1,
+            eType=gdal.GDT_Float32, options=list(creation_options) + ['SPARSE_OK=TRUE']
+        )
+        if outds is None:
+            raise Exception(f"Error creating output raster: {output_file}")
+        outds.SetGeoTransform(geotnew)
+        outds.SetProjection(proj)
+        out_band = outds.GetRasterBand(1)
+        out_band.SetNoDataValue(out_nodata)
+
+        with ThreadPoolExecutor(max_workers=outer_workers, thread_name_prefix="dem-aoi") as pool:
+            futures = [pool.submit(run, group) for group in groups]
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    window, core, info = future.result()
+                    # GDAL datasets are not thread-safe, so all writes happen here
+                    out_band.WriteArray(core, (window[0] - ax) * zoom_factor, (window[1] - ay) * zoom_factor)
+                    iterations = max(iterations, info['iterations'])
+                    converged = converged and info['converged']
+                    stopped_early = stopped_early or info['stopped_early']
+                    if emit:
+                        emit(TileDone(done, len(groups), iterations=info['iterations'],
+                                      percentage=done / len(groups) * 95))
+            except BaseException:
+                # Groups not started yet are dropped; the pool waits for the running ones
+                for future in futures:
+                    future.cancel()
+                raise
+
+        outds.FlushCache()
+        out_band = None
+        outds = None
+        completed = True
+    finally:
+        if not completed:
+            # Do not leave a partial output that looks valid after an error or cancellation
+            out_band = None
+            outds = None
+            if os.path.isfile(output_file):
+                os.remove(output_file)
+
+    if progress_callback:
+        progress_callback(f"Completed! ({time.perf_counter() - t0:.1f} s)", 100)
+
+    return {
+        'iterations': iterations,
+        'final_energy': None,
+        'output_file': output_file,
+        'input_size': (width, height),
+        'output_size': (aw * zoom_factor, ah * zoom_factor),
+        'converged': converged,
+        'stopped_early': stopped_early,
+        'nodata_preserved': nodata_value is not None,
+        'parts': len(parts),
+        'groups': len(groups),
+        'aoi_window': aoi_window
+    }
@@ -0,0 +1,371 @@
+"""
+Headless command-line entry point for DEM downscaling
+
+Runs downscale_dem on many inputs without QGIS, on a bounded process pool whose
+size is limited by a memory budget, and prints one JSON line per job.
+
+Usage:
+    python -m dem_downscaling_cli --zoom 4 --rsme 4 dems/*.tif
+    python -m dem_downscaling_cli --list-file jobs.txt --output-dir out/ --jobs 4
+
+From the directory containing the plugin, the package itself is runnable:
+    python -m dem_downscaling --zoom 4 --rsme 4 dems/*.tif
+
+Calibrate parameters on one DEM (loaded once, warm-started runs):
+    python -m dem_downscaling sweep dem.tif --zoom 4 --rsme 2 4 8 --threshold 0.01 0.001
+
+Inspect or empty the on-disk caches:
+    python -m dem_downscaling cache info
+    python -m dem_downscaling cache purge --which results
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+try:
+    from .dem_downscaling_algorithm import (
+        downscale_dem, estimate_memory_usage, get_raster_info, default_checkpoint_file, PSUTIL_AVAILABLE
+    )
+    from .dem_cache import StagingCache, ResultCache
+    from .dem_downscaling_incremental import downscale_dem_incremental
+    from .dem_downscaling_session import run_parameter_sweep, format_sweep_table
+    from .dem_downscaling_aoi import downscale_dem_aoi
+    from .dem_downscaling_profiling import MemoryProfiler
+except ImportError:
+    from dem_downscaling_algorithm import (
+        downscale_dem, estimate_memory_usage, get_raster_info, default_checkpoint_file, PSUTIL_AVAILABLE
+    )
+    from dem_cache import StagingCache, ResultCache
+    from dem_downscaling_incremental import downscale_dem_incremental
+    from dem_downscaling_session import run_parameter_sweep, format_sweep_table
+    from dem_downscaling_aoi import downscale_dem_aoi
+    from dem_downscaling_profiling import MemoryProfiler
+
+if PSUTIL_AVAILABLE:
+    import psutil
+
+
+def expand_inputs(patterns, list_file=None):
+    """Expand glob patterns and the entries of a list file into a sorted, de-duplicated list of paths"""
+    if list_file:
+        with open(list_file, 'r', encoding='utf-8') as f:
+            patterns = list(patterns) + [
+                line.strip() for line in f
+                if line.strip() and not line.strip().startswith('#')
+            ]
+
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for path in sorted(matches):
+            path = os.path.abspath(path)
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def output_path_for(input_file, output_dir=None, suffix='_downscaled'):
+    """Output file for an input: <output_dir or input dir>/<input name><suffix>.tif"""
+    base = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_dir or os.path.dirname(input_file), f"{base}{suffix}.tif")
+
+
+def plan_workers(job_memory_mb, max_jobs, memory_budget_mb):
+    """Number of concurrent jobs that fits the memory budget (at least 1)"""
+    largest = max(job_memory_mb) if job_memory_mb else 0
+    if largest <= 0:
+        return max(1, max_jobs)
+    return max(1, min(max_jobs, int(memory_budget_mb // largest)))
+
+
+def _json_default(value):
+    """Convert NumPy scalars and other non-JSON values in result dicts"""
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def run_job(job):
+    """
+    Run one downscaling job (executed in a worker process)
+
+    Returns:
+    --------
+    dict : input, output, status ('ok' or 'failed'), elapsed_seconds and either
+        the downscale_dem result dict or the error message
+    """
+    job = dict(job)
+    if job.pop('incremental', False):
+        run = downscale_dem_incremental
+    elif 'aoi' in job:
+        run = downscale_dem_aoi
+        job.update(job.pop('aoi'))
+    else:
+        run = downscale_dem
+    if job.pop('use_staging_cache', False):
+        # Caches hold locks and are created per process rather than pickled
+        job['staging_cache'] = StagingCache()
+    if job.pop('use_result_cache', False):
+        job['result_cache'] = ResultCache()
+    profile_memory = job.pop('profile_memory', False)
+
+    started = time.time()
+    t0 = time.perf_counter()
+    record = {
+        'input': job['input_file'],
+        'output': job['output_file'],
+        'started_at': started
+    }
+    try:
+        if profile_memory:
+            with MemoryProfiler() as profiler:
+                result = run(profiler=profiler, **job)
+        else:
+            result = run(**job)
+        record['status'] = 'ok'
+        record['result'] = result
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = f"{type(e).__name__}: {e}"
+        record['traceback'] = traceback.format_exc()
+    record['elapsed_seconds'] = time.perf_counter() - t0
+    return record
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='dem_downscaling',
+        description="Downscale DEMs with the Hopfield neural network method, without QGIS."
+    )
+    parser.add_argument('inputs', nargs='*', help="Input DEM files or glob patterns (quote patterns to use recursive **)")
+    parser.add_argument('--list-file', help="Text file with one input path or glob per line (# for comments)")
+    parser.add_argument('--output-dir', help="Directory for outputs (default: next to each input)")
+    parser.add_argument('--suffix', default='_downscaled', help="Suffix appended to output names (default: _downscaled)")
+    parser.add_argument('--overwrite', action='store_true', help="Recompute outputs that already exist")
+    parser.add_argument('--zoom', type=int, default=4, help="Resolution increase factor (default: 4)")
+    parser.add_argument('--rsme', type=float, default=4.0, help="RSME parameter (default: 4.0)")
+    parser.add_argument('--threshold', type=float, default=0.001, help="Energy change stopping threshold (default: 0.001)")
+    parser.add_argument('--max-iterations', type=int, default=1000, help="Maximum iterations per job (default: 1000)")
+    parser.add_argument('--io-mode', choices=('copy', 'mmap'), default='copy', help="Raster I/O mode (default: copy)")
+    parser.add_argument('--skip-empty-blocks', action='store_true', help="Skip empty input blocks and write sparse outputs")
+    parser.add_argument('--staging-cache', action='store_true', help="Stage inputs through the local staging cache")
+    parser.add_argument('--result-cache', action='store_true',
+                        help="Reuse outputs of earlier runs with identical input and parameters")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only recompute the parts of existing outputs whose input blocks changed since the last --incremental run")
+    parser.add_argument('--aoi', help="Only process the area inside the polygons of this vector file")
+    parser.add_argument('--aoi-layer', help="Layer of the --aoi file (default: first layer)")
+    parser.add_argument('--aoi-extent', type=float, nargs=4, metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'),
+                        help="Only process this extent (in the CRS of the inputs)")
+    parser.add_argument('--aoi-margin', type=int, default=16,
+                        help="Input pixels read around the area of interest for convergence (default: 16)")
+    parser.add_argument('--checkpoint-interval', type=int, default=0,
+                        help="Checkpoint every N iterations to <output>.checkpoint.npz (default: 0 = off)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Resume jobs from their checkpoint if one exists (implies --overwrite)")
+    parser.add_argument('--refine', action='store_true',
+                        help="Continue iterating from the existing outputs, e.g. with a tighter --threshold")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="Record the peak memory of every phase in the results (slows runs down)")
+    parser.add_argument('--timing-per-iteration', action='store_true',
+                        help="Also record the time of every phase per iteration in the results")
+    parser.add_argument('--trace', action='store_true',
+                        help="Write a Chrome trace-event timeline of each run next to its output (<output>.trace.json)")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help="Maximum concurrent jobs (default: CPU count)")
+    parser.add_argument('--memory-budget-mb', type=float,
+                        help="Memory available to all jobs together (default: 80%% of available memory)")
+    parser.add_argument('--results', help="Write JSON lines to this file instead of stdout")
+    return parser
+
+
+def cache_main(argv):
+    """'cache' command: show or purge the staging and result caches"""
+    parser = argparse.ArgumentParser(prog='dem_downscaling cache', description="Inspect or purge the on-disk caches.")
+    parser.add_argument('action', choices=('info', 'purge'))
+    parser.add_argument('--which', choices=('staging', 'results', 'all'), default='all', help="Cache to act on (default: all)")
+    args = parser.parse_args(argv)
+
+    caches = []
+    if args.which in ('staging', 'all'):
+        caches.append(('staging', StagingCache()))
+    if args.which in ('results', 'all'):
+        caches.append(('results', ResultCache()))
+
+    for name, cache in caches:
+        if args.action == 'purge':
+            cache.purge()
+            print(f"Purged {name} cache ({cache.cache_dir})")
+            continue
+        entries = cache.entries()
+        print(f"{name} cache: {cache.cache_dir}")
+        print(f"  {len(entries)} entries, {cache.total_size_mb():.1f} MB of {cache.max_size_mb:.0f} MB")
+        for key, entry in entries:
+            last_access = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry['last_access']))
+            described = entry['meta'].get('source') or entry['meta'].get('output_file', '')
+            print(f"  {key[:12]}  {entry['size_bytes'] / (1024 * 1024):9.1f} MB  "
+                  f"{entry.get('hits', 0):4d} hits  {last_access}  {described}")
+    return 0
+
+
+def sweep_main(argv):
+    """'sweep' command: run a parameter grid on one DEM and print a summary table"""
+    parser = argparse.ArgumentParser(
+        prog='dem_downscaling sweep',
+        description="Run every combination of zoom/rsme/threshold on one DEM, loading it once and warm-starting runs."
+    )
+    parser.add_argument('input', help="Input DEM file")
+    parser.add_argument('--zoom', type=int, nargs='+', default=[4], help="Zoom factors (default: 4)")
+    parser.add_argument('--rsme', type=float, nargs='+', required=True, help="RSME values")
+    parser.add_argument('--threshold', type=float, nargs='+', default=[0.001], help="Thresholds (default: 0.001)")
+    parser.add_argument('--max-iterations', type=int, default=1000, help="Maximum iterations per run (default: 1000)")
+    parser.add_argument('--output-dir', help="Write every result raster to this directory")
+    parser.add_argument('--cold-start', action='store_true', help="Start every run from the blocky surface")
+    parser.add_argument('--results', help="Also write one JSON line per run to this file")
+    args = parser.parse_args(argv)
+
+    def progress_callback(message, percentage):
+        if message.startswith(('Sweep', 'Loading')):
+            print(message, file=sys.stderr)
+
+    rows = run_parameter_sweep(
+        args.input, args.zoom, args.rsme, args.threshold,
+        max_iterations=args.max_iterations,
+        output_dir=args.output_dir,
+        warm_start=not args.cold_start,
+        progress_callback=progress_callback
+    )
+    print(format_sweep_table(rows))
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(dict(row, input=os.path.abspath(args.input)), default=_json_default) + "\n")
+    return 0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'cache':
+        return cache_main(argv[1:])
+    if argv and argv[0] == 'sweep':
+        return sweep_main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    inputs = expand_inputs(args.inputs, args.list_file)
+    if not inputs:
+        parser.error("no input files given")
+    if args.aoi and args.aoi_extent:
+        parser.error("--aoi and --aoi-extent are mutually exclusive")
+    aoi = None
+    if args.aoi:
+        aoi = {'aoi_file': args.aoi, 'aoi_layer': args.aoi_layer, 'margin': args.aoi_margin}
+    elif args.aoi_extent:
+        aoi = {'extent': tuple(args.aoi_extent), 'margin': args.aoi_margin}
+    if aoi is not None and args.incremental:
+        parser.error("--incremental cannot be combined with an area of interest")
+    if args.profile_memory and (aoi is not None or args.incremental):
+        parser.error("--profile-memory is only supported for whole-raster runs")
+    if args.timing_per_iteration and (aoi is not None or args.incremental):
+        parser.error("--timing-per-iteration is only supported for whole-raster runs")
+    if args.trace and (aoi is not None or args.incremental):
+        parser.error("--trace is only supported for whole-raster runs")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if args.memory_budget_mb is not None:
+        memory_budget_mb = args.memory_budget_mb
+    elif PSUTIL_AVAILABLE:
+        memory_budget_mb = psutil.virtual_memory().available / (1024 * 1024) * 0.8
+    else:
+        memory_budget_mb = 4096
+
+    jobs = []
+    records = []
+    job_memory_mb = []
+    for input_file in inputs:
+        output_file = output_path_for(input_file, args.output_dir, args.suffix)
+        refine = args.refine and os.path.exists(output_file)
+        if os.path.exists(output_file) and not (args.overwrite or args.resume or refine or args.incremental):
+            records.append({'input': input_file, 'output': output_file, 'status': 'skipped'})
+            continue
+        try:
+            info = get_raster_info(input_file)
+            job_memory_mb.append(estimate_memory_usage(info['width'], info['height'], args.zoom, dtype=info['dtype'],
+                                                      nodata=info['nodata_value'] is not None)['total_mb'])
+        except Exception as e:
+            records.append({'input': input_file, 'output': output_file, 'status': 'failed',
+                            'error': f"{type(e).__name__}: {e}"})
+            continue
+        job = {
+            'input_file': input_file,
+            'output_file': output_file,
+            'zoom_factor': args.zoom,
+            'rsme': args.rsme,
+            'threshold': args.threshold,
+            'max_iterations': args.max_iterations,
+            'io_mode': args.io_mode,
+            'skip_empty_blocks': args.skip_empty_blocks,
+            'use_staging_cache': args.staging_cache,
+            'use_result_cache': args.result_cache,
+            'profile_memory': args.profile_memory,
+            'timing_per_iteration': args.timing_per_iteration,
+            'trace': args.trace
+        }
+        if args.incremental or aoi is not None:
+            # The incremental and AOI runners read and write windows themselves
+            job = {key: job[key] for key in ('input_file', 'output_file', 'zoom_factor', 'rsme', 'threshold', 'max_iterations')}
+            if aoi is not None:
+                job['aoi'] = aoi
+            else:
+                job['incremental'] = True
+        elif args.checkpoint_interval > 0 or args.resume:
+            job['checkpoint_file'] = default_checkpoint_file(output_file)
+            job['checkpoint_interval'] = args.checkpoint_interval
+            job['resume'] = args.resume
+        if refine and not args.incremental and aoi is None:
+            job['continue_from'] = output_file
+        jobs.append(job)
+
+    workers = plan_workers(job_memory_mb, args.jobs, memory_budget_mb)
+    if job_memory_mb and max(job_memory_mb) > memory_budget_mb:
+        print(f"Warning: largest job needs ~{max(job_memory_mb):.0f} MB, "
+              f"more than the {memory_budget_mb:.0f} MB budget", file=sys.stderr)
+    print(f"Running {len(jobs)} job(s) on {workers} worker process(es) "
+          f"(memory budget {memory_budget_mb:.0f} MB)", file=sys.stderr)
+
+    out = open(args.results, 'w', encoding='utf-8') if args.results else sys.stdout
+    try:
+        for record in records:
+            out.write(json.dumps(record, default=_json_default) + "\n")
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                record = future.result()
+                records.append(record)
+                out.write(json.dumps(record, default=_json_default) + "\n")
+                out.flush()
+                print(f"[{record['status']}] {record['input']} ({record['elapsed_seconds']:.1f} s)", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    failed = [r for r in records if r['status'] == 'failed']
+    done = sum(1 for r in records if r['status'] == 'ok')
+    skipped = sum(1 for r in records if r['status'] == 'skipped')
+    print(f"{done} succeeded, {len(failed)} failed, {skipped} skipped", file=sys.stderr)
+    for record in failed:
+        print(f"  FAILED {record['input']}: {record['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
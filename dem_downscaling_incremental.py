@@ -0,0 +1,308 @@
+"""
+Incremental recomputation of a downscaled DEM after local edits of its input
+
+A run through downscale_dem_incremental records a fingerprint of the input next
+to the output: one hash per block of input pixels plus the georeferencing and
+parameters of the run, and the size, modification time and dimensions of the
+output it wrote (so an output replaced by another run is not patched). When the input is patched later (e.g. a quarry update),
+the next run compares block hashes, recomputes only the bounding box of the
+changed blocks plus a convergence halo, starting from the previous output, and
+writes back only the affected part of the output.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+from osgeo import gdal
+
+try:
+    from .dem_downscaling_algorithm import (
+        open_raster, get_raster_band, get_geo_transform, get_projection, build_nodata_mask,
+        downscale_array, downscale_dem, ENGINE_VERSION
+    )
+    from .dem_downscaling_progress import message_callback
+except ImportError:
+    from dem_downscaling_algorithm import (
+        open_raster, get_raster_band, get_geo_transform, get_projection, build_nodata_mask,
+        downscale_array, downscale_dem, ENGINE_VERSION
+    )
+    from dem_downscaling_progress import message_callback
+
+
+FINGERPRINT_VERSION = 2
+
+
+def default_fingerprint_file(output_file):
+    """Fingerprint file recorded next to an output"""
+    return output_file + ".fingerprint.json"
+
+
+def block_hashes(data, block_size):
+    """
+    Hash every block_size x block_size block of a 2D array
+
+    Returns:
+    --------
+    list : rows of hex digests, in block row-major order
+    """
+    data = np.ascontiguousarray(data)
+    height, width = data.shape
+    hashes = []
+    for yoff in range(0, height, block_size):
+        row = []
+        for xoff in range(0, width, block_size):
+            block = np.ascontiguousarray(data[yoff:yoff + block_size, xoff:xoff + block_size])
+            row.append(hashlib.blake2b(block.tobytes(), digest_size=16).hexdigest())
+        hashes.append(row)
+    return hashes
+
+
+def fingerprint_metadata(data, geot, proj, nodata_value, zoom_factor, rsme, threshold, max_iterations, block_size):
+    """Everything besides the block hashes that must match for an incremental update"""
+    return {
+        'version': FINGERPRINT_VERSION,
+        'engine_version': ENGINE_VERSION,
+        'width': int(data.shape[1]),
+        'height': int(data.shape[0]),
+        'dtype': str(data.dtype),
+        'geotransform': [float(v) for v in geot],
+        'projection': proj,
+        'nodata_value': None if nodata_value is None else float(nodata_value),
+        'zoom_factor': int(zoom_factor),
+        'rsme': float(rsme),
+        'threshold': float(threshold),
+        'max_iterations': int(max_iterations),
+        'block_size': int(block_size)
+    }
+
+
+def output_signature(output_file):
+    """
+    Identity of an output file: size, modification time and raster dimensions
+
+    Returns:
+    --------
+    dict or None : None if the file is missing or cannot be opened as a raster
+    """
+    try:
+        st = os.stat(output_file)
+    except OSError:
+        return None
+    ds = gdal.Open(output_file)
+    if ds is None:
+        return None
+    signature = {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'width': ds.RasterXSize,
+        'height': ds.RasterYSize
+    }
+    ds = None
+    return signature
+
+
+def save_fingerprint(fn, meta, hashes, output):
+    tmp_fn = fn + ".tmp"
+    with open(tmp_fn, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'hashes': hashes, 'output': output}, f)
+    os.replace(tmp_fn, fn)
+
+
+def load_fingerprint(fn):
+    """Return (meta, hashes, output signature) of a fingerprint file, or None if it is missing or unreadable"""
+    try:
+        with open(fn, 'r', encoding='utf-8') as f:
+            fingerprint = json.load(f)
+        return fingerprint['meta'], fingerprint['hashes'], fingerprint['output']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def changed_blocks(old_hashes, new_hashes):
+    """Boolean (block rows, block columns) array of blocks whose hash differs"""
+    return np.array(old_hashes) != np.array(new_hashes)
+
+
+def changed_window(changed, block_size, width, height, margin):
+    """
+    Input pixel window covering all changed blocks, grown by margin pixels and
+    clipped to the raster
+
+    Returns:
+    --------
+    tuple : (xoff, yoff, xsize, ysize)
+    """
+    rows, cols = np.nonzero(changed)
+    x0 = max(0, cols.min() * block_size - margin)
+    y0 = max(0, rows.min() * block_size - margin)
+    x1 = min(width, (cols.max() + 1) * block_size + margin)
+    y1 = min(height, (rows.max() + 1) * block_size + margin)
+    return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+
+def _detach_hard_link(fn):
+    """Give fn its own copy of the data before it is updated in place (e.g. if it links into a result cache)"""
+    if os.stat(fn).st_nlink > 1:
+        tmp_fn = fn + ".detach.tmp"
+        shutil.copy2(fn, tmp_fn)
+        os.replace(tmp_fn, fn)
+
+
+def downscale_dem_incremental(input_file, output_file, zoom_factor, rsme, threshold=0.001, progress_callback=None, max_iterations=1000,
+                              block_size=256, halo=32, fingerprint_file=None, cancel_token=None):
+    """
+    Bring a downscaled DEM up to date with its (partly edited) input
+
+    Without a usable fingerprint or output (first run, other parameters, resized
+    or reprojected input, output rewritten by another run since) the whole DEM is
+    downscaled with downscale_dem.
+    Otherwise only the changed region is recomputed:
+
+    - the window is the bounding box of the changed blocks plus halo input pixels
+    - it is seeded with the previous output, except for the changed blocks, which
+      start from the blocky initial surface of the new input
+    - only the bounding box plus halo // 2 is written back; the outer half of the
+      halo only gives the iterations their surrounding context
+
+    Parameters:
+    -----------
+    input_file, output_file, zoom_factor, rsme, threshold, progress_callback, max_iterations, cancel_token :
+        As for downscale_dem
+    block_size : int
+        Size in input pixels of the blocks that are hashed and compared
+    halo : int
+        Input pixels around the changed blocks recomputed for convergence
+    fingerprint_file : str or None
+        Fingerprint to compare against and update (default: default_fingerprint_file(output_file))
+
+    Returns:
+    --------
+    dict : iterations, final_energy, converged, stopped_early, output_file,
+        input_size, output_size, nodata_preserved, incremental (False for a
+        full run), changed_blocks and recomputed_window (input pixels, None for
+        a full run or when nothing changed)
+    """
+    if fingerprint_file is None:
+        fingerprint_file = default_fingerprint_file(output_file)
+    progress_callback = message_callback(progress_callback)
+
+    goc, nodata_value = get_raster_band(input_file)
+    geot = get_geo_transform(input_file)
+    proj = get_projection(input_file)
+    meta = fingerprint_metadata(goc, geot, proj, nodata_value, zoom_factor, rsme, threshold, max_iterations, block_size)
+    hashes = block_hashes(goc, block_size)
+    height, width = goc.shape
+
+    previous = load_fingerprint(fingerprint_file) if os.path.exists(output_file) else None
+    if previous is None:
+        reason = "no previous run recorded"
+    elif previous[0] != meta:
+        reason = "input layout or parameters changed"
+    elif previous[2] != output_signature(output_file):
+        reason = "output written by another run"
+    else:
+        reason = None
+    if reason is not None:
+        if progress_callback:
+            progress_callback(f"Full recomputation ({reason})", 1)
+        result = downscale_dem(
+            input_file, output_file, zoom_factor, rsme,
+            threshold=threshold, progress_callback=progress_callback,
+            max_iterations=max_iterations, cancel_token=cancel_token
+        )
+        save_fingerprint(fingerprint_file, meta, hashes, output_signature(output_file))
+        result.update({
+            'incremental': False,
+            'changed_blocks': int(len(hashes) * len(hashes[0])),
+            'recomputed_window': None
+        })
+        return result
+
+    changed = changed_blocks(previous[1], hashes)
+    n_changed = int(changed.sum())
+    if n_changed == 0:
+        if progress_callback:
+            progress_callback("Input unchanged since the last run - nothing to recompute", 100)
+        return {
+            'iterations': 0,
+            'final_energy': None,
+            'converged': True,
+            'stopped_early': False,
+            'output_file': output_file,
+            'input_size': (width, height),
+            'output_size': (width * zoom_factor, height * zoom_factor),
+            'nodata_preserved': nodata_value is not None,
+            'incremental': True,
+            'changed_blocks': 0,
+            'recomputed_window': None
+        }
+
+    xoff, yoff, xsize, ysize = changed_window(changed, block_size, width, height, halo)
+    wx, wy, wxsize, wysize = changed_window(changed, block_size, width, height, halo // 2)
+    if progress_callback:
+        progress_callback(
+            f"{n_changed} of {changed.size} blocks changed - recomputing window "
+            f"{xsize}x{ysize} at ({xoff}, {yoff})", 2
+        )
+
+    goc_window = goc[yoff:yoff + ysize, xoff:xoff + xsize]
+    nodata_mask_window = build_nodata_mask(goc_window, nodata_value)
+
+    # Seed: previous output, with the changed blocks reset to the new blocky surface
+    out_ds = open_raster(output_file)
+    seed = out_ds.GetRasterBand(1).ReadAsArray(
+        xoff * zoom_factor, yoff * zoom_factor, xsize * zoom_factor, ysize * zoom_factor
+    ).astype(np.float64)
+    out_ds = None
+    changed_pixels = np.repeat(np.repeat(changed, block_size, axis=0), block_size, axis=1)[:height, :width]
+    changed_pixels = changed_pixels[yoff:yoff + ysize, xoff:xoff + xsize]
+    changed_sub = np.repeat(np.repeat(changed_pixels, zoom_factor, axis=0), zoom_factor, axis=1)
+    blocky = np.repeat(np.repeat(goc_window, zoom_factor, axis=0), zoom_factor, axis=1)
+    seed[changed_sub] = blocky[changed_sub]
+
+    dscal, run_info = downscale_array(
+        goc_window, zoom_factor, rsme,
+        nodata_value=nodata_value,
+        nodata_mask_orig=nodata_mask_window,
+        threshold=threshold,
+        progress_callback=progress_callback,
+        max_iterations=max_iterations,
+        cancel_token=cancel_token,
+        initial_dscal=seed
+    )
+
+    if cancel_token is not None:
+        cancel_token.check()
+    if progress_callback:
+        progress_callback("Writing updated output blocks...", 90)
+
+    # Update only the affected rows/columns of the existing output
+    _detach_hard_link(output_file)
+    out_ds = open_raster(output_file, gdal.GA_Update)
+    core = dscal[
+        (wy - yoff) * zoom_factor:(wy - yoff + wysize) * zoom_factor,
+        (wx - xoff) * zoom_factor:(wx - xoff + wxsize) * zoom_factor
+    ]
+    out_ds.GetRasterBand(1).WriteArray(core.astype(np.float32), wx * zoom_factor, wy * zoom_factor)
+    out_ds.FlushCache()
+    out_ds = None
+
+    save_fingerprint(fingerprint_file, meta, hashes, output_signature(output_file))
+    if progress_callback:
+        progress_callback("Completed!", 100)
+
+    return {
+        'iterations': run_info['iterations'],
+        'final_energy': run_info['final_energy'],
+        'converged': run_info['converged'],
+        'stopped_early': run_info['stopped_early'],
+        'output_file': output_file,
+        'input_size': (width, height),
+        'output_size': (width * zoom_factor, height * zoom_factor),
+        'nodata_preserved': nodata_value is not None,
+        'incremental': True,
+        'changed_blocks': n_changed,
+        'recomputed_window': (xoff, yoff, xsize, ysize)
+    }
@@ -0,0 +1,200 @@
+"""
+Live convergence and throughput panel of the plugin dialog
+
+ConvergencePanel is fed by the dialog's progress timer with the IterationStats
+events of the running job (see ProgressCoalescer), so it never blocks or
+slows down the worker. It plots the energy and the energy change of every
+iteration and shows the time per iteration, the throughput, the memory of the
+QGIS process and the active engine. When the energy change flattens out far
+above the threshold, the run has effectively converged and can be stopped.
+"""
+import math
+
+from qgis.PyQt import QtWidgets
+from qgis.PyQt.QtCore import Qt, QPointF, pyqtSignal
+from qgis.PyQt.QtGui import QColor, QPainter, QPen, QPolygonF
+from qgis.gui import QgsCollapsibleGroupBox
+
+from .dem_downscaling_algorithm import PSUTIL_AVAILABLE
+
+if PSUTIL_AVAILABLE:
+    import psutil
+
+
+class SparklineWidget(QtWidgets.QWidget):
+    """Small line chart of a series, without axes, optionally on a log scale"""
+
+    def __init__(self, color, log_scale=False, parent=None):
+        QtWidgets.QWidget.__init__(self, parent)
+        self.values = []
+        self.color = QColor(color)
+        self.log_scale = log_scale
+        self.reference = None  # value drawn as a dashed line, e.g. the threshold
+        self.setMinimumHeight(50)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
+
+    def clear(self):
+        self.values = []
+        self.reference = None
+        self.update()
+
+    def extend(self, values):
+        self.values.extend(values)
+        self.update()
+
+    def _scaled(self, value):
+        if value is None or not math.isfinite(value):
+            return None
+        if self.log_scale:
+            return math.log10(value) if value > 0 else None
+        return value
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.fillRect(self.rect(), self.palette().base())
+        area = self.rect().adjusted(3, 3, -3, -3)
+
+        # At most one point per pixel column
+        step = max(1, len(self.values) // max(1, area.width()))
+        points = [self._scaled(value) for value in self.values[::step]]
+        points = [value for value in points if value is not None]
+        reference = self._scaled(self.reference)
+        if len(points) >= 2:
+            low, high = min(points), max(points)
+            if reference is not None:
+                low, high = min(low, reference), max(high, reference)
+            span = (high - low) or 1.0
+
+            def y(value):
+                return area.bottom() - (value - low) / span * area.height()
+
+            dx = area.width() / (len(points) - 1)
+            pen = QPen(self.color)
+            pen.setWidthF(1.5)
+            painter.setPen(pen)
+            painter.drawPolyline(QPolygonF([QPointF(area.left() + i * dx, y(value)) for i, value in enumerate(points)]))
+            if reference is not None:
+                pen = QPen(self.palette().mid().color())
+                pen.setStyle(Qt.DashLine)
+                painter.setPen(pen)
+                painter.drawLine(QPointF(area.left(), y(reference)), QPointF(area.right(), y(reference)))
+        painter.end()
+
+
+class ConvergencePanel(QgsCollapsibleGroupBox):
+    """Collapsible panel with the live convergence and throughput of the current job"""
+
+    # Iterations averaged for the time per iteration and the throughput
+    RECENT_ITERATIONS = 5
+
+    finishRequested = pyqtSignal()  # "Finish now": keep the surface reached so far
+
+    def __init__(self, parent=None):
+        QgsCollapsibleGroupBox.__init__(self, "Convergence and throughput", parent)
+        self.setObjectName("convergencePanel")
+        self.setSaveCollapsedState(True)
+        self.setCollapsed(True)
+        self._process = psutil.Process() if PSUTIL_AVAILABLE else None
+        self._recent = []
+        self._can_finish = False
+
+        self.energy_plot = SparklineWidget("#1f77b4")
+        self.change_plot = SparklineWidget("#d62728", log_scale=True)
+        self.change_plot.setToolTip("Energy change per iteration (log scale); the dashed line is the threshold")
+        self.label_energy = QtWidgets.QLabel("-")
+        self.label_change = QtWidgets.QLabel("-")
+        self.label_iteration = QtWidgets.QLabel("-")
+        self.label_time = QtWidgets.QLabel("-")
+        self.label_throughput = QtWidgets.QLabel("-")
+        self.label_memory = QtWidgets.QLabel("-")
+        self.label_engine = QtWidgets.QLabel("-")
+        self.btnFinish = QtWidgets.QPushButton("Finish now")
+        self.btnFinish.setToolTip(
+            "Stop iterating after the current iteration and write the result reached so far"
+        )
+        self.btnFinish.setEnabled(False)
+        self.btnFinish.clicked.connect(self._finish_clicked)
+
+        layout = QtWidgets.QGridLayout(self)
+        layout.addWidget(QtWidgets.QLabel("Energy:"), 0, 0)
+        layout.addWidget(self.label_energy, 0, 1)
+        layout.addWidget(self.energy_plot, 1, 0, 1, 4)
+        layout.addWidget(QtWidgets.QLabel("Energy change:"), 2, 0)
+        layout.addWidget(self.label_change, 2, 1, 1, 3)
+        layout.addWidget(self.change_plot, 3, 0, 1, 4)
+        layout.addWidget(QtWidgets.QLabel("Iteration:"), 4, 0)
+        layout.addWidget(self.label_iteration, 4, 1)
+        layout.addWidget(QtWidgets.QLabel("Engine:"), 4, 2)
+        layout.addWidget(self.label_engine, 4, 3)
+        layout.addWidget(QtWidgets.QLabel("Time per iteration:"), 5, 0)
+        layout.addWidget(self.label_time, 5, 1)
+        layout.addWidget(QtWidgets.QLabel("Throughput:"), 5, 2)
+        layout.addWidget(self.label_throughput, 5, 3)
+        layout.addWidget(QtWidgets.QLabel("Process memory:"), 6, 0)
+        layout.addWidget(self.label_memory, 6, 1)
+        layout.addWidget(self.btnFinish, 6, 3, Qt.AlignRight)
+        layout.setColumnStretch(1, 1)
+        layout.setColumnStretch(3, 1)
+
+    def reset(self, engine=None, can_finish=True):
+        """
+        Clear the panel for a new job
+
+        can_finish is False for jobs that run tile by tile (areas of interest):
+        finishing early would stop every tile not started yet after one
+        iteration, so "Finish now" stays disabled for them.
+        """
+        self._recent = []
+        self._can_finish = can_finish
+        self.energy_plot.clear()
+        self.change_plot.clear()
+        for label in (self.label_energy, self.label_change, self.label_iteration, self.label_time,
+                      self.label_throughput):
+            label.setText("-")
+        self.label_engine.setText(engine or "-")
+        self.btnFinish.setEnabled(False)
+        self.btnFinish.setToolTip(
+            "Stop iterating after the current iteration and write the result reached so far" if can_finish
+            else "Not available for jobs processed tile by tile"
+        )
+        self.update_memory()
+
+    def job_done(self):
+        self.btnFinish.setEnabled(False)
+
+    def _finish_clicked(self):
+        self.btnFinish.setEnabled(False)
+        self.finishRequested.emit()
+
+    def add_iterations(self, iterations):
+        """Append IterationStats events (in order) to the plots and show the latest"""
+        if not iterations:
+            return
+        self.energy_plot.extend([stats.energy for stats in iterations])
+        # The first iteration of a run is compared with a placeholder energy, not a real change
+        self.change_plot.extend([abs(stats.delta) for stats in iterations if stats.iteration > 1])
+
+        latest = iterations[-1]
+        self.btnFinish.setEnabled(self._can_finish)
+        self.change_plot.reference = latest.threshold or None
+        self._recent = (self._recent + list(iterations))[-self.RECENT_ITERATIONS:]
+        self.label_energy.setText(f"{latest.energy:.6g}")
+        if latest.iteration > 1:
+            relative = abs(latest.delta) / latest.energy if latest.energy else 0.0
+            self.label_change.setText(
+                f"{latest.delta:.6g} ({relative:.3%} of the energy, threshold {latest.threshold or 0:g})"
+            )
+        self.label_iteration.setText(f"{latest.iteration} / {latest.max_iterations}")
+
+        seconds = sum(stats.elapsed_seconds for stats in self._recent) / len(self._recent)
+        self.label_time.setText(f"{seconds:.3f} s")
+        if latest.pixels and seconds > 0:
+            self.label_throughput.setText(f"{latest.pixels / seconds / 1e6:.2f} Mpix/s")
+
+    def update_memory(self):
+        """Show the resident memory of the QGIS process"""
+        if self._process is None:
+            self.label_memory.setText("n/a (psutil not installed)")
+            return
+        self.label_memory.setText(f"{self._process.memory_info().rss / (1024 * 1024):.0f} MB")
@@ -0,0 +1,816 @@
+"""
+Tiled, pipelined execution of the DEM downscaling algorithm
+
+The input DEM is split into tiles that are downscaled independently. Each tile
+is read with a halo of extra input pixels and only the tile core is written.
+
+Tiling is an approximation of a full-raster run: every iteration spreads the
+spatial dependence update by one output pixel, so over many iterations a pixel
+is influenced from further away than a fixed halo reaches. The halo keeps the
+tile edges, where the differences are largest, out of the written core; the
+remaining seam error shrinks as the halo grows and is largest for runs that
+need many iterations. Use downscale_dem where an exact result matters.
+
+Reading, computing and writing run concurrently:
+- a reader thread prefetches the next input windows
+- compute workers downscale them
+- a writer thread compresses and writes finished tiles
+
+The stages are connected by bounded queues, so memory stays proportional to
+the queue depth rather than to the raster size.
+
+With output_mode='chunks' there is no single writer: every compute worker
+writes its tiles as separate GeoTIFF chunks, and a VRT (optionally translated
+to a Cloud Optimized GeoTIFF) stitches them into the final product.
+
+downscale_preview runs the same tiled engine on a small window or a decimated
+overview of the input, with few iterations, to judge parameters in seconds.
+"""
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from osgeo import gdal
+
+try:
+    from .dem_downscaling_algorithm import (
+        open_raster, get_raster_info, build_nodata_mask, create_raster, block_is_empty,
+        downscaled_geo_transform, window_geo_transform, downscale_array, active_engine, default_trace_file
+    )
+    from .dem_downscaling_profiling import TraceRecorder, profile_phase
+    from .dem_downscaling_progress import TileDone, message_callback, progress_emitter
+except ImportError:
+    from dem_downscaling_algorithm import (
+        open_raster, get_raster_info, build_nodata_mask, create_raster, block_is_empty,
+        downscaled_geo_transform, window_geo_transform, downscale_array, active_engine, default_trace_file
+    )
+    from dem_downscaling_profiling import TraceRecorder, profile_phase
+    from dem_downscaling_progress import TileDone, message_callback, progress_emitter
+
+
+# Default GeoTIFF creation options for tiled output
+DEFAULT_CREATION_OPTIONS = [
+    'TILED=YES',
+    'BLOCKXSIZE=256',
+    'BLOCKYSIZE=256',
+    'COMPRESS=DEFLATE',
+    'PREDICTOR=3',
+    'BIGTIFF=IF_SAFER'
+]
+
+# Creation options for the final Cloud Optimized GeoTIFF in output_mode='chunks'
+COG_CREATION_OPTIONS = [
+    'COMPRESS=DEFLATE',
+    'PREDICTOR=YES',
+    'NUM_THREADS=ALL_CPUS',
+    'BIGTIFF=IF_SAFER'
+]
+
+# Seconds between checks of the abort flag while blocked on a queue
+_QUEUE_POLL_INTERVAL = 0.1
+
+_END_OF_STREAM = object()
+
+
+class TileWindow:
+    """
+    One tile of the input raster
+
+    The core (xoff, yoff, xsize, ysize) is the part of the input the tile is
+    responsible for. The read window additionally includes the halo, clipped
+    to the raster bounds. The halo reduces, but does not remove, the seam
+    differences to a full-raster run (see the module docstring).
+    """
+
+    def __init__(self, row, col, xoff, yoff, xsize, ysize, read_xoff, read_yoff, read_xsize, read_ysize):
+        self.row = row
+        self.col = col
+        self.xoff = xoff
+        self.yoff = yoff
+        self.xsize = xsize
+        self.ysize = ysize
+        self.read_xoff = read_xoff
+        self.read_yoff = read_yoff
+        self.read_xsize = read_xsize
+        self.read_ysize = read_ysize
+
+    @property
+    def tile_id(self):
+        return f"{self.row}_{self.col}"
+
+    def core_slices(self, zoom_factor):
+        """Slices selecting the tile core from the downscaled read window"""
+        top = (self.yoff - self.read_yoff) * zoom_factor
+        left = (self.xoff - self.read_xoff) * zoom_factor
+        return (
+            slice(top, top + self.ysize * zoom_factor),
+            slice(left, left + self.xsize * zoom_factor)
+        )
+
+
+def iter_tile_windows(width, height, tile_size, halo=0):
+    """Yield TileWindow objects covering a width x height raster row by row"""
+    for row, yoff in enumerate(range(0, height, tile_size)):
+        for col, xoff in enumerate(range(0, width, tile_size)):
+            xsize = min(tile_size, width - xoff)
+            ysize = min(tile_size, height - yoff)
+            read_xoff = max(0, xoff - halo)
+            read_yoff = max(0, yoff - halo)
+            read_xend = min(width, xoff + xsize + halo)
+            read_yend = min(height, yoff + ysize + halo)
+            yield TileWindow(
+                row, col, xoff, yoff, xsize, ysize,
+                read_xoff, read_yoff, read_xend - read_xoff, read_yend - read_yoff
+            )
+
+
+def downscale_tile(goc, window, zoom_factor, rsme, nodata_value=None, threshold=0.001, max_iterations=1000, cancel_token=None,
+                   tracer=None):
+    """
+    Downscale one tile read with its halo and return the core of the result
+
+    With a tracer (dem_downscaling_profiling.TraceRecorder), the tile and its
+    iterations are recorded as spans on the calling thread.
+
+    Returns:
+    --------
+    tuple : (core_array, info) where info is the dict returned by downscale_array
+    """
+    with profile_phase(tracer, 'tile', tile=window.tile_id, pixels=int(goc.size) * zoom_factor * zoom_factor,
+                       engine=active_engine()):
+        nodata_mask_orig = build_nodata_mask(goc, nodata_value)
+        dscal, info = downscale_array(
+            goc, zoom_factor, rsme,
+            nodata_value=nodata_value,
+            nodata_mask_orig=nodata_mask_orig,
+            threshold=threshold,
+            max_iterations=max_iterations,
+            cancel_token=cancel_token,
+            tracer=tracer
+        )
+    return dscal[window.core_slices(zoom_factor)], info
+
+
+class PipelineStats:
+    """Thread-safe counters for queue depths, stall times and throughput of a pipeline run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.stall_seconds = {}
+        self.busy_seconds = {}
+        self._depth_samples = {}
+        self.tiles_done = 0
+        self.empty_tiles = 0
+        self.input_pixels = 0
+        self.output_pixels = 0
+        self.iterations = []
+        self.converged = []
+        self.stopped_early = []
+
+    def add_stall(self, stage, seconds):
+        with self._lock:
+            self.stall_seconds[stage] = self.stall_seconds.get(stage, 0.0) + seconds
+
+    def add_busy(self, stage, seconds):
+        with self._lock:
+            self.busy_seconds[stage] = self.busy_seconds.get(stage, 0.0) + seconds
+
+    def sample_depth(self, name, q):
+        with self._lock:
+            self._depth_samples.setdefault(name, []).append(q.qsize())
+
+    def tile_written(self, window, zoom_factor, info):
+        with self._lock:
+            self.tiles_done += 1
+            self.input_pixels += window.xsize * window.ysize
+            self.output_pixels += window.xsize * window.ysize * zoom_factor * zoom_factor
+            self.iterations.append(info['iterations'])
+            self.converged.append(info['converged'])
+            self.stopped_early.append(info['stopped_early'])
+
+    def tile_skipped(self):
+        with self._lock:
+            self.empty_tiles += 1
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    def as_dict(self):
+        """Summary suitable for the result dictionary (times in seconds)"""
+        wall = (self.end_time or time.perf_counter()) - self.start_time
+        with self._lock:
+            depths = {
+                name: {
+                    'max': max(samples) if samples else 0,
+                    'mean': float(np.mean(samples)) if samples else 0.0
+                }
+                for name, samples in self._depth_samples.items()
+            }
+            return {
+                'wall_seconds': wall,
+                'tiles': self.tiles_done,
+                'empty_tiles_skipped': self.empty_tiles,
+                'stall_seconds': dict(self.stall_seconds),
+                'busy_seconds': dict(self.busy_seconds),
+                'queue_depth': depths,
+                'input_mpix_per_s': self.input_pixels / 1e6 / wall if wall > 0 else 0.0,
+                'output_mpix_per_s': self.output_pixels / 1e6 / wall if wall > 0 else 0.0,
+                'max_tile_iterations': max(self.iterations) if self.iterations else 0
+            }
+
+
+def _put(q, item, abort, stats, stage):
+    """Put item on a bounded queue, recording the time spent blocked as a stall"""
+    blocked = 0.0
+    while not abort.is_set():
+        t0 = time.perf_counter()
+        try:
+            q.put(item, timeout=_QUEUE_POLL_INTERVAL)
+            stats.add_stall(stage, blocked + time.perf_counter() - t0)
+            return True
+        except queue.Full:
+            blocked += time.perf_counter() - t0
+    stats.add_stall(stage, blocked)
+    return False
+
+
+def _get(q, abort, stats, stage):
+    """Get an item from a queue, recording the time spent waiting as a stall"""
+    waited = 0.0
+    while not abort.is_set():
+        t0 = time.perf_counter()
+        try:
+            item = q.get(timeout=_QUEUE_POLL_INTERVAL)
+            stats.add_stall(stage, waited + time.perf_counter() - t0)
+            return item
+        except queue.Empty:
+            waited += time.perf_counter() - t0
+    stats.add_stall(stage, waited)
+    return _END_OF_STREAM
+
+
+def _default_workers():
+    return max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def chunk_directory(output_file):
+    """Directory holding the per-tile chunks of output_file in output_mode='chunks'"""
+    return os.path.splitext(output_file)[0] + "_chunks"
+
+
+def assemble_chunks(chunk_files, output_file, cog=False, progress_callback=None, output_bounds=None):
+    """
+    Stitch tile chunks into the final product
+
+    Builds a VRT mosaic over the chunks. If output_file ends with .vrt the VRT is
+    the product and the chunks are kept next to it. Otherwise the VRT is
+    translated into output_file (a Cloud Optimized GeoTIFF if cog is True, else
+    a tiled GeoTIFF) and the chunks are deleted.
+
+    output_bounds (minx, miny, maxx, maxy) fixes the mosaic extent when some
+    tiles were skipped as empty; the gaps then read as nodata.
+
+    Returns:
+    --------
+    str : Path of the final product
+    """
+    if progress_callback:
+        progress_callback(f"Assembling {len(chunk_files)} chunks...", 99)
+
+    keep_vrt = output_file.lower().endswith('.vrt')
+    vrt_file = output_file if keep_vrt else os.path.splitext(output_file)[0] + "_mosaic.vrt"
+    vrt = gdal.BuildVRT(vrt_file, sorted(chunk_files), outputBounds=output_bounds)
+    if vrt is None:
+        raise Exception(f"Error building VRT mosaic: {vrt_file}")
+    vrt = None
+
+    if keep_vrt:
+        return output_file
+
+    if os.path.isfile(output_file):
+        os.remove(output_file)
+    if cog:
+        out = gdal.Translate(output_file, vrt_file, format='COG', creationOptions=COG_CREATION_OPTIONS)
+    else:
+        out = gdal.Translate(
+            output_file, vrt_file, format='GTiff',
+            creationOptions=DEFAULT_CREATION_OPTIONS + ['NUM_THREADS=ALL_CPUS']
+        )
+    if out is None:
+        raise Exception(f"Error translating VRT mosaic to {output_file}")
+    out = None
+
+    gdal.Unlink(vrt_file)
+    shutil.rmtree(os.path.dirname(chunk_files[0]), ignore_errors=True)
+    return output_file
+
+
+def downscale_dem_pipelined(input_file, output_file, zoom_factor, rsme, threshold=0.001, progress_callback=None,
+                            max_iterations=1000, tile_size=512, halo=16, workers=None, queue_depth=4,
+                            creation_options=None, output_mode='single', cog=False, skip_empty=False,
+                            cancel_token=None, trace=False):
+    """
+    Downscale a DEM tile by tile with read-ahead and write-behind I/O
+
+    If the run fails or is cancelled, the partially written output and the
+    chunk directory are removed.
+
+    Parameters:
+    -----------
+    input_file, output_file, zoom_factor, rsme, threshold, progress_callback, max_iterations :
+        As for downscale_dem
+    tile_size : int
+        Tile edge length in input pixels
+    halo : int
+        Extra input pixels read around each tile. Larger halos reduce the seam
+        differences to downscale_dem at the cost of overlapping work
+    workers : int or None
+        Number of compute workers (default: cores - 1, at most 4)
+    queue_depth : int
+        Capacity of the read and write queues
+    creation_options : list or None
+        GeoTIFF creation options (default: DEFAULT_CREATION_OPTIONS)
+    output_mode : str
+        'single' writes all tiles through one writer thread into output_file.
+        'chunks' lets each worker write its tiles as separate GeoTIFFs in
+        parallel, then stitches them with assemble_chunks
+    cog : bool
+        With output_mode='chunks', translate the mosaic into a Cloud Optimized GeoTIFF
+    skip_empty : bool
+        Skip tiles whose read window GDAL reports as empty (see block_is_empty).
+        They are never decoded or downscaled, and are left as sparse nodata
+        blocks in the output
+    cancel_token : CancellationToken or None
+        Checked by the reader and the compute workers; cancelling stops all stages
+        and raises DownscalingCancelled, pausing suspends them. finish() is seen
+        by every tile, so tiles not started yet stop after one iteration and the
+        result is marked stopped_early
+    trace : bool
+        Write a Chrome trace-event file next to the output (see
+        dem_downscaling_algorithm.default_trace_file) with a span for every
+        tile read, computed and written, its iterations, and every wait on a
+        queue, per thread
+
+    Returns:
+    --------
+    dict : Result information as for downscale_dem plus 'tiles' and 'pipeline_stats'
+        (and 'trace_file' with trace)
+    """
+    if output_mode not in ('single', 'chunks'):
+        raise ValueError(f"Unknown output_mode: {output_mode} (expected 'single' or 'chunks')")
+    emit = progress_emitter(progress_callback)
+    progress_callback = message_callback(emit)
+    if workers is None:
+        workers = _default_workers()
+    if creation_options is None:
+        creation_options = DEFAULT_CREATION_OPTIONS
+    if skip_empty:
+        creation_options = list(creation_options) + ['SPARSE_OK=TRUE']
+
+    raster_info = get_raster_info(input_file)
+    width, height = raster_info['width'], raster_info['height']
+    nodata_value = raster_info['nodata_value']
+    windows = list(iter_tile_windows(width, height, tile_size, halo))
+
+    src_ds = open_raster(input_file)
+    geotnew = downscaled_geo_transform(src_ds.GetGeoTransform(), zoom_factor)
+    proj = src_ds.GetProjection()
+    src_ds = None
+
+    outds = None
+    chunk_dir = None
+    chunk_files = []
+    output_started = False  # output_file has been (re)created by this run
+    completed = False
+    try:
+        if output_mode == 'single':
+            driver = gdal.GetDriverByName("GTiff")
+            output_started = True
+            if os.path.isfile(output_file):
+                os.remove(output_file)  # never write through a hard link to a cached result
+            outds = driver.Create(
+                output_file,
+                xsize=width * zoom_factor,
+                ysize=height * zoom_factor,
+                bands=1,
+                eType=gdal.GDT_Float32,
+                options=creation_options
+            )
+            if outds is None:
+                raise Exception(f"Error creating output raster: {output_file}")
+            outds.SetGeoTransform(geotnew)
+            outds.SetProjection(proj)
+            outds.GetRasterBand(1).SetNoDataValue(nodata_value if nodata_value is not None else -9999)
+        else:
+            chunk_dir = chunk_directory(output_file)
+            os.makedirs(chunk_dir, exist_ok=True)
+
+        stats = PipelineStats()
+        tracer = TraceRecorder(process_name=f"pipeline {os.path.basename(input_file)}") if trace else None
+        abort = threading.Event()
+        errors = []
+        read_queue = queue.Queue(maxsize=queue_depth)
+        write_queue = queue.Queue(maxsize=queue_depth)
+
+        if progress_callback:
+            progress_callback(
+                f"Processing {len(windows)} tiles with {workers} worker(s), "
+                f"read-ahead/write-behind queues of {queue_depth}"
+                f"{', parallel chunk writers' if output_mode == 'chunks' else ''}...",
+                0
+            )
+
+        def fail(exc):
+            errors.append(exc)
+            abort.set()
+
+        def reader():
+            try:
+                # GDAL dataset handles are not thread-safe, so the reader opens its own
+                ds = open_raster(input_file)
+                band = ds.GetRasterBand(1)
+                for window in windows:
+                    if abort.is_set():
+                        break
+                    if cancel_token is not None:
+                        cancel_token.check()
+                    t0 = time.perf_counter()
+                    if skip_empty and block_is_empty(band, window.read_xoff, window.read_yoff,
+                                                     window.read_xsize, window.read_ysize):
+                        stats.add_busy('read', time.perf_counter() - t0)
+                        stats.tile_skipped()
+                        if tracer is not None:
+                            tracer.add_span('skip_tile', t0, time.perf_counter(), {'tile': window.tile_id})
+                        continue
+                    goc = band.ReadAsArray(window.read_xoff, window.read_yoff, window.read_xsize, window.read_ysize)
+                    t1 = time.perf_counter()
+                    stats.add_busy('read', t1 - t0)
+                    if tracer is not None:
+                        tracer.add_span('read_tile', t0, t1, {'tile': window.tile_id, 'pixels': int(goc.size)})
+                    with profile_phase(tracer, 'wait', queue='read_blocked'):
+                        if not _put(read_queue, (window, goc), abort, stats, 'read_blocked'):
+                            break
+                    stats.sample_depth('read', read_queue)
+                ds = None
+            except Exception as e:
+                fail(e)
+            finally:
+                for _ in range(workers):
+                    _put(read_queue, _END_OF_STREAM, abort, stats, 'read_blocked')
+
+        def report_tile(window, info):
+            if emit:
+                done = stats.tiles_done + stats.empty_tiles
+                emit(TileDone(done, len(windows), tile_id=window.tile_id, iterations=info['iterations'],
+                              percentage=done / len(windows) * 98))
+
+        def write_chunk(window, core, info):
+            chunk_file = os.path.join(chunk_dir, f"tile_{window.row:05d}_{window.col:05d}.tif")
+            chunk_geot = window_geo_transform(geotnew, window.xoff * zoom_factor, window.yoff * zoom_factor)
+            t0 = time.perf_counter()
+            create_raster(chunk_file, core, chunk_geot, proj, nodata_value, creation_options=creation_options)
+            t1 = time.perf_counter()
+            stats.add_busy('write', t1 - t0)
+            if tracer is not None:
+                tracer.add_span('write_tile', t0, t1, {'tile': window.tile_id, 'pixels': int(core.size)})
+            chunk_files.append(chunk_file)
+            stats.tile_written(window, zoom_factor, info)
+            report_tile(window, info)
+
+        def compute():
+            try:
+                while True:
+                    with profile_phase(tracer, 'wait', queue='compute_starved'):
+                        item = _get(read_queue, abort, stats, 'compute_starved')
+                    if item is _END_OF_STREAM:
+                        break
+                    window, goc = item
+                    t0 = time.perf_counter()
+                    core, info = downscale_tile(
+                        goc, window, zoom_factor, rsme,
+                        nodata_value=nodata_value, threshold=threshold, max_iterations=max_iterations,
+                        cancel_token=cancel_token, tracer=tracer
+                    )
+                    stats.add_busy('compute', time.perf_counter() - t0)
+                    if output_mode == 'chunks':
+                        write_chunk(window, core, info)
+                        continue
+                    with profile_phase(tracer, 'wait', queue='compute_blocked'):
+                        if not _put(write_queue, (window, core, info), abort, stats, 'compute_blocked'):
+                            break
+                    stats.sample_depth('write', write_queue)
+            except Exception as e:
+                fail(e)
+            finally:
+                if output_mode == 'single':
+                    _put(write_queue, _END_OF_STREAM, abort, stats, 'compute_blocked')
+
+        def writer():
+            try:
+                band = outds.GetRasterBand(1)
+                finished_workers = 0
+                while finished_workers < workers:
+                    with profile_phase(tracer, 'wait', queue='write_starved'):
+                        item = _get(write_queue, abort, stats, 'write_starved')
+                    if item is _END_OF_STREAM:
+                        if abort.is_set():
+                            break
+                        finished_workers += 1
+                        continue
+                    window, core, info = item
+                    t0 = time.perf_counter()
+                    band.WriteArray(core, window.xoff * zoom_factor, window.yoff * zoom_factor)
+                    t1 = time.perf_counter()
+                    stats.add_busy('write', t1 - t0)
+                    if tracer is not None:
+                        tracer.add_span('write_tile', t0, t1, {'tile': window.tile_id, 'pixels': int(core.size)})
+                    stats.tile_written(window, zoom_factor, info)
+                    report_tile(window, info)
+            except Exception as e:
+                fail(e)
+
+        reader_thread = threading.Thread(target=reader, name="dem-reader", daemon=True)
+        reader_thread.start()
+        writer_thread = None
+        if output_mode == 'single':
+            writer_thread = threading.Thread(target=writer, name="dem-writer", daemon=True)
+            writer_thread.start()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dem-compute") as pool:
+            for _ in range(workers):
+                pool.submit(compute)
+        reader_thread.join()
+        if writer_thread is not None:
+            writer_thread.join()
+
+        t0 = time.perf_counter()
+        if outds is not None:
+            # Flush and close the output (compression of the last blocks happens here)
+            outds.FlushCache()
+            outds = None
+        elif not errors:
+            if not chunk_files:
+                raise Exception(f"Input DEM contains no valid data: {input_file}")
+            out_w, out_h = width * zoom_factor, height * zoom_factor
+            corners_x = [geotnew[0] + px * geotnew[1] + py * geotnew[2] for px, py in ((0, 0), (out_w, out_h))]
+            corners_y = [geotnew[3] + px * geotnew[4] + py * geotnew[5] for px, py in ((0, 0), (out_w, out_h))]
+            output_bounds = (min(corners_x), min(corners_y), max(corners_x), max(corners_y))
+            output_started = True
+            output_file = assemble_chunks(
+                chunk_files, output_file, cog=cog, progress_callback=progress_callback,
+                output_bounds=output_bounds
+            )
+        stats.add_busy('write' if output_mode == 'single' else 'assemble', time.perf_counter() - t0)
+        if tracer is not None:
+            tracer.add_span('flush' if output_mode == 'single' else 'assemble', t0, time.perf_counter())
+        stats.finish()
+
+        if errors:
+            raise errors[0]
+
+        pipeline_stats = stats.as_dict()
+        if progress_callback:
+            stalls = pipeline_stats['stall_seconds']
+            progress_callback(
+                f"Completed! {pipeline_stats['tiles']} tiles in {pipeline_stats['wall_seconds']:.1f} s "
+                f"({pipeline_stats['output_mpix_per_s']:.2f} output Mpix/s, "
+                f"compute starved {stalls.get('compute_starved', 0.0):.1f} s, "
+                f"write starved {stalls.get('write_starved', 0.0):.1f} s)",
+                100
+            )
+
+        result = {
+            'iterations': pipeline_stats['max_tile_iterations'],
+            'final_energy': None,
+            'output_file': output_file,
+            'input_size': (width, height),
+            'output_size': (width * zoom_factor, height * zoom_factor),
+            'converged': all(stats.converged),
+            'stopped_early': any(stats.stopped_early),
+            'nodata_preserved': nodata_value is not None,
+            'tiles': len(windows),
+            'pipeline_stats': pipeline_stats
+        }
+        completed = True
+    finally:
+        if not completed:
+            # Do not leave a partial output or orphaned chunks behind after an error or cancellation
+            outds = None
+            if output_started:
+                for path in (output_file, os.path.splitext(output_file)[0] + "_mosaic.vrt"):
+                    if os.path.isfile(path):
+                        os.remove(path)
+            if chunk_dir is not None:
+                shutil.rmtree(chunk_dir, ignore_errors=True)
+    if tracer is not None:
+        tracer.metadata.update({
+            'input_file': input_file,
+            'engine': active_engine(),
+            'zoom_factor': zoom_factor,
+            'workers': workers,
+            'tile_size': tile_size,
+            'output_mode': output_mode
+        })
+        result['trace_file'] = tracer.write(default_trace_file(output_file))
+    return result
+
+
+def extent_to_window(geot, extent, width, height, margin=0):
+    """
+    Pixel window of a raster covering a map extent
+
+    Parameters:
+    -----------
+    geot : tuple
+        Geo transform of the raster (north-up)
+    extent : tuple
+        (xmin, ymin, xmax, ymax) in the raster CRS
+    width, height : int
+        Raster size
+    margin : int
+        Extra pixels added on every side
+
+    Returns:
+    --------
+    tuple or None : (xoff, yoff, xsize, ysize) clipped to the raster, or None if
+        the extent does not overlap it
+    """
+    if geot[2] != 0 or geot[4] != 0:
+        raise ValueError("Rotated rasters are not supported for windowed processing")
+    xmin, ymin, xmax, ymax = extent
+    cols = sorted(((xmin - geot[0]) / geot[1], (xmax - geot[0]) / geot[1]))
+    rows = sorted(((ymax - geot[3]) / geot[5], (ymin - geot[3]) / geot[5]))
+    x0 = max(0, int(np.floor(cols[0])) - margin)
+    y0 = max(0, int(np.floor(rows[0])) - margin)
+    x1 = min(width, int(np.ceil(cols[1])) + margin)
+    y1 = min(height, int(np.ceil(rows[1])) + margin)
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def read_window(input_file, xoff, yoff, xsize, ysize, max_pixels=None):
+    """
+    Read a window of band 1, decimated if it has more than max_pixels pixels
+
+    Decimated reads let GDAL pick overviews where the input has them, so large
+    windows of large rasters are cheap to read.
+
+    Returns:
+    --------
+    tuple : (array, nodata_value, geot, decimation) - geot is the geo transform
+        of the returned array, decimation the pixel size factor (1 = full resolution)
+    """
+    decimation = 1
+    if max_pixels is not None and xsize * ysize > max_pixels:
+        decimation = int(np.ceil(np.sqrt(xsize * ysize / max_pixels)))
+    buf_xsize = max(1, xsize // decimation)
+    buf_ysize = max(1, ysize // decimation)
+
+    ds = open_raster(input_file)
+    band = ds.GetRasterBand(1)
+    nodata_value = band.GetNoDataValue()
+    geot = ds.GetGeoTransform()
+    if decimation == 1:
+        data = band.ReadAsArray(xoff, yoff, xsize, ysize)
+    else:
+        data = band.ReadAsArray(xoff, yoff, xsize, ysize, buf_xsize=buf_xsize, buf_ysize=buf_ysize)
+    ds = None
+    if data is None:
+        raise Exception(f"Error reading window of {input_file}")
+
+    window_geot = window_geo_transform(geot, xoff, yoff)
+    window_geot = (
+        window_geot[0], geot[1] * xsize / buf_xsize, window_geot[2],
+        window_geot[3], window_geot[4], geot[5] * ysize / buf_ysize
+    )
+    return data, nodata_value, window_geot, decimation
+
+
+def downscale_array_tiled(goc, zoom_factor, rsme, nodata_value=None, threshold=0.001, max_iterations=1000,
+                          tile_size=512, halo=16, workers=None, progress_callback=None, cancel_token=None,
+                          tracer=None):
+    """
+    Downscale an in-memory DEM tile by tile on a thread pool
+
+    With a tracer (dem_downscaling_profiling.TraceRecorder), every tile is
+    recorded as a span on the worker thread that computed it.
+
+    Returns:
+    --------
+    tuple : (dscal, info) - info holds iterations (maximum over tiles), converged
+        (all tiles), stopped_early (any tile) and tiles. CancellationToken.finish()
+        applies to every tile, including those not started yet, which then stop
+        after one iteration
+    """
+    if workers is None:
+        workers = _default_workers()
+    emit = progress_emitter(progress_callback)
+    height, width = goc.shape
+    windows = list(iter_tile_windows(width, height, tile_size, halo))
+    dscal = np.empty((height * zoom_factor, width * zoom_factor), dtype=np.float64)
+
+    def run(window):
+        sub = goc[window.read_yoff:window.read_yoff + window.read_ysize,
+                  window.read_xoff:window.read_xoff + window.read_xsize]
+        core, info = downscale_tile(
+            sub, window, zoom_factor, rsme,
+            nodata_value=nodata_value, threshold=threshold, max_iterations=max_iterations,
+            cancel_token=cancel_token, tracer=tracer
+        )
+        dscal[window.yoff * zoom_factor:(window.yoff + window.ysize) * zoom_factor,
+              window.xoff * zoom_factor:(window.xoff + window.xsize) * zoom_factor] = core
+        return window, info
+
+    iterations = 0
+    converged = True
+    stopped_early = False
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dem-compute") as pool:
+        futures = [pool.submit(run, window) for window in windows]
+        for done, future in enumerate(as_completed(futures), 1):
+            window, info = future.result()
+            iterations = max(iterations, info['iterations'])
+            converged = converged and info['converged']
+            stopped_early = stopped_early or info['stopped_early']
+            if emit:
+                emit(TileDone(done, len(windows), tile_id=window.tile_id, iterations=info['iterations'],
+                              percentage=done / len(windows) * 90))
+
+    return dscal, {'iterations': iterations, 'converged': converged, 'stopped_early': stopped_early,
+                   'tiles': len(windows)}
+
+
+def downscale_preview(input_file, output_file, zoom_factor, rsme, extent=None, max_input_pixels=256 * 256,
+                      max_iterations=30, threshold=0.001, tile_size=128, halo=8, progress_callback=None,
+                      cancel_token=None):
+    """
+    Quick look at the result of a parameter set
+
+    Downscales either the part of the input inside extent (windowed read) or,
+    without extent, the whole input. Windows with more than max_input_pixels
+    pixels are decimated first, and the iterations are capped, so the preview
+    takes seconds whatever the size of the input.
+
+    Parameters:
+    -----------
+    input_file, output_file, zoom_factor, rsme, threshold, progress_callback, cancel_token :
+        As for downscale_dem
+    extent : tuple or None
+        (xmin, ymin, xmax, ymax) in the raster CRS, e.g. the map canvas extent
+    max_input_pixels : int
+        Input pixels above which the window is decimated
+    max_iterations : int
+        Iteration cap per tile
+    tile_size, halo :
+        Tiling of the preview (see downscale_dem_pipelined)
+
+    Returns:
+    --------
+    dict : output_file, window (input pixels), decimation, iterations, converged,
+        output_size and seconds
+    """
+    t0 = time.perf_counter()
+    progress_callback = message_callback(progress_callback)
+    info = get_raster_info(input_file)
+    window = (0, 0, info['width'], info['height'])
+    if extent is not None:
+        src_ds = open_raster(input_file)
+        geot = src_ds.GetGeoTransform()
+        src_ds = None
+        window = extent_to_window(geot, extent, info['width'], info['height'])
+        if window is None:
+            raise ValueError("The preview extent does not overlap the input DEM")
+
+    goc, nodata_value, geot_window, decimation = read_window(input_file, *window, max_pixels=max_input_pixels)
+    if progress_callback:
+        detail = f", decimated 1:{decimation}" if decimation > 1 else ""
+        progress_callback(f"Preview of {goc.shape[1]}x{goc.shape[0]} input pixels{detail}...", 5)
+
+    src_ds = open_raster(input_file)
+    proj = src_ds.GetProjection()
+    src_ds = None
+
+    dscal, run_info = downscale_array_tiled(
+        goc, zoom_factor, rsme,
+        nodata_value=nodata_value, threshold=threshold, max_iterations=max_iterations,
+        tile_size=tile_size, halo=halo, progress_callback=progress_callback, cancel_token=cancel_token
+    )
+    create_raster(output_file, dscal, downscaled_geo_transform(geot_window, zoom_factor), proj, nodata_value)
+
+    seconds = time.perf_counter() - t0
+    if progress_callback:
+        progress_callback(f"Preview ready in {seconds:.1f} s", 100)
+    return {
+        'output_file': output_file,
+        'window': window,
+        'decimation': decimation,
+        'iterations': run_info['iterations'],
+        'converged': run_info['converged'],
+        'output_size': (dscal.shape[1], dscal.shape[0]),
+        'seconds': seconds
+    }
@@ -0,0 +1,156 @@
+"""
+QGIS Processing algorithm wrapping downscale_dem
+"""
+import os
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterRasterDestination,
+    QgsProcessingParameterDefinition,
+    QgsProcessingOutputNumber,
+    QgsProcessingOutputBoolean
+)
+
+from .dem_downscaling_algorithm import downscale_dem, CancellationToken, DownscalingCancelled
+
+
+class DownscaleDemAlgorithm(QgsProcessingAlgorithm):
+    """
+    Processing algorithm for DEM downscaling
+
+    Every run works on its own GDAL handles and keeps no state on the instance,
+    so the batch executor can run several instances concurrently.
+    """
+
+    INPUT = 'INPUT'
+    ZOOM = 'ZOOM'
+    RSME = 'RSME'
+    THRESHOLD = 'THRESHOLD'
+    MAX_ITERATIONS = 'MAX_ITERATIONS'
+    OUTPUT = 'OUTPUT'
+    ITERATIONS = 'ITERATIONS'
+    FINAL_ENERGY = 'FINAL_ENERGY'
+    CONVERGED = 'CONVERGED'
+
+    def tr(self, string):
+        return QCoreApplication.translate('DownscaleDemAlgorithm', string)
+
+    def createInstance(self):
+        return DownscaleDemAlgorithm()
+
+    def name(self):
+        return 'downscaledem'
+
+    def displayName(self):
+        return self.tr('Downscale DEM')
+
+    def group(self):
+        return self.tr('Resolution enhancement')
+
+    def groupId(self):
+        return 'resolutionenhancement'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), 'icon.png'))
+
+    def shortHelpString(self):
+        return self.tr(
+            "Increases DEM resolution using the Hopfield Neural Network method "
+            "(spatial dependence maximization with elevation constraints).\n\n"
+            "Zoom factor: resolution increase factor (e.g. 4 = 4x finer cells).\n"
+            "RSME: RSME parameter of the elevation constraint.\n"
+            "Threshold / maximum iterations: stopping criteria of the optimization loop.\n\n"
+            "Reference: Nguyen Quang Minh et al., Downscaling Gridded DEMs Using the "
+            "Hopfield Neural Network, IEEE JSTARS 12(11), 2019."
+        )
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterRasterLayer(
+            self.INPUT, self.tr('Input DEM')))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.ZOOM, self.tr('Resolution increase factor (zoom)'),
+            type=QgsProcessingParameterNumber.Integer, defaultValue=4, minValue=2, maxValue=10))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.RSME, self.tr('RSME parameter'),
+            type=QgsProcessingParameterNumber.Double, defaultValue=4.0, minValue=0.01))
+
+        threshold = QgsProcessingParameterNumber(
+            self.THRESHOLD, self.tr('Energy change threshold'),
+            type=QgsProcessingParameterNumber.Double, defaultValue=0.001, minValue=0.0)
+        threshold.setFlags(threshold.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(threshold)
+
+        max_iterations = QgsProcessingParameterNumber(
+            self.MAX_ITERATIONS, self.tr('Maximum iterations'),
+            type=QgsProcessingParameterNumber.Integer, defaultValue=1000, minValue=1)
+        max_iterations.setFlags(max_iterations.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(max_iterations)
+
+        self.addParameter(QgsProcessingParameterRasterDestination(
+            self.OUTPUT, self.tr('Downscaled DEM')))
+
+        self.addOutput(QgsProcessingOutputNumber(self.ITERATIONS, self.tr('Iterations')))
+        self.addOutput(QgsProcessingOutputNumber(self.FINAL_ENERGY, self.tr('Final energy')))
+        self.addOutput(QgsProcessingOutputBoolean(self.CONVERGED, self.tr('Converged')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        layer = self.parameterAsRasterLayer(parameters, self.INPUT, context)
+        if layer is None:
+            raise QgsProcessingException(self.invalidRasterError(parameters, self.INPUT))
+        input_file = layer.source()
+        if not os.path.exists(input_file):
+            raise QgsProcessingException(self.tr(f'Input DEM must be a file on disk: {input_file}'))
+
+        output_file = self.parameterAsOutputLayer(parameters, self.OUTPUT, context)
+
+        def progress_callback(message, percentage):
+            feedback.setProgress(percentage)
+            feedback.setProgressText(message)
+
+        # One token per run, so concurrent batch runs cancel independently
+        cancel_token = CancellationToken()
+        feedback.canceled.connect(cancel_token.cancel)
+        if feedback.isCanceled():
+            cancel_token.cancel()
+
+        try:
+            result = downscale_dem(
+                input_file=input_file,
+                output_file=output_file,
+                zoom_factor=self.parameterAsInt(parameters, self.ZOOM, context),
+                rsme=self.parameterAsDouble(parameters, self.RSME, context),
+                threshold=self.parameterAsDouble(parameters, self.THRESHOLD, context),
+                max_iterations=self.parameterAsInt(parameters, self.MAX_ITERATIONS, context),
+                progress_callback=progress_callback,
+                cancel_token=cancel_token
+            )
+        except DownscalingCancelled:
+            raise QgsProcessingException(self.tr('Processing cancelled'))
+        finally:
+            feedback.canceled.disconnect(cancel_token.cancel)
+
+        if result.get('stopped_early'):
+            feedback.reportError(
+                self.tr(f"Stopped early on request after {result['iterations']} iterations. "
+                        f"The output is the surface reached so far and has not converged."),
+                fatalError=False
+            )
+        elif not result['converged']:
+            feedback.reportError(
+                self.tr(f"Reached maximum iterations ({result['iterations']}). "
+                        f"Algorithm may not have converged."),
+                fatalError=False
+            )
+
+        return {
+            self.OUTPUT: result['output_file'],
+            self.ITERATIONS: result['iterations'],
+            self.FINAL_ENERGY: float(result['final_energy']) if result['final_energy'] is not None else None,
+            self.CONVERGED: bool(result['converged'])
+        }
@@ -0,0 +1,388 @@
+"""
+Time and memory profiling of downscaling runs
+
+The algorithm wraps every phase of a run (read, mask, initialize, and per
+iteration spatial_dependence, elevation_constraint, energy, update,
+nodata_restore; then write) in profile_phase(recorder, name). A recorder is any
+object with a phase(name, **meta) context manager:
+
+- PhaseTimer accumulates wall time per phase, optionally per iteration; it is
+  cheap enough to be always on and ends up in result['timings']
+- MemoryProfiler records the peak memory allocated through Python/NumPy
+  (tracemalloc) and the peak resident set size of the process (sampled in a
+  background thread, when psutil is available)
+- TraceRecorder records every phase as a span on the thread that ran it and
+  writes a Chrome trace-event file for chrome://tracing, Perfetto or speedscope
+
+combine_recorders() merges several recorders into one. Without a recorder,
+profile_phase returns a shared no-op context manager.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+MB = 1024 * 1024
+
+_NO_PROFILING = contextlib.nullcontext()
+
+
+def profile_phase(recorder, name, **meta):
+    """Context manager measuring phase name on recorder (no-op when recorder is None)"""
+    if recorder is None:
+        return _NO_PROFILING
+    return recorder.phase(name, **meta)
+
+
+class _CombinedRecorder:
+    """Enters every phase on several recorders"""
+
+    def __init__(self, recorders):
+        self.recorders = recorders
+
+    @contextlib.contextmanager
+    def phase(self, name, **meta):
+        with contextlib.ExitStack() as stack:
+            for recorder in self.recorders:
+                stack.enter_context(recorder.phase(name, **meta))
+            yield
+
+
+def combine_recorders(*recorders):
+    """One recorder for all given recorders (None entries are skipped); None if there are none"""
+    recorders = [recorder for recorder in recorders if recorder is not None]
+    if not recorders:
+        return None
+    if len(recorders) == 1:
+        return recorders[0]
+    return _CombinedRecorder(recorders)
+
+
+class _TimedPhase:
+    """Context manager of one PhaseTimer phase (a class: cheaper than a generator)"""
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        if self.name == 'iteration' and self.timer.per_iteration:
+            self.timer.iterations.append({})
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer:
+    """
+    Wall time per phase of a run
+
+    Every phase keeps its number of calls, total, mean and maximum time. With
+    per_iteration, each 'iteration' phase also starts a new entry of
+    iterations: a dict of the time spent in every phase of that iteration.
+    """
+
+    def __init__(self, per_iteration=False):
+        self.per_iteration = per_iteration
+        self.phases = {}
+        self.iterations = []
+        self.last = {}
+        self.start_time = time.perf_counter()
+
+    def phase(self, name, **meta):
+        return _TimedPhase(self, name)
+
+    def add(self, name, seconds):
+        """Account seconds to phase name (and to the current iteration)"""
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+        self.last[name] = seconds
+        if self.per_iteration and self.iterations and name != 'iteration':
+            current = self.iterations[-1]
+            current[name] = current.get(name, 0.0) + seconds
+
+    def seconds(self, name):
+        """Total time of phase name so far"""
+        stats = self.phases.get(name)
+        return stats[1] if stats else 0.0
+
+    def last_seconds(self, name):
+        """Time of the most recent call of phase name"""
+        return self.last.get(name, 0.0)
+
+    def as_dict(self):
+        """Summary for the result dictionary (times in seconds)"""
+        timings = {
+            'total_seconds': time.perf_counter() - self.start_time,
+            'phases': {
+                name: {'calls': calls, 'seconds': total, 'mean_seconds': total / calls, 'max_seconds': longest}
+                for name, (calls, total, longest) in self.phases.items()
+            }
+        }
+        if self.per_iteration:
+            timings['iterations'] = [dict(iteration) for iteration in self.iterations]
+        return timings
+
+
+def format_timings(timings, phases=None):
+    """One-line summary of PhaseTimer.as_dict(): 'read 0.12 s, initialize 0.03 s, ...'"""
+    names = phases or [name for name in timings['phases'] if name != 'iteration']
+    parts = [
+        f"{name} {timings['phases'][name]['seconds']:.2f} s"
+        for name in names if name in timings['phases']
+    ]
+    return ", ".join(parts)
+
+
+class MemoryProfiler:
+    """
+    Peak memory per phase of a run
+
+    tracemalloc peaks are relative to the traced memory when start() was called,
+    i.e. they count the arrays allocated by the run, which is what
+    estimate_memory_usage models. RSS peaks are absolute and also include GDAL
+    block caches and other native allocations that tracemalloc does not see.
+    A phase entered several times (e.g. once per iteration) keeps its maximum.
+    """
+
+    def __init__(self, sample_rss=True, sample_interval=0.005):
+        self.sample_rss = sample_rss and PSUTIL_AVAILABLE
+        self.sample_interval = sample_interval
+        self.phases = {}
+        self.peak_traced_bytes = 0
+        self.peak_rss_bytes = 0
+        self._baseline = 0
+        self._started_tracing = False
+        self._process = psutil.Process() if self.sample_rss else None
+        self._phase_rss_peak = 0
+        self._stack = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _rss(self):
+        return self._process.memory_info().rss
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            rss = self._rss()
+            self._phase_rss_peak = max(self._phase_rss_peak, rss)
+            self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+
+    def start(self):
+        """Start tracing allocations (and sampling RSS)"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        if self.sample_rss:
+            self.peak_rss_bytes = self._phase_rss_peak = self._rss()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling; stops tracemalloc if start() started it"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        if tracemalloc.is_tracing():
+            self.peak_traced_bytes = max(self.peak_traced_bytes, tracemalloc.get_traced_memory()[1] - self._baseline)
+            if self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    @contextlib.contextmanager
+    def phase(self, name, **meta):
+        """Record the peak memory while the body runs under phase name (phases may nest)"""
+        current, peak = tracemalloc.get_traced_memory()
+        # Keep the run peak (and the enclosing phase's peak) before resetting it for this phase
+        self.peak_traced_bytes = max(self.peak_traced_bytes, peak - self._baseline)
+        if self._stack:
+            self._stack[-1][0] = max(self._stack[-1][0], peak)
+            self._stack[-1][1] = max(self._stack[-1][1], self._phase_rss_peak)
+        tracemalloc.reset_peak()
+        if self.sample_rss:
+            self._phase_rss_peak = self._rss()
+        frame = [0, 0]  # peak traced bytes / RSS of nested phases
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            end, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame[0])
+            self._phase_rss_peak = max(self._phase_rss_peak, frame[1])
+            self.peak_traced_bytes = max(self.peak_traced_bytes, peak - self._baseline)
+            if self._stack:
+                self._stack[-1][0] = max(self._stack[-1][0], peak)
+                self._stack[-1][1] = max(self._stack[-1][1], self._phase_rss_peak)
+            rss = self._rss() if self.sample_rss else 0
+            stats = self.phases.setdefault(name, {
+                'calls': 0, 'peak_traced_bytes': 0, 'transient_bytes': 0, 'retained_bytes': 0, 'peak_rss_bytes': 0
+            })
+            stats['calls'] += 1
+            stats['peak_traced_bytes'] = max(stats['peak_traced_bytes'], peak - self._baseline)
+            # Allocated during the phase and freed before it ended / still held after it
+            stats['transient_bytes'] = max(stats['transient_bytes'], peak - end)
+            stats['retained_bytes'] = max(stats['retained_bytes'], end - current)
+            stats['peak_rss_bytes'] = max(stats['peak_rss_bytes'], self._phase_rss_peak, rss)
+
+    def as_dict(self):
+        """Summary in MB suitable for the result dictionary"""
+        return {
+            'peak_traced_mb': self.peak_traced_bytes / MB,
+            'peak_rss_mb': self.peak_rss_bytes / MB if self.sample_rss else None,
+            'phases': {
+                name: {
+                    'calls': stats['calls'],
+                    'peak_traced_mb': stats['peak_traced_bytes'] / MB,
+                    'transient_mb': stats['transient_bytes'] / MB,
+                    'retained_mb': stats['retained_bytes'] / MB,
+                    'peak_rss_mb': stats['peak_rss_bytes'] / MB if self.sample_rss else None
+                }
+                for name, stats in self.phases.items()
+            }
+        }
+
+
+def format_memory_profile(profile):
+    """Plain-text table of MemoryProfiler.as_dict()"""
+    header = f"{'phase':<22} {'calls':>5} {'peak MB':>9} {'transient MB':>13} {'RSS MB':>8}"
+    lines = [header, '-' * len(header)]
+    for name, stats in profile['phases'].items():
+        rss = f"{stats['peak_rss_mb']:.0f}" if stats['peak_rss_mb'] is not None else '-'
+        lines.append(
+            f"{name:<22} {stats['calls']:>5} {stats['peak_traced_mb']:>9.1f} {stats['transient_mb']:>13.1f} {rss:>8}"
+        )
+    rss = f"{profile['peak_rss_mb']:.0f}" if profile['peak_rss_mb'] is not None else '-'
+    lines.append(f"{'run':<22} {'':>5} {profile['peak_traced_mb']:>9.1f} {'':>13} {rss:>8}")
+    return "\n".join(lines)
+
+
+class _TraceSpan:
+    """Context manager of one TraceRecorder span"""
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.tracer.add_span(self.name, self.start, time.perf_counter(), self.args)
+        return False
+
+
+class TraceRecorder:
+    """
+    Timeline of a run in the Chrome trace-event format
+
+    Every phase becomes a complete ('X') event on the thread that ran it, with
+    the phase metadata (iteration, tile id, pixels, engine, ...) as args, so
+    stragglers among the tiles and threads waiting on I/O show up directly in
+    the viewer. Events carry the process id, and timestamps are microseconds
+    since the Unix epoch (the wall clock at the start of the recorder plus the
+    perf_counter time since), so the traceEvents of several worker processes on
+    one machine can be concatenated into one aligned timeline. Threads may
+    record concurrently: appending to a list is atomic.
+    """
+
+    def __init__(self, process_name=None):
+        self.events = []
+        self.metadata = {}
+        self.pid = os.getpid()
+        self.start_time = time.perf_counter()
+        # Shared epoch: perf_counter values are only comparable within one process
+        self.epoch_us = time.time_ns() / 1000
+        self._threads = set()
+        self._lock = threading.Lock()
+        if process_name:
+            self.events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0,
+                                'args': {'name': process_name}})
+
+    def phase(self, name, **meta):
+        return _TraceSpan(self, name, meta)
+
+    def _thread_id(self):
+        """Id of the calling thread; names the thread in the trace on first use"""
+        tid = threading.get_native_id()
+        if tid not in self._threads:
+            with self._lock:
+                if tid not in self._threads:
+                    self._threads.add(tid)
+                    self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                                        'args': {'name': threading.current_thread().name}})
+        return tid
+
+    def _timestamp(self, counter):
+        """Trace timestamp (microseconds since the Unix epoch) of a time.perf_counter() value"""
+        return self.epoch_us + (counter - self.start_time) * 1e6
+
+    def add_span(self, name, start, end, args=None):
+        """Record a span between two time.perf_counter() values"""
+        event = {
+            'name': name,
+            'ph': 'X',
+            'ts': self._timestamp(start),
+            'dur': (end - start) * 1e6,
+            'pid': self.pid,
+            'tid': self._thread_id()
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def instant(self, name, **meta):
+        """Record a point in time (e.g. a warning) on the calling thread"""
+        event = {
+            'name': name,
+            'ph': 'i',
+            's': 't',
+            'ts': self._timestamp(time.perf_counter()),
+            'pid': self.pid,
+            'tid': self._thread_id()
+        }
+        if meta:
+            event['args'] = meta
+        self.events.append(event)
+
+    def as_dict(self):
+        other_data = dict(self.metadata)
+        other_data['start_time_unix_us'] = self.epoch_us
+        return {'traceEvents': list(self.events), 'displayTimeUnit': 'ms', 'otherData': other_data}
+
+    def write(self, path):
+        """Write the trace as JSON; returns path"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f)
+        return path
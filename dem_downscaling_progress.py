@@ -0,0 +1,348 @@
+"""
+Typed progress events of downscaling runs
+
+Run functions report progress as ProgressEvent objects: status messages, phase
+start/end, per-iteration statistics, finished tiles and warnings. Every event
+has a message and a percentage (None when the event does not move the overall
+progress), so consumers read metrics from attributes instead of parsing text.
+
+progress_callback arguments accept either kind of consumer:
+- a ProgressListener wrapping a function that receives the events
+- a plain function called as callback(message, percentage), as before; the
+  events are converted by LegacyProgressAdapter
+
+Run functions normalize their argument with progress_emitter(), and hand
+message_callback() to helpers that still report plain strings.
+
+ProgressCoalescer decouples a worker thread from a UI: the worker posts events
+at any rate, the UI takes the latest state at its own pace.
+"""
+import math
+import threading
+import time
+
+
+class ProgressEvent:
+    """
+    Base class of progress events
+
+    quiet events are only delivered to ProgressListener consumers: string
+    callbacks already get a status message for the same step.
+    """
+    kind = 'status'
+    quiet = False
+
+    def __init__(self, percentage=None):
+        self.percentage = percentage
+
+    @property
+    def message(self):
+        return ""
+
+    def as_dict(self):
+        """Attributes of the event plus kind and message, e.g. for JSON logs"""
+        data = {key: value for key, value in vars(self).items() if not key.startswith('_')}
+        data['kind'] = self.kind
+        data['message'] = self.message
+        return data
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.message!r}, {self.percentage!r})"
+
+
+class StatusMessage(ProgressEvent):
+    """Free-form status text"""
+    kind = 'status'
+
+    def __init__(self, text, percentage=None):
+        ProgressEvent.__init__(self, percentage)
+        self.text = text
+
+    @property
+    def message(self):
+        return self.text
+
+
+class PhaseStarted(ProgressEvent):
+    """A phase of the run (read, mask, initialize, write, ...) started"""
+    kind = 'phase_started'
+    quiet = True
+
+    def __init__(self, phase, percentage=None, **meta):
+        ProgressEvent.__init__(self, percentage)
+        self.phase = phase
+        self.meta = meta
+
+    @property
+    def message(self):
+        return f"{self.phase}..."
+
+
+class PhaseFinished(ProgressEvent):
+    """A phase of the run ended after seconds"""
+    kind = 'phase_finished'
+    quiet = True
+
+    def __init__(self, phase, seconds, percentage=None):
+        ProgressEvent.__init__(self, percentage)
+        self.phase = phase
+        self.seconds = seconds
+
+    @property
+    def message(self):
+        return f"{self.phase} done ({self.seconds:.2f} s)"
+
+
+class IterationStats(ProgressEvent):
+    """
+    One finished iteration
+
+    delta is the decrease of the energy (the convergence criterion is
+    abs(delta) <= threshold); pixels is the size of the downscaled grid, so
+    pixels / elapsed_seconds is the throughput.
+    """
+    kind = 'iteration'
+
+    def __init__(self, iteration, max_iterations, energy, delta, elapsed_seconds, threshold=None, pixels=None,
+                 percentage=None):
+        ProgressEvent.__init__(self, percentage)
+        self.iteration = iteration
+        self.max_iterations = max_iterations
+        self.energy = energy
+        self.delta = delta
+        self.elapsed_seconds = elapsed_seconds
+        self.threshold = threshold
+        self.pixels = pixels
+
+    @property
+    def mpix_per_s(self):
+        if not self.pixels or not self.elapsed_seconds:
+            return None
+        return self.pixels / self.elapsed_seconds / 1e6
+
+    @property
+    def message(self):
+        return (f"Iteration {self.iteration}/{self.max_iterations}: Energy = {self.energy:.6f}, "
+                f"Change = {self.delta:.6f} ({self.elapsed_seconds:.2f} s)")
+
+
+class TileDone(ProgressEvent):
+    """A tile (or area) of a tiled run is finished"""
+    kind = 'tile_done'
+
+    def __init__(self, done, total, tile_id=None, iterations=None, percentage=None):
+        ProgressEvent.__init__(self, percentage)
+        self.done = done
+        self.total = total
+        self.tile_id = tile_id
+        self.iterations = iterations
+
+    @property
+    def message(self):
+        detail = f" ({self.iterations} iterations)" if self.iterations is not None else ""
+        return f"Tile {self.done}/{self.total} done{detail}"
+
+
+class ProgressWarning(ProgressEvent):
+    """Something the user should know about, e.g. no convergence within max_iterations"""
+    kind = 'warning'
+
+    def __init__(self, text, percentage=None):
+        ProgressEvent.__init__(self, percentage)
+        self.text = text
+
+    @property
+    def message(self):
+        return self.text
+
+
+class ProgressListener:
+    """Marks a function as a consumer of ProgressEvent objects (instead of (message, percentage))"""
+
+    def __init__(self, function):
+        self.function = function
+
+    def __call__(self, event):
+        self.function(event)
+
+
+class LegacyProgressAdapter(ProgressListener):
+    """
+    Delivers events to a callback(message, percentage)
+
+    Events without a percentage are reported with the last known one; quiet
+    events are dropped.
+    """
+
+    def __init__(self, callback):
+        ProgressListener.__init__(self, self._deliver)
+        self.callback = callback
+        self.percentage = 0
+
+    def _deliver(self, event):
+        if event.percentage is not None:
+            self.percentage = event.percentage
+        if not event.quiet:
+            self.callback(event.message, int(self.percentage))
+
+
+class ProgressCoalescer(ProgressListener):
+    """
+    Thread-safe mailbox of the latest progress of a run
+
+    Posting an event only updates a few fields under a lock, so the worker never
+    waits for the consumer. take() returns what changed since the previous call:
+    the latest message and percentage, plus every IterationStats and
+    ProgressWarning since then (they are few and each one matters to the
+    consumer); all other events are coalesced into the latest state.
+    """
+
+    def __init__(self):
+        ProgressListener.__init__(self, self._post)
+        self._lock = threading.Lock()
+        self._message = None
+        self._percentage = 0
+        self._phase = None
+        self._iterations = []
+        self._warnings = []
+        self._changed = False
+
+    def _post(self, event):
+        with self._lock:
+            if event.percentage is not None:
+                self._percentage = event.percentage
+            if isinstance(event, PhaseStarted):
+                self._phase = event.phase
+            elif not event.quiet:
+                self._message = event.message
+            if isinstance(event, IterationStats):
+                self._iterations.append(event)
+            elif isinstance(event, ProgressWarning):
+                self._warnings.append(event)
+            self._changed = True
+
+    @property
+    def percentage(self):
+        return self._percentage
+
+    def take(self):
+        """
+        State since the previous call, or None if nothing was posted
+
+        Returns:
+        --------
+        dict : message, percentage, phase (last phase started), iterations and
+            warnings (lists of events)
+        """
+        with self._lock:
+            if not self._changed:
+                return None
+            state = {
+                'message': self._message,
+                'percentage': self._percentage,
+                'phase': self._phase,
+                'iterations': self._iterations,
+                'warnings': self._warnings
+            }
+            self._iterations = []
+            self._warnings = []
+            self._changed = False
+        return state
+
+
+class _MessageCallback:
+    """(message, percentage) callable emitting StatusMessage events"""
+
+    def __init__(self, emit, keep_percentage):
+        self.emit = emit
+        self.keep_percentage = keep_percentage
+
+    def __call__(self, message, percentage=None):
+        self.emit(StatusMessage(message, None if self.keep_percentage else percentage))
+
+
+def progress_emitter(callback):
+    """
+    Normalize a progress_callback argument into a function taking events
+
+    Returns None for None, the listener itself for a ProgressListener, and a
+    LegacyProgressAdapter for a (message, percentage) callback.
+    """
+    if callback is None or isinstance(callback, ProgressListener):
+        return callback
+    if isinstance(callback, _MessageCallback):
+        return callback.emit
+    return LegacyProgressAdapter(callback)
+
+
+def message_callback(callback, keep_percentage=False):
+    """
+    Normalize a progress_callback argument into a (message, percentage) callable
+
+    For helpers that report plain strings. With keep_percentage, their
+    percentages are ignored, e.g. for the hard-coded percentages of the
+    per-iteration steps.
+    """
+    emit = progress_emitter(callback)
+    if emit is None:
+        return None
+    return _MessageCallback(emit, keep_percentage)
+
+
+class PhaseEventRecorder:
+    """
+    Recorder (see dem_downscaling_profiling.profile_phase) emitting PhaseStarted
+    and PhaseFinished for the phases of a run
+
+    The steps inside an iteration are not reported: IterationStats covers them.
+    """
+
+    def __init__(self, emit):
+        self.emit = emit
+        self._iteration_depth = 0
+
+    def phase(self, name, **meta):
+        return _PhaseEvents(self, name, meta)
+
+
+class _PhaseEvents:
+    __slots__ = ('recorder', 'name', 'meta', 'start', 'reported')
+
+    def __init__(self, recorder, name, meta):
+        self.recorder = recorder
+        self.name = name
+        self.meta = meta
+
+    def __enter__(self):
+        recorder = self.recorder
+        self.reported = recorder._iteration_depth == 0 and self.name != 'iteration'
+        if self.name == 'iteration':
+            recorder._iteration_depth += 1
+        if self.reported:
+            recorder.emit(PhaseStarted(self.name, **self.meta))
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.name == 'iteration':
+            self.recorder._iteration_depth -= 1
+        if self.reported and exc[0] is None:
+            self.recorder.emit(PhaseFinished(self.name, time.perf_counter() - self.start))
+        return False
+
+
+def iteration_fraction(iteration, max_iterations, delta, reference_delta, threshold):
+    """
+    Estimated fraction of the iterations done, in [0, 1]
+
+    The larger of the share of max_iterations used and the convergence
+    progress: how far abs(delta) has come down from reference_delta (the
+    first energy change) towards threshold, on a log scale.
+    """
+    fraction = iteration / max_iterations if max_iterations else 0.0
+    if threshold and threshold > 0 and reference_delta and reference_delta > threshold:
+        delta = abs(delta)
+        if delta <= threshold:
+            return 1.0
+        if delta < reference_delta:
+            fraction = max(fraction, math.log(reference_delta / delta) / math.log(reference_delta / threshold))
+    return min(1.0, fraction)
@@ -0,0 +1,25 @@
+"""
+QGIS Processing provider for the DEM Downscaling plugin
+"""
+import os
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import QgsProcessingProvider
+
+from .dem_downscaling_processing_algorithm import DownscaleDemAlgorithm
+
+
+class DemDownscalingProvider(QgsProcessingProvider):
+    """Makes the downscaler available in the Processing toolbox, batch interface and graphical modeler"""
+
+    def id(self):
+        return 'demdownscaling'
+
+    def name(self):
+        return 'DEM Downscaling'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), 'icon.png'))
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(DownscaleDemAlgorithm())
@@ -0,0 +1,394 @@
+"""
+Repeated downscaling runs on the same input
+
+PreparedInput reads a DEM once and keeps it in memory together with its nodata
+masks and georeferencing, so several runs with different parameters skip the
+raster read and the mask construction.
+
+run_parameter_sweep uses it to calibrate rsme and threshold: it runs every
+combination of a parameter grid and warm-starts each run from the result of
+the nearest combination already completed, which usually needs far fewer
+iterations than starting from the blocky initial surface.
+
+DownscalingSession does the same interactively: the dialog keeps one for the
+current input and zoom, so tweaking rsme or threshold and running again
+continues from the previous result and, from the second rerun on, reuses the
+loaded data.
+"""
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+try:
+    from .dem_downscaling_algorithm import (
+        get_raster_band, get_geo_transform, get_projection, build_nodata_mask,
+        downscaled_geo_transform, downscale_array, create_raster, PSUTIL_AVAILABLE
+    )
+    from .dem_downscaling_profiling import PhaseTimer, profile_phase
+    from .dem_downscaling_progress import message_callback
+except ImportError:
+    from dem_downscaling_algorithm import (
+        get_raster_band, get_geo_transform, get_projection, build_nodata_mask,
+        downscaled_geo_transform, downscale_array, create_raster, PSUTIL_AVAILABLE
+    )
+    from dem_downscaling_profiling import PhaseTimer, profile_phase
+    from dem_downscaling_progress import message_callback
+
+if PSUTIL_AVAILABLE:
+    import psutil
+
+
+class PreparedInput:
+    """Input DEM loaded once, with its nodata masks, for repeated runs"""
+
+    def __init__(self, input_file):
+        self.input_file = input_file
+        self.goc, self.nodata_value = get_raster_band(input_file)
+        self.nodata_mask_orig = build_nodata_mask(self.goc, self.nodata_value)
+        self.geot = get_geo_transform(input_file)
+        self.proj = get_projection(input_file)
+        self._nodata_masks_down = {}
+
+    @property
+    def nbytes(self):
+        """Memory held by the loaded data and masks"""
+        total = self.goc.nbytes
+        if self.nodata_mask_orig is not None:
+            total += self.nodata_mask_orig.nbytes
+        return total + sum(mask.nbytes for mask in self._nodata_masks_down.values() if mask is not None)
+
+    def nodata_mask_down(self, zoom_factor):
+        """Nodata mask of the downscaled grid for zoom_factor (built once per zoom)"""
+        if zoom_factor not in self._nodata_masks_down:
+            if self.nodata_mask_orig is None:
+                mask = None
+            else:
+                mask = np.repeat(np.repeat(self.nodata_mask_orig, zoom_factor, axis=0), zoom_factor, axis=1)
+            self._nodata_masks_down[zoom_factor] = mask
+        return self._nodata_masks_down[zoom_factor]
+
+    def downscale(self, zoom_factor, rsme, threshold=0.001, max_iterations=1000, progress_callback=None,
+                  cancel_token=None, initial_dscal=None, timer=None):
+        """
+        Run downscale_array on the loaded data
+
+        Returns:
+        --------
+        tuple : (dscal, info) as returned by downscale_array
+        """
+        return downscale_array(
+            self.goc, zoom_factor, rsme,
+            nodata_value=self.nodata_value,
+            nodata_mask_orig=self.nodata_mask_orig,
+            threshold=threshold,
+            progress_callback=progress_callback,
+            max_iterations=max_iterations,
+            cancel_token=cancel_token,
+            initial_dscal=initial_dscal,
+            nodata_mask_down=self.nodata_mask_down(zoom_factor),
+            timer=timer
+        )
+
+    def write(self, output_file, dscal, zoom_factor, progress_callback=None):
+        """Write a downscaled result with the georeferencing of the input"""
+        create_raster(
+            output_file, dscal, downscaled_geo_transform(self.geot, zoom_factor), self.proj,
+            self.nodata_value, progress_callback=progress_callback
+        )
+
+
+def _parameter_distance(a, b):
+    """Distance between two (rsme, threshold) combinations on log scales"""
+    return math.hypot(
+        math.log(a[0]) - math.log(b[0]),
+        math.log(max(a[1], 1e-12)) - math.log(max(b[1], 1e-12))
+    )
+
+
+def sweep_output_path(input_file, output_dir, zoom_factor, rsme, threshold):
+    """Output file of one sweep combination: <input name>_z<zoom>_r<rsme>_t<threshold>.tif"""
+    base = os.path.splitext(os.path.basename(input_file))[0]
+    return os.path.join(output_dir, f"{base}_z{zoom_factor}_r{rsme:g}_t{threshold:g}.tif")
+
+
+def run_parameter_sweep(input_file, zoom_factors, rsme_values, thresholds, max_iterations=1000, output_dir=None,
+                        warm_start=True, progress_callback=None, cancel_token=None, prepared=None):
+    """
+    Downscale one DEM for every combination of a parameter grid
+
+    The input is read and its masks are built once. Combinations run in order of
+    zoom, rsme and decreasing threshold; with warm_start each run starts from the
+    result of the nearest completed combination with the same zoom (distance on
+    log rsme / log threshold), so e.g. a tighter threshold continues from the
+    looser one.
+
+    Parameters:
+    -----------
+    input_file : str
+        Path to input DEM file
+    zoom_factors, rsme_values, thresholds : sequences
+        Parameter grid
+    max_iterations : int
+        Maximum iterations per combination
+    output_dir : str or None
+        Write each result to sweep_output_path(...) in this directory; results
+        are not written when None
+    warm_start : bool
+        Start from the nearest completed result instead of the blocky surface
+    progress_callback, cancel_token :
+        As for downscale_dem; the percentage covers the whole sweep
+    prepared : PreparedInput or None
+        Already loaded input to use instead of reading input_file
+
+    Returns:
+    --------
+    list : one dict per combination with zoom_factor, rsme, threshold, iterations,
+        final_energy, converged, seconds, warm_start_from (index of the row the
+        run started from, or None) and output_file
+    """
+    progress_callback = message_callback(progress_callback)
+    if prepared is None:
+        if progress_callback:
+            progress_callback(f"Loading {os.path.basename(input_file)}...", 0)
+        prepared = PreparedInput(input_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    combinations = [
+        (int(zoom), float(rsme), float(threshold))
+        for zoom in sorted(set(zoom_factors))
+        for rsme in sorted(set(rsme_values))
+        for threshold in sorted(set(thresholds), reverse=True)
+    ]
+
+    rows = []
+    completed = {}  # row index -> downscaled array, kept as warm-start candidates
+    for index, (zoom, rsme, threshold) in enumerate(combinations):
+        if cancel_token is not None:
+            cancel_token.check()
+
+        start_from = None
+        if warm_start:
+            candidates = [i for i in completed if rows[i]['zoom_factor'] == zoom]
+            if candidates:
+                start_from = min(
+                    candidates,
+                    key=lambda i: _parameter_distance((rsme, threshold), (rows[i]['rsme'], rows[i]['threshold']))
+                )
+
+        if progress_callback:
+            origin = f", warm start from run {start_from + 1}" if start_from is not None else ""
+            progress_callback(
+                f"Sweep run {index + 1}/{len(combinations)}: zoom={zoom}, rsme={rsme:g}, threshold={threshold:g}{origin}",
+                int(100 * index / len(combinations))
+            )
+
+        t0 = time.perf_counter()
+        dscal, info = prepared.downscale(
+            zoom, rsme, threshold=threshold, max_iterations=max_iterations, cancel_token=cancel_token,
+            initial_dscal=completed[start_from] if start_from is not None else None
+        )
+        seconds = time.perf_counter() - t0
+
+        output_file = None
+        if output_dir:
+            output_file = sweep_output_path(input_file, output_dir, zoom, rsme, threshold)
+            prepared.write(output_file, dscal, zoom)
+
+        if warm_start:
+            completed[index] = dscal
+        rows.append({
+            'zoom_factor': zoom,
+            'rsme': rsme,
+            'threshold': threshold,
+            'iterations': info['iterations'],
+            'final_energy': info['final_energy'],
+            'converged': info['converged'],
+            'seconds': seconds,
+            'warm_start_from': start_from,
+            'output_file': output_file
+        })
+
+    if progress_callback:
+        progress_callback(f"Sweep completed: {len(rows)} runs", 100)
+    return rows
+
+
+def format_sweep_table(rows):
+    """Plain-text summary table of run_parameter_sweep results"""
+    header = f"{'#':>3}  {'zoom':>4}  {'rsme':>8}  {'threshold':>10}  {'iter':>5}  {'energy':>14}  {'conv':>4}  {'seconds':>8}  {'from':>4}"
+    lines = [header, '-' * len(header)]
+    for number, row in enumerate(rows, 1):
+        energy = f"{row['final_energy']:.6f}" if row['final_energy'] is not None else '-'
+        origin = str(row['warm_start_from'] + 1) if row['warm_start_from'] is not None else '-'
+        lines.append(
+            f"{number:>3}  {row['zoom_factor']:>4}  {row['rsme']:>8g}  {row['threshold']:>10g}  "
+            f"{row['iterations']:>5}  {energy:>14}  {'yes' if row['converged'] else 'no':>4}  "
+            f"{row['seconds']:>8.2f}  {origin:>4}"
+        )
+    return "\n".join(lines)
+
+
+class DownscalingSession:
+    """
+    Loaded input and last result of one input/zoom, kept between interactive runs
+
+    The first job of an input runs through downscale_dem, with the staging
+    cache, the result cache and checkpoints, and its output is recorded with
+    remember(). Only reruns go through run(): the first one loads the input and
+    the remembered output, every following one reuses the loaded data and masks
+    and warm-starts from the previous result in memory. Runs on one session are
+    serialized.
+
+    release() never waits for a running job: the job finishes with its own
+    references and keeps nothing in the released session.
+    """
+
+    # Release the session when less than this share of physical memory is available
+    LOW_MEMORY_FRACTION = 0.1
+
+    def __init__(self, input_file, zoom_factor):
+        self.input_file = os.path.abspath(input_file)
+        self.zoom_factor = zoom_factor
+        self.prepared = None
+        self.last_dscal = None
+        self.last_output = None  # output of the last run, loaded on the next run if last_dscal is None
+        self.last_params = None
+        self.released = False
+        self._signature = self._file_signature()
+        self._lock = threading.Lock()
+
+    def _file_signature(self):
+        st = os.stat(self.input_file)
+        return st.st_size, st.st_mtime_ns
+
+    def matches(self, input_file, zoom_factor):
+        """True if the session holds this input (unchanged on disk) at this zoom"""
+        try:
+            return (
+                os.path.abspath(input_file) == self.input_file
+                and zoom_factor == self.zoom_factor
+                and self._file_signature() == self._signature
+            )
+        except OSError:
+            return False
+
+    @property
+    def has_result(self):
+        """True if a previous result is available to warm-start a rerun from"""
+        return self.last_dscal is not None or (self.last_output is not None and os.path.isfile(self.last_output))
+
+    @property
+    def nbytes(self):
+        """Memory held by the session"""
+        prepared, last_dscal = self.prepared, self.last_dscal
+        total = prepared.nbytes if prepared is not None else 0
+        if last_dscal is not None:
+            total += last_dscal.nbytes
+        return total
+
+    @classmethod
+    def memory_is_tight(cls, needed_mb=0):
+        """True if available memory is below LOW_MEMORY_FRACTION or below needed_mb"""
+        if not PSUTIL_AVAILABLE:
+            return False
+        memory = psutil.virtual_memory()
+        available_mb = memory.available / (1024 * 1024)
+        return memory.available < memory.total * cls.LOW_MEMORY_FRACTION or available_mb < needed_mb
+
+    def release(self):
+        """Drop the loaded data and the last result (does not wait for a running job)"""
+        self.released = True
+        self._clear()
+
+    def _clear(self):
+        self.prepared = None
+        self.last_dscal = None
+        self.last_output = None
+        self.last_params = None
+
+    def remember(self, output_file, rsme, threshold):
+        """Record the output of a run made outside the session as the start of the next rerun"""
+        self.last_dscal = None
+        self.last_output = os.path.abspath(output_file)
+        self.last_params = {'rsme': float(rsme), 'threshold': float(threshold)}
+        # Checked after storing, so a release() from the GUI thread in between is not undone
+        if self.released:
+            self._clear()
+
+    def run(self, output_file, rsme, threshold=0.001, max_iterations=1000, progress_callback=None, cancel_token=None,
+            timing_per_iteration=False):
+        """
+        Downscale with the given parameters, warm-starting from the previous run
+
+        Returns:
+        --------
+        dict : Result information as returned by downscale_dem, plus warm_started
+            and previous_params (rsme/threshold of the run it started from)
+        """
+        progress_callback = message_callback(progress_callback)
+        timer = PhaseTimer(per_iteration=timing_per_iteration)
+        with self._lock:
+            # Work on local references, so release() can drop the session's at any time
+            prepared, initial_dscal = self.prepared, self.last_dscal
+            last_output, previous_params = self.last_output, self.last_params
+            if prepared is None:
+                if progress_callback:
+                    progress_callback("Loading DEM data into memory...", 2)
+                with profile_phase(timer, 'read'):
+                    prepared = PreparedInput(self.input_file)
+            elif progress_callback:
+                progress_callback("Reusing loaded DEM data from the previous run", 2)
+
+            if initial_dscal is None and last_output is not None and os.path.isfile(last_output):
+                if progress_callback:
+                    progress_callback(f"Loading the previous result {os.path.basename(last_output)}...", 3)
+                with profile_phase(timer, 'read'):
+                    initial_dscal, _ = get_raster_band(last_output)
+
+            warm_started = initial_dscal is not None
+            if progress_callback and warm_started:
+                progress_callback(
+                    f"Warm start from the previous result (rsme={previous_params['rsme']:g}, "
+                    f"threshold={previous_params['threshold']:g})", 5
+                )
+            dscal, info = prepared.downscale(
+                self.zoom_factor, rsme, threshold=threshold, max_iterations=max_iterations,
+                progress_callback=progress_callback, cancel_token=cancel_token,
+                initial_dscal=initial_dscal, timer=timer
+            )
+            if cancel_token is not None:
+                cancel_token.check()
+            with profile_phase(timer, 'write'):
+                prepared.write(output_file, dscal, self.zoom_factor, progress_callback=progress_callback)
+
+            if not self.released:
+                self.prepared = prepared
+                self.last_dscal = dscal
+                self.last_output = os.path.abspath(output_file)
+                self.last_params = {'rsme': float(rsme), 'threshold': float(threshold)}
+                if self.released:
+                    # release() ran while the result was being stored
+                    self._clear()
+
+            height, width = prepared.goc.shape
+            memory_mb = (prepared.nbytes + dscal.nbytes) / (1024 * 1024)
+            return {
+                'iterations': info['iterations'],
+                'final_energy': info['final_energy'],
+                'output_file': output_file,
+                'memory_estimate_mb': memory_mb,
+                'input_size': (width, height),
+                'output_size': (width * self.zoom_factor, height * self.zoom_factor),
+                'converged': info['converged'],
+                'stopped_early': info['stopped_early'],
+                'nodata_preserved': prepared.nodata_value is not None,
+                'energy_history': info['energy_history'],
+                'cached': False,
+                'timings': timer.as_dict(),
+                'warm_started': warm_started,
+                'previous_params': previous_params
+            }
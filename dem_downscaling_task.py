@@ -0,0 +1,297 @@
+"""
+Background execution of downscaling jobs through the QGIS task manager
+
+Each job is a DownscalingTask (QgsTask), so it shows up in the QGIS task bar,
+keeps running when the plugin dialog is closed and loads its result into the
+project when it finishes. DownscalingTaskScheduler only hands tasks to the task
+manager while their estimated memory fits into a fixed memory budget, so several
+small DEMs run in parallel while large ones wait for their turn.
+
+PreviewTask computes a quick, reduced preview and shows it as a temporary layer.
+"""
+import os
+import tempfile
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsApplication, QgsTask, QgsMessageLog, QgsRasterLayer, QgsProject, Qgis
+
+from .dem_downscaling_algorithm import (
+    downscale_dem, estimate_memory_usage, get_raster_info, default_checkpoint_file,
+    CancellationToken, DownscalingCancelled
+)
+from .dem_cache import StagingCache, ResultCache
+from .dem_downscaling_pipeline import downscale_preview
+from .dem_downscaling_aoi import downscale_dem_aoi
+from .dem_downscaling_progress import ProgressCoalescer, ProgressListener, ProgressWarning
+from .dem_downscaling_admission import AdmissionQueue
+
+
+MESSAGE_TAG = "DEM Downscaling"
+
+
+class DownscalingTask(QgsTask):
+    """QgsTask running downscale_dem for one input"""
+
+    progressMessage = pyqtSignal(str, int)  # message, percentage (pause/resume, emitted in the main thread)
+
+    # Iterations between checkpoints, so a crash or cancel loses little work
+    CHECKPOINT_INTERVAL = 25
+
+    def __init__(self, input_file, output_file, zoom_factor, rsme, threshold=0.001, load_result=True, resume=False, session=None,
+                 aoi=None, use_staging_cache=False, use_result_cache=False):
+        QgsTask.__init__(self, f"DEM downscaling: {os.path.basename(input_file)}", QgsTask.CanCancel)
+        self.input_file = input_file
+        self.output_file = output_file
+        self.zoom_factor = zoom_factor
+        self.rsme = rsme
+        self.threshold = threshold
+        self.load_result = load_result
+        self.resume = resume
+        self.session = session
+        self.aoi = aoi  # keyword arguments of downscale_dem_aoi (extent or aoi_geometries), or None
+        # Opt-in: staging writes a float32 copy of the input, the result cache hashes the whole input
+        self.use_staging_cache = use_staging_cache
+        self.use_result_cache = use_result_cache
+        self.result = None
+        self.error = None
+        self.cancel_token = CancellationToken()
+        # Latest progress of the run; the dialog polls it at its own rate (see ProgressCoalescer)
+        self.progress_state = ProgressCoalescer()
+
+        info = get_raster_info(input_file)
+        self.memory_mb = estimate_memory_usage(info['width'], info['height'], zoom_factor, dtype=info['dtype'],
+                                               nodata=info['nodata_value'] is not None)['total_mb']
+
+    def cancel(self):
+        """Stop the run at the next check point of the algorithm"""
+        self.cancel_token.cancel()
+        QgsTask.cancel(self)
+
+    def pause(self):
+        """Suspend the run without discarding progress; the worker thread sleeps until resume()"""
+        self.cancel_token.pause()
+        self.progressMessage.emit("Paused", int(self.progress()))
+
+    def resume(self):
+        self.cancel_token.resume()
+        self.progressMessage.emit("Resumed", int(self.progress()))
+
+    def is_paused(self):
+        return self.cancel_token.is_paused
+
+    @property
+    def can_finish_early(self):
+        """
+        False for area-of-interest jobs: they run tile by tile on one token, and
+        finishing would stop every tile not started yet after one iteration
+        """
+        return self.aoi is None
+
+    def finish_early(self):
+        """End the iterations after the current one and write the result reached so far"""
+        if self.can_finish_early:
+            self.cancel_token.finish()
+
+    def run(self):
+        """Run the downscaling process (called by the task manager in a worker thread)"""
+        def on_event(event):
+            # No signal per event: the worker can report far faster than the UI can repaint
+            self.progress_state(event)
+            if event.percentage is not None and int(event.percentage) != int(self.progress()):
+                self.setProgress(event.percentage)
+            if isinstance(event, ProgressWarning):
+                QgsMessageLog.logMessage(f"{os.path.basename(self.input_file)}: {event.message}", MESSAGE_TAG, Qgis.Warning)
+
+        progress_callback = ProgressListener(on_event)
+
+        try:
+            if self.aoi is not None:
+                self.result = downscale_dem_aoi(
+                    self.input_file, self.output_file, self.zoom_factor, self.rsme,
+                    threshold=self.threshold, progress_callback=progress_callback,
+                    cancel_token=self.cancel_token, **self.aoi
+                )
+                return True
+            if self.session is not None and not self.resume and self.session.has_result:
+                # Interactive rerun: warm start from the previous result, loaded data stays in the session
+                self.result = self.session.run(
+                    self.output_file, self.rsme, threshold=self.threshold,
+                    progress_callback=progress_callback, cancel_token=self.cancel_token
+                )
+                return True
+            self.result = downscale_dem(
+                input_file=self.input_file,
+                output_file=self.output_file,
+                zoom_factor=self.zoom_factor,
+                rsme=self.rsme,
+                threshold=self.threshold,
+                progress_callback=progress_callback,
+                staging_cache=StagingCache() if self.use_staging_cache else None,
+                result_cache=ResultCache() if self.use_result_cache else None,
+                cancel_token=self.cancel_token,
+                checkpoint_file=default_checkpoint_file(self.output_file),
+                checkpoint_interval=self.CHECKPOINT_INTERVAL,
+                resume=self.resume
+            )
+            if self.session is not None:
+                self.session.remember(self.output_file, self.rsme, self.threshold)
+            return True
+        except DownscalingCancelled:
+            return False
+        except Exception as e:
+            self.error = str(e)
+            return False
+
+    def finished(self, result):
+        """Load the result into the project (called in the main thread, also when the dialog is closed)"""
+        from qgis.utils import iface
+
+        if not result:
+            if self.isCanceled():
+                QgsMessageLog.logMessage(f"Cancelled: {self.input_file}", MESSAGE_TAG, Qgis.Info)
+            else:
+                QgsMessageLog.logMessage(f"Failed: {self.input_file}: {self.error}", MESSAGE_TAG, Qgis.Critical)
+                iface.messageBar().pushCritical(MESSAGE_TAG, f"{os.path.basename(self.input_file)}: {self.error}")
+            return
+
+        if self.result.get('stopped_early'):
+            reused = " - stopped early on request"
+        elif self.result.get('cached'):
+            reused = " - reused cached result"
+        elif self.result.get('warm_started'):
+            reused = " - warm start from the previous run"
+        else:
+            reused = ""
+        QgsMessageLog.logMessage(
+            f"Completed: {self.output_file} ({self.result['iterations']} iterations{reused})", MESSAGE_TAG, Qgis.Info)
+        if not self.load_result or not os.path.exists(self.output_file):
+            return
+        layer = QgsRasterLayer(self.output_file, os.path.basename(self.output_file))
+        if layer.isValid():
+            QgsProject.instance().addMapLayer(layer)
+            iface.messageBar().pushSuccess(MESSAGE_TAG, f"Layer loaded: {os.path.basename(self.output_file)}")
+        else:
+            iface.messageBar().pushWarning(MESSAGE_TAG, "File created but could not be loaded into QGIS")
+
+
+class PreviewTask(QgsTask):
+    """QgsTask running downscale_preview and adding the result as a temporary layer"""
+
+    def __init__(self, input_file, zoom_factor, rsme, extent=None, max_iterations=30):
+        QgsTask.__init__(self, f"DEM downscaling preview: {os.path.basename(input_file)}", QgsTask.CanCancel)
+        self.input_file = input_file
+        self.zoom_factor = zoom_factor
+        self.rsme = rsme
+        self.extent = extent
+        self.max_iterations = max_iterations
+        fd, self.output_file = tempfile.mkstemp(prefix='dem_preview_', suffix='.tif')
+        os.close(fd)
+        self.result = None
+        self.error = None
+        self.layer = None
+        self.cancel_token = CancellationToken()
+
+    def cancel(self):
+        self.cancel_token.cancel()
+        QgsTask.cancel(self)
+
+    def run(self):
+        try:
+            self.result = downscale_preview(
+                self.input_file, self.output_file, self.zoom_factor, self.rsme,
+                extent=self.extent, max_iterations=self.max_iterations,
+                progress_callback=lambda message, percentage: self.setProgress(percentage),
+                cancel_token=self.cancel_token
+            )
+            return True
+        except DownscalingCancelled:
+            return False
+        except Exception as e:
+            self.error = str(e)
+            return False
+
+    def finished(self, result):
+        """Add the preview as a layer (called in the main thread)"""
+        if not result:
+            if self.error:
+                QgsMessageLog.logMessage(f"Preview failed: {self.error}", MESSAGE_TAG, Qgis.Warning)
+            return
+        name = f"Preview x{self.zoom_factor} rsme={self.rsme:g}"
+        if self.result['decimation'] > 1:
+            name += f" (1:{self.result['decimation']} overview)"
+        self.layer = QgsRasterLayer(self.output_file, name)
+        if self.layer.isValid():
+            QgsProject.instance().addMapLayer(self.layer)
+
+
+class DownscalingTaskScheduler(QObject):
+    """
+    Memory-aware admission of DownscalingTask objects to the QGIS task manager
+
+    A task is started when its memory estimate fits into the memory budget next
+    to the estimates of the running tasks (or when nothing else is running);
+    otherwise it waits in a queue (see AdmissionQueue). Python references to
+    submitted tasks are kept until they finish, as PyQGIS requires.
+    """
+
+    queueChanged = pyqtSignal(int, int)  # running, pending
+
+    def __init__(self, memory_fraction=0.8, max_concurrent=None):
+        QObject.__init__(self)
+        self.queue = AdmissionQueue.for_available_memory(
+            memory_fraction, max_concurrent or max(1, (os.cpu_count() or 2) // 2))
+
+    @property
+    def running(self):
+        return self.queue.running
+
+    @property
+    def pending(self):
+        return self.queue.pending
+
+    def submit(self, task):
+        """Queue a task; returns True if it was started immediately"""
+        task.taskCompleted.connect(lambda: self._task_done(task))
+        task.taskTerminated.connect(lambda: self._task_done(task))
+        self.queue.add(task)
+        self._start_pending()
+        return task in self.running
+
+    def set_paused(self, paused, tasks=None):
+        """Pause or resume the given running tasks (default: all)"""
+        for task in list(tasks if tasks is not None else self.running):
+            if task in self.running:
+                if paused:
+                    task.pause()
+                else:
+                    task.resume()
+
+    def cancel_all(self, tasks=None):
+        """Cancel the given tasks (default: all), whether running or still queued"""
+        for task in list(tasks if tasks is not None else self.running + self.pending):
+            if task in self.pending:
+                task.cancel()
+                self._task_done(task)
+            elif task in self.running:
+                task.cancel()
+        self.queueChanged.emit(len(self.running), len(self.pending))
+
+    def _start_pending(self):
+        for task in self.queue.admit():
+            QgsApplication.taskManager().addTask(task)
+        self.queueChanged.emit(len(self.running), len(self.pending))
+
+    def _task_done(self, task):
+        self.queue.remove(task)
+        self._start_pending()
+
+
+_scheduler = None
+
+
+def task_scheduler():
+    """Shared scheduler, so tasks outlive the dialog that submitted them"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = DownscalingTaskScheduler()
+    return _scheduler
@@ -4,7 +4,7 @@ QGIS Plugin Implementation
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction
-from qgis.core import QgsProject
+from qgis.core import QgsProject, QgsApplication
 
 from .resources import *
 import os.path
@@ -47,6 +47,9 @@ class MyQGISPlugin:
         # Must be set in initGui() to survive plugin reloads
         self.first_start = None
 
+        # Processing provider, registered in initProcessing()
+        self.provider = None
+
     # noinspection PyMethodMayBeStatic
     def tr(self, message):
         """Get the translation for a string using Qt translation API.
@@ -137,8 +140,15 @@ class MyQGISPlugin:
 
         return action
 
+    def initProcessing(self):
+        """Register the Processing provider (toolbox, batch interface, modeler, processing.run)."""
+        from .dem_downscaling_provider import DemDownscalingProvider
+        self.provider = DemDownscalingProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
+        self.initProcessing()
 
         icon_path = ':/plugins/my_qgis_plugin/icon.png'
         self.add_action(
@@ -159,6 +169,13 @@ class MyQGISPlugin:
                 action)
             self.iface.removeToolBarIcon(action)
 
+        if self.provider is not None:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+
+        if hasattr(self, 'dlg'):
+            self.dlg.release_session()
+
     def run(self):
         """Run method that performs all the real work"""
 
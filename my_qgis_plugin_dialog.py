@@ -3,10 +3,17 @@ Dialog implementation for DEM Downscaling plugin
 """
 from qgis.PyQt import uic
 from qgis.PyQt import QtWidgets
-from qgis.PyQt.QtCore import Qt, QThread, pyqtSignal
-from qgis.core import QgsRasterLayer, QgsProject, QgsMessageLog
+from qgis.PyQt.QtCore import Qt, QTimer
+from qgis.core import (
+    QgsRasterLayer, QgsProject, QgsMessageLog, QgsApplication, QgsCoordinateTransform, QgsMapLayerProxyModel,
+    QgsSettings
+)
+from qgis.gui import QgsMapLayerComboBox
 from qgis.utils import iface
-from .dem_downscaling_algorithm import downscale_dem, estimate_memory_usage, get_raster_info, estimate_runtime, GPU_AVAILABLE, SCIPY_AVAILABLE
+from .dem_downscaling_algorithm import downscale_dem, estimate_memory_usage, get_raster_info, estimate_runtime, default_checkpoint_file, load_checkpoint, active_engine, GPU_AVAILABLE, SCIPY_AVAILABLE
+from .dem_downscaling_task import DownscalingTask, PreviewTask, task_scheduler
+from .dem_downscaling_session import DownscalingSession
+from .dem_downscaling_panel import ConvergencePanel
 import os
 import subprocess
 import sys
@@ -23,48 +30,13 @@ FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'my_qgis_plugin_dialog_base.ui'))
 
 
-class DownscalingWorker(QThread):
-    """Worker thread for DEM downscaling to keep UI responsive"""
-    progress = pyqtSignal(str, int)  # message, percentage
-    finished = pyqtSignal(dict)  # result dictionary
-    error = pyqtSignal(str)  # error message
+class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
+    # Interval at which the progress of running jobs is shown (at most 10 updates per second)
+    PROGRESS_INTERVAL_MS = 100
     
-    def __init__(self, input_file, output_file, zoom_factor, rsme):
-        QThread.__init__(self)
-        self.input_file = input_file
-        self.output_file = output_file
-        self.zoom_factor = zoom_factor
-        self.rsme = rsme
-        self.is_cancelled = False
+    SETTINGS_RESULT_CACHE = 'dem_downscaling/use_result_cache'
+    SETTINGS_STAGING_CACHE = 'dem_downscaling/use_staging_cache'
     
-    def run(self):
-        """Run the downscaling process"""
-        try:
-            def progress_callback(message, percentage):
-                if not self.is_cancelled:
-                    self.progress.emit(message, percentage)
-            
-            result = downscale_dem(
-                input_file=self.input_file,
-                output_file=self.output_file,
-                zoom_factor=self.zoom_factor,
-                rsme=self.rsme,
-                threshold=0.001,
-                progress_callback=progress_callback
-            )
-            
-            if not self.is_cancelled:
-                self.finished.emit(result)
-        except Exception as e:
-            if not self.is_cancelled:
-                self.error.emit(str(e))
-    
-    def cancel(self):
-        """Cancel the processing"""
-        self.is_cancelled = True
-
-
-class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
     def __init__(self, parent=None):
         """Constructor."""
         super(MyQGISPluginDialog, self).__init__(parent)
@@ -84,22 +56,85 @@ class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
         self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setText("Process")
         self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Cancel")
         
+        # Pause/Resume suspends running jobs without discarding their progress
+        self.btnPause = self.button_box.addButton("Pause", QtWidgets.QDialogButtonBox.ActionRole)
+        self.btnPause.clicked.connect(self.toggle_pause)
+        self.btnPause.setEnabled(False)
+        
+        # Preview: seconds-long run on the canvas extent or a decimated overview
+        self.btnPreview = self.button_box.addButton("Preview", QtWidgets.QDialogButtonBox.ActionRole)
+        self.btnPreview.setToolTip(
+            "Downscale the visible map extent (or a reduced overview of the whole DEM) "
+            "with few iterations and show it as a temporary layer"
+        )
+        self.btnPreview.clicked.connect(self.preview)
+        # Area of interest: whole DEM, visible map extent or polygons of a layer
+        self.mAoiMode = QtWidgets.QComboBox()
+        self.mAoiMode.addItems(["Whole DEM", "Map canvas extent", "Polygon layer"])
+        self.mAoiLayer = QgsMapLayerComboBox()
+        self.mAoiLayer.setFilters(QgsMapLayerProxyModel.PolygonLayer)
+        self.mAoiSelectedOnly = QtWidgets.QCheckBox("Selected features only")
+        aoi_layout = QtWidgets.QHBoxLayout()
+        aoi_layout.addWidget(self.mAoiMode)
+        aoi_layout.addWidget(self.mAoiLayer, 1)
+        aoi_layout.addWidget(self.mAoiSelectedOnly)
+        self.formLayout.addRow("Area of interest:", aoi_layout)
+        self.mAoiMode.currentIndexChanged.connect(self.on_aoi_mode_changed)
+        self.on_aoi_mode_changed()
+        
+        # Caches are opt-in: the result cache hashes every input, the staging cache stores a float32 copy of it
+        settings = QgsSettings()
+        self.mUseResultCache = QtWidgets.QCheckBox("Reuse earlier results")
+        self.mUseResultCache.setToolTip(
+            "Look up runs with identical input and parameters before iterating "
+            "(hashes the whole input file on every run)"
+        )
+        self.mUseResultCache.setChecked(settings.value(self.SETTINGS_RESULT_CACHE, False, type=bool))
+        self.mUseStagingCache = QtWidgets.QCheckBox("Stage input as float32")
+        self.mUseStagingCache.setToolTip(
+            "Convert slow formats (IMG, BIL, compressed GeoTIFF) once into an uncompressed copy "
+            "in the cache directory"
+        )
+        self.mUseStagingCache.setChecked(settings.value(self.SETTINGS_STAGING_CACHE, False, type=bool))
+        cache_layout = QtWidgets.QHBoxLayout()
+        cache_layout.addWidget(self.mUseResultCache)
+        cache_layout.addWidget(self.mUseStagingCache)
+        cache_layout.addStretch(1)
+        self.formLayout.addRow("Caches:", cache_layout)
+        
+        self.preview_task = None
+        self.preview_tasks = []  # Python references must outlive running tasks, also superseded ones
+        self.preview_layer_id = None
+        
         # Prevent dialog from closing on Enter key or OK button
         self.setModal(True)
         
-        # Initialize worker
-        self.worker = None
+        # Jobs submitted from this dialog that have not finished yet. They run in
+        # the QGIS task manager and keep running if the dialog is closed.
+        self.active_tasks = []
         self.is_processing = False
         
+        # Jobs only record their latest progress; this timer shows it at a fixed rate
+        self._progress_timer = QTimer(self)
+        self._progress_timer.setInterval(self.PROGRESS_INTERVAL_MS)
+        self._progress_timer.timeout.connect(self._poll_progress)
+        
+        # Live energy/throughput of the most recently started job, below the status line
+        self.convergencePanel = ConvergencePanel(self)
+        self.verticalLayout.insertWidget(self.verticalLayout.indexOf(self.label_status) + 1, self.convergencePanel)
+        self.convergencePanel.finishRequested.connect(self.finish_early)
+        self._panel_task = None
+        
+        # Loaded input and last result of the current input/zoom, so reruns with
+        # other parameters skip reading and warm-start (see DownscalingSession)
+        self.session = None
+        
         # Initialize progress bar
         self.progressBar.setValue(0)
         self.progressBar.setRange(0, 100)
         self.progressBar.setVisible(True)
         self.progressBar.setFormat("%p%")  # Show percentage in progress bar
         
-        # Worker thread
-        self.worker = None
-        
         # Check and display library status
         self.check_library_status()
         
@@ -132,13 +167,34 @@ class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
                 filename += '.tif'
             self.mOutputFile.setText(filename)
     
+    def release_session(self):
+        """Free the memory held for interactive reruns"""
+        if self.session is not None:
+            self.session.release()
+            self.session = None
+    
+    def _session_for(self, input_file, zoom_factor, needed_mb):
+        """Session to run this job in, or None to run it without one"""
+        if self.session is not None and not self.session.matches(input_file, zoom_factor):
+            self.release_session()
+        if DownscalingSession.memory_is_tight(needed_mb):
+            # Not enough memory to keep data around: give it back and run normally
+            self.release_session()
+            return None
+        if self.session is None:
+            self.session = DownscalingSession(input_file, zoom_factor)
+        return self.session
+    
     def on_input_changed(self):
         """Update memory estimate when input file changes"""
+        if self.session is not None and not self.session.matches(self.mInputFile.text(), self.mZoomFactor.value()):
+            self.release_session()
         if self.mInputFile.text() and os.path.exists(self.mInputFile.text()):
             try:
                 info = get_raster_info(self.mInputFile.text())
                 zoom = self.mZoomFactor.value()
-                mem_est = estimate_memory_usage(info['width'], info['height'], zoom)
+                mem_est = estimate_memory_usage(info['width'], info['height'], zoom, dtype=info['dtype'],
+                                                 nodata=info['nodata_value'] is not None)
                 
                 # Estimate runtime
                 runtime_est = estimate_runtime(
@@ -476,7 +532,8 @@ class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
         try:
             info = get_raster_info(self.mInputFile.text())
             zoom = self.mZoomFactor.value()
-            mem_est = estimate_memory_usage(info['width'], info['height'], zoom)
+            mem_est = estimate_memory_usage(info['width'], info['height'], zoom, dtype=info['dtype'],
+                                            nodata=info['nodata_value'] is not None)
             available_mb = psutil.virtual_memory().available / (1024 * 1024)
             
             if mem_est['total_mb'] > available_mb * 0.9:
@@ -510,45 +567,134 @@ class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
         
         # Update progress bar
         self.progressBar.setValue(percentage)
-        self.progressBar.update()  # Force update
-        
-        # Process events to keep UI responsive
-        QtWidgets.QApplication.processEvents()
+    
+    def _poll_progress(self):
+        """Show the latest progress of the running jobs (called by the progress timer)"""
+        for task in list(self.active_tasks):
+            state = task.progress_state.take()
+            if state is None:
+                continue
+            if task is self._panel_task:
+                self.convergencePanel.add_iterations(state['iterations'])
+            if state['message'] is not None:
+                self.update_progress(state['message'], state['percentage'])
+        if not self.convergencePanel.isCollapsed():
+            self.convergencePanel.update_memory()
+    
+    def _canvas_extent_in(self, input_file):
+        """Map canvas extent in the CRS of input_file, or None if it does not overlap the DEM"""
+        layer = QgsRasterLayer(input_file, "preview source")
+        if not layer.isValid():
+            return None
+        canvas = iface.mapCanvas()
+        extent = canvas.extent()
+        canvas_crs = canvas.mapSettings().destinationCrs()
+        if canvas_crs != layer.crs():
+            transform = QgsCoordinateTransform(canvas_crs, layer.crs(), QgsProject.instance())
+            extent = transform.transformBoundingBox(extent)
+        if not extent.intersects(layer.extent()) or extent.contains(layer.extent()):
+            # Canvas shows none or all of the DEM: preview a decimated overview instead
+            return None
+        extent = extent.intersect(layer.extent())
+        return extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()
+    
+    def on_aoi_mode_changed(self):
+        polygons = self.mAoiMode.currentIndex() == 2
+        self.mAoiLayer.setEnabled(polygons)
+        self.mAoiSelectedOnly.setEnabled(polygons)
+    
+    def _aoi_for(self, input_file):
+        """
+        Keyword arguments of downscale_dem_aoi for the chosen area of interest
+        
+        Returns:
+        --------
+        tuple : (aoi, error) - aoi is None for the whole DEM; error is a message
+            if the area of interest cannot be used
+        """
+        mode = self.mAoiMode.currentIndex()
+        if mode == 0:
+            return None, None
+        if mode == 1:
+            extent = self._canvas_extent_in(input_file)
+            if extent is None:
+                # The canvas shows all of the DEM (or none of it): nothing to restrict
+                return None, None
+            return {'extent': extent}, None
+        
+        layer = self.mAoiLayer.currentLayer()
+        if layer is None:
+            return None, "Please choose a polygon layer for the area of interest."
+        raster_crs = QgsRasterLayer(input_file, "aoi source").crs()
+        transform = QgsCoordinateTransform(layer.crs(), raster_crs, QgsProject.instance())
+        features = layer.selectedFeatures() if self.mAoiSelectedOnly.isChecked() else layer.getFeatures()
+        geometries = []
+        for feature in features:
+            geometry = feature.geometry()
+            if geometry.isEmpty():
+                continue
+            geometry.transform(transform)
+            geometries.append(geometry.asWkt())
+        if not geometries:
+            return None, "The area of interest layer has no (selected) polygons."
+        return {'aoi_geometries': geometries}, None
+    
+    def preview(self):
+        """Show a quick preview of the current parameters as a temporary layer"""
+        input_file = self.mInputFile.text()
+        if not input_file or not os.path.exists(input_file):
+            QtWidgets.QMessageBox.warning(self, "Error", "Please select a valid input DEM file!")
+            return
+        if self.preview_task is not None:
+            self.preview_task.cancel()
+        
+        extent = self._canvas_extent_in(input_file)
+        task = PreviewTask(input_file, self.mZoomFactor.value(), self.mRsme.value(), extent=extent)
+        task.taskCompleted.connect(lambda: self._preview_done(task))
+        task.taskTerminated.connect(lambda: self._preview_done(task))
+        self.preview_task = task
+        self.preview_tasks.append(task)
+        QgsApplication.taskManager().addTask(task)
+        self.label_status.setText(
+            "Computing preview of the map extent..." if extent else "Computing preview of a reduced overview..."
+        )
+    
+    def _preview_done(self, task):
+        if task in self.preview_tasks:
+            self.preview_tasks.remove(task)
+        if task is not self.preview_task:
+            return
+        self.preview_task = None
+        if task.layer is None or not task.layer.isValid():
+            if task.error:
+                self.label_status.setText(f"Preview failed: {task.error}")
+            return
+        # Replace the previous preview layer rather than piling them up
+        if self.preview_layer_id and QgsProject.instance().mapLayer(self.preview_layer_id):
+            QgsProject.instance().removeMapLayer(self.preview_layer_id)
+        self.preview_layer_id = task.layer.id()
+        result = task.result
+        overview = f", 1:{result['decimation']} overview" if result['decimation'] > 1 else ""
+        self.label_status.setText(
+            f"Preview ready in {result['seconds']:.1f} s ({result['iterations']} iterations{overview})"
+        )
     
     def process(self):
-        """Process DEM downscaling - dialog stays open during processing"""
+        """Submit a DEM downscaling job - dialog stays open and more jobs can be queued"""
         if not self.validate_inputs():
             return
         
-        # Prevent dialog from closing - block the default accept behavior
-        # Check if already processing
-        if self.is_processing or (self.worker and self.worker.isRunning()):
-            # Already processing, do nothing
-            return
-        
-        # Mark as processing
-        self.is_processing = True
-        
-        # Disable OK button and change Cancel to Stop
-        self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(False)
-        self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Stop")
-        self.button_box.rejected.disconnect()  # Disconnect default reject
-        self.button_box.rejected.connect(self.cancel_processing)
-        
-        # Disable input fields during processing
-        self.mInputFile.setEnabled(False)
-        self.mOutputFile.setEnabled(False)
-        self.mZoomFactor.setEnabled(False)
-        self.mRsme.setEnabled(False)
-        self.btnBrowseInput.setEnabled(False)
-        self.btnBrowseOutput.setEnabled(False)
-        
         input_file = self.mInputFile.text()
         output_file = self.mOutputFile.text()
         zoom_factor = self.mZoomFactor.value()
         rsme = self.mRsme.value()
         
+        if any(task.output_file == output_file for task in self.active_tasks):
+            QtWidgets.QMessageBox.warning(self, "Error", "A job writing to this output file is already running!")
+            return
+        
         # Get runtime estimate before starting
+        info = None
         try:
             info = get_raster_info(input_file)
             runtime_est = estimate_runtime(
@@ -558,137 +704,183 @@ class MyQGISPluginDialog(QtWidgets.QDialog, FORM_CLASS):
                 use_gpu=GPU_AVAILABLE,
                 use_vectorized=SCIPY_AVAILABLE
             )
-            self.label_status.setText(
-                f"Starting processing... Estimated time: {runtime_est['formatted_time']} "
-                f"({runtime_est['processing_mode']})"
-            )
+            estimate_text = f" Estimated time: {runtime_est['formatted_time']} ({runtime_est['processing_mode']})"
         except:
-            self.label_status.setText("Starting processing...")
+            estimate_text = ""
+        
+        # Offer to resume an interrupted run (crash or Stop) of the same output
+        resume = False
+        checkpoint_file = default_checkpoint_file(output_file)
+        if os.path.exists(checkpoint_file):
+            try:
+                checkpoint_iteration = load_checkpoint(checkpoint_file)['iteration']
+            except Exception:
+                checkpoint_iteration = None
+            if checkpoint_iteration is not None:
+                reply = QtWidgets.QMessageBox.question(
+                    self,
+                    "Resume Processing",
+                    f"An interrupted run of this output was checkpointed at iteration {checkpoint_iteration}.\n\n"
+                    f"Resume from the checkpoint? Choose No to start over.",
+                    QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+                    QtWidgets.QMessageBox.Yes
+                )
+                resume = reply == QtWidgets.QMessageBox.Yes
+        
+        aoi, aoi_error = self._aoi_for(input_file)
+        if aoi_error:
+            QtWidgets.QMessageBox.warning(self, "Error", aoi_error)
+            return
+        
+        session = None
+        if not resume and aoi is None and info is not None:
+            needed_mb = estimate_memory_usage(info['width'], info['height'], zoom_factor, dtype=info['dtype'],
+                                             nodata=info['nodata_value'] is not None)['total_mb']
+            session = self._session_for(input_file, zoom_factor, needed_mb)
+        
+        use_result_cache = self.mUseResultCache.isChecked()
+        use_staging_cache = self.mUseStagingCache.isChecked()
+        settings = QgsSettings()
+        settings.setValue(self.SETTINGS_RESULT_CACHE, use_result_cache)
+        settings.setValue(self.SETTINGS_STAGING_CACHE, use_staging_cache)
+        
+        task = DownscalingTask(input_file, output_file, zoom_factor, rsme, threshold=0.001, resume=resume, session=session, aoi=aoi,
+                               use_staging_cache=use_staging_cache, use_result_cache=use_result_cache)
+        task.progressMessage.connect(self.update_progress)
+        task.taskCompleted.connect(lambda: self.on_processing_finished(task))
+        task.taskTerminated.connect(lambda: self.on_processing_error(task))
+        self.active_tasks.append(task)
+        started = task_scheduler().submit(task)
+        if not self._progress_timer.isActive():
+            self._progress_timer.start()
+        self._panel_task = task
+        self.convergencePanel.reset(engine=active_engine(), can_finish=task.can_finish_early)
+        
+        # Mark as processing and turn Cancel into Stop
+        if not self.is_processing:
+            self.is_processing = True
+            self.btnPause.setEnabled(True)
+            self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Stop")
+            self.button_box.rejected.disconnect()  # Disconnect default reject
+            self.button_box.rejected.connect(self.cancel_processing)
         
         self.progressBar.setRange(0, 100)  # Set range 0-100%
         self.progressBar.setValue(0)
-
-        # Create and start worker thread
-        self.worker = DownscalingWorker(input_file, output_file, zoom_factor, rsme)
-        self.worker.progress.connect(self.update_progress)
-        self.worker.finished.connect(self.on_processing_finished)
-        self.worker.error.connect(self.on_processing_error)
-        self.worker.start()
+        if started:
+            self.label_status.setText(f"Started {os.path.basename(input_file)}.{estimate_text}")
+        else:
+            self.label_status.setText(
+                f"Queued {os.path.basename(input_file)} - waiting for memory from running jobs.{estimate_text}")
         
         # IMPORTANT: Do NOT call accept() or close() - keep dialog open!
     
     def cancel_processing(self):
-        """Cancel processing if running"""
-        if self.worker and self.worker.isRunning():
+        """Cancel the jobs submitted from this dialog"""
+        if self.active_tasks:
             reply = QtWidgets.QMessageBox.question(
                 self,
                 "Cancel Processing",
-                "Are you sure you want to cancel the processing?",
+                f"Are you sure you want to cancel {len(self.active_tasks)} running or queued job(s)?",
                 QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
                 QtWidgets.QMessageBox.No
             )
             if reply == QtWidgets.QMessageBox.Yes:
-                self.worker.cancel()
-                self.worker.wait(5000)  # Wait up to 5 seconds
-                self.is_processing = False
-                
-                # Re-enable UI
-                self.mInputFile.setEnabled(True)
-                self.mOutputFile.setEnabled(True)
-                self.mZoomFactor.setEnabled(True)
-                self.mRsme.setEnabled(True)
-                self.btnBrowseInput.setEnabled(True)
-                self.btnBrowseOutput.setEnabled(True)
-                
-                self.label_status.setText("Processing cancelled")
-                self.progressBar.setValue(0)
-                self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(True)
-                self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setText("Process")
-                self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Close")
-                self.button_box.rejected.disconnect()
-                self.button_box.rejected.connect(self.reject)
+                # Tasks stop at the next check point of the algorithm, paused ones wake up to exit
+                scheduler = task_scheduler()
+                scheduler.cancel_all(list(self.active_tasks))
+                # Tasks that were still queued never reach the task manager, so forget them here
+                for task in list(self.active_tasks):
+                    if task not in scheduler.running:
+                        self._task_done(task)
+                self.label_status.setText("Cancelling..." if self.active_tasks else "Processing cancelled")
         else:
             # Not processing, just close dialog
             self.reject()
     
-    def on_processing_finished(self, result):
-        """Handle processing completion - dialog stays open"""
-        # Mark as not processing
+    def toggle_pause(self):
+        """Pause or resume the running jobs submitted from this dialog"""
+        paused = self.btnPause.text() == "Pause"
+        task_scheduler().set_paused(paused, list(self.active_tasks))
+        self.btnPause.setText("Resume" if paused else "Pause")
+        self.label_status.setText("Paused - CPU released, progress kept" if paused else "Resumed")
+    
+    def finish_early(self):
+        """End the iterations of the job shown in the convergence panel and keep its current result"""
+        if self._panel_task is not None and self._panel_task in self.active_tasks:
+            self._panel_task.finish_early()
+            self.label_status.setText(f"Finishing {os.path.basename(self._panel_task.input_file)} after the current iteration...")
+    
+    def _task_done(self, task):
+        """Forget a finished task and restore the Close button when nothing is left"""
+        if task is self._panel_task:
+            # Iterations reported since the last timer tick
+            state = task.progress_state.take()
+            if state is not None:
+                self.convergencePanel.add_iterations(state['iterations'])
+            self.convergencePanel.job_done()
+        if task in self.active_tasks:
+            self.active_tasks.remove(task)
+        if self.active_tasks or not self.is_processing:
+            return
+        self._progress_timer.stop()
         self.is_processing = False
-        
-        # Set progress to 100%
-        self.progressBar.setValue(100)
-        self.update_progress("Processing completed!", 100)
-        
-        # Re-enable UI elements
-        self.mInputFile.setEnabled(True)
-        self.mOutputFile.setEnabled(True)
-        self.mZoomFactor.setEnabled(True)
-        self.mRsme.setEnabled(True)
-        self.btnBrowseInput.setEnabled(True)
-        self.btnBrowseOutput.setEnabled(True)
-        
-        # Re-enable buttons
-        self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(True)
-        self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setText("Process")
+        self.btnPause.setText("Pause")
+        self.btnPause.setEnabled(False)
         self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Close")
         self.button_box.rejected.disconnect()  # Disconnect stop handler
         self.button_box.rejected.connect(self.reject)  # Reconnect default reject to close dialog
+    
+    def on_processing_finished(self, task):
+        """Handle job completion - the task itself loads the result into QGIS"""
+        self._task_done(task)
+        result = task.result
         
-        # Show success message
-        msg = (
-            f"Downscaling completed successfully!\n\n"
-            f"Iterations: {result['iterations']}\n"
-            f"Final energy: {result['final_energy']:.6f}\n"
-            f"Converged: {'Yes' if result.get('converged', True) else 'No'}\n"
-            f"Memory used: ~{result.get('memory_estimate_mb', 0):.1f} MB\n"
-            f"Output size: {result['output_size'][0]}x{result['output_size'][1]} pixels\n\n"
-            f"Output file: {result['output_file']}"
-        )
-        
-        QtWidgets.QMessageBox.information(self, "Success", msg)
+        # Set progress to 100%
+        self.progressBar.setValue(100)
+        self.update_progress("Processing completed!", 100)
         
-        # Load result into QGIS
-        if os.path.exists(result['output_file']):
-            layer = QgsRasterLayer(result['output_file'], os.path.basename(result['output_file']))
-            if layer.isValid():
-                QgsProject.instance().addMapLayer(layer)
-                iface.messageBar().pushSuccess(
-                    "DEM Downscaling",
-                    f"Layer loaded: {os.path.basename(result['output_file'])}"
-                )
+        # Show success message (only when the dialog is still open)
+        if self.isVisible():
+            if result.get('stopped_early'):
+                cached_note = "Stopped early on request: the result is the surface reached at the last iteration.\n\n"
+            elif result.get('cached'):
+                cached_note = "Reused the cached result of an earlier run with the same input and parameters.\n\n"
+            elif result.get('warm_started'):
+                cached_note = "Reused the loaded input and started from the previous result.\n\n"
             else:
-                iface.messageBar().pushWarning(
-                    "DEM Downscaling",
-                    "File created but could not be loaded into QGIS"
-                )
+                cached_note = ""
+            # Tiled and area-of-interest runs have no single global energy
+            final_energy = f"{result['final_energy']:.6f}" if result.get('final_energy') is not None else "n/a (tiled run)"
+            msg = (
+                f"Downscaling completed successfully!\n\n"
+                f"{cached_note}"
+                f"Iterations: {result['iterations']}\n"
+                f"Final energy: {final_energy}\n"
+                f"Converged: {'Yes' if result.get('converged', True) else 'No'}\n"
+                f"Memory used: ~{result.get('memory_estimate_mb', 0):.1f} MB\n"
+                f"Output size: {result['output_size'][0]}x{result['output_size'][1]} pixels\n\n"
+                f"Output file: {result['output_file']}"
+            )
+            QtWidgets.QMessageBox.information(self, "Success", msg)
         
         # Update status - dialog remains open, user can close manually
-        self.label_status.setText(f"✓ Completed! ({result['iterations']} iterations) - Click Close to exit")
+        remaining = f" - {len(self.active_tasks)} job(s) still running" if self.active_tasks else " - Click Close to exit"
+        cached = ", cached result" if result.get('cached') else ""
+        self.label_status.setText(f"✓ Completed! ({result['iterations']} iterations{cached}){remaining}")
     
-    def on_processing_error(self, error_msg):
-        """Handle processing errors - dialog stays open"""
-        self.is_processing = False
-        
+    def on_processing_error(self, task):
+        """Handle failed or cancelled jobs - dialog stays open"""
+        self._task_done(task)
         self.progressBar.setValue(0)
-        QtWidgets.QMessageBox.critical(
-            self,
-            "Error",
-            f"An error occurred during processing:\n{error_msg}"
-        )
-        self.label_status.setText(f"Error: {error_msg}")
-        
-        # Re-enable UI elements
-        self.mInputFile.setEnabled(True)
-        self.mOutputFile.setEnabled(True)
-        self.mZoomFactor.setEnabled(True)
-        self.mRsme.setEnabled(True)
-        self.btnBrowseInput.setEnabled(True)
-        self.btnBrowseOutput.setEnabled(True)
-        
-        # Re-enable buttons
-        self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setEnabled(True)
-        self.button_box.button(QtWidgets.QDialogButtonBox.Ok).setText("Process")
-        self.button_box.button(QtWidgets.QDialogButtonBox.Cancel).setText("Close")
-        self.button_box.rejected.disconnect()
-        self.button_box.rejected.connect(self.reject)
+        
+        if task.isCanceled():
+            self.label_status.setText(f"Processing cancelled: {os.path.basename(task.input_file)}")
+            return
+        
+        if self.isVisible():
+            QtWidgets.QMessageBox.critical(
+                self,
+                "Error",
+                f"An error occurred during processing:\n{task.error}"
+            )
+        self.label_status.setText(f"Error: {task.error}")
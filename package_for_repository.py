@@ -48,6 +48,9 @@ def package_for_repository(output_filename=None):
         # Note: INSTALLATION_GUIDE.md, CUDA_TOOLKIT_INSTALL.md, INSTALL_CUPY_WINDOWS.md 
         # should be included - they're user documentation
         'test_gpu.py',  # Test script
+        'benchmarks',  # Benchmark suite, development only
+        'tests',  # Test suite, development only
+        'pytest.ini',
         '*.tif',  # Exclude test DEM files
         '*.tiff',  # Exclude test DEM files
         '.vscode',
@@ -0,0 +1,13 @@
+"""
+Test configuration
+
+The tests import the plugin modules by their flat names (as the command line
+and the benchmarks do), so the plugin directory goes on sys.path. Modules that
+need GDAL are skipped where it is not installed.
+"""
+import os
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PLUGIN_DIR not in sys.path:
+    sys.path.insert(0, PLUGIN_DIR)
@@ -0,0 +1,66 @@
+"""Tests of the memory-aware admission of concurrent jobs (dem_downscaling_admission)"""
+from dem_downscaling_admission import AdmissionQueue
+
+
+class FakeTask:
+    def __init__(self, name, memory_mb):
+        self.name = name
+        self.memory_mb = memory_mb
+
+    def __repr__(self):
+        return self.name
+
+
+def submit(queue, *tasks):
+    for task in tasks:
+        queue.add(task)
+    return queue.admit()
+
+
+def test_running_tasks_reserve_their_memory():
+    queue = AdmissionQueue(budget_mb=1000, max_concurrent=8)
+    a, b, c = FakeTask('a', 600), FakeTask('b', 600), FakeTask('c', 300)
+    # Nothing has been allocated yet, but b does not fit next to a's reservation
+    assert submit(queue, a, b) == [a]
+    assert queue.pending == [b]
+    assert queue.reserved_mb == 600
+    # c would fit, but does not overtake b
+    assert submit(queue, c) == []
+    queue.remove(a)
+    assert queue.admit() == [b, c]
+    assert queue.reserved_mb == 900
+
+
+def test_task_larger_than_budget_runs_alone():
+    queue = AdmissionQueue(budget_mb=1000, max_concurrent=8)
+    large, small = FakeTask('large', 5000), FakeTask('small', 10)
+    assert submit(queue, large, small) == [large]
+    queue.remove(large)
+    assert queue.admit() == [small]
+
+
+def test_max_concurrent_limits_small_tasks():
+    queue = AdmissionQueue(budget_mb=1000, max_concurrent=2)
+    tasks = [FakeTask(str(i), 1) for i in range(4)]
+    assert submit(queue, *tasks) == tasks[:2]
+    queue.remove(tasks[0])
+    assert queue.admit() == [tasks[2]]
+
+
+def test_removing_pending_task_keeps_budget():
+    queue = AdmissionQueue(budget_mb=1000, max_concurrent=8)
+    a, b = FakeTask('a', 800), FakeTask('b', 800)
+    submit(queue, a, b)
+    queue.remove(b)
+    assert queue.pending == [] and queue.running == [a]
+    assert queue.admit() == []
+
+
+def test_budget_is_taken_once(monkeypatch):
+    import dem_downscaling_admission
+    monkeypatch.setattr(dem_downscaling_admission, 'available_memory_mb', lambda: 1000)
+    queue = AdmissionQueue.for_available_memory(0.5, 4)
+    monkeypatch.setattr(dem_downscaling_admission, 'available_memory_mb', lambda: 10)
+    assert queue.budget_mb == 500
+    assert submit(queue, FakeTask('a', 200), FakeTask('b', 200)) == queue.running
+    assert len(queue.running) == 2
@@ -0,0 +1,103 @@
+"""Tests of area-of-interest processing (dem_downscaling_aoi)"""
+import os
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+import dem_downscaling_aoi as aoi  # noqa: E402
+from dem_downscaling_aoi import group_windows  # noqa: E402
+from dem_downscaling_algorithm import CancellationToken, DownscalingCancelled  # noqa: E402
+from benchmarks.terrain import make_dem, write_dem  # noqa: E402
+
+PIXEL_SIZE = 30.0
+ORIGIN = (500000.0, 2000000.0)
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    data, _ = make_dem(96, 64, seed=3)
+    return write_dem(str(tmp_path / 'input.tif'), data, pixel_size=PIXEL_SIZE)
+
+
+def pixel_extent(xoff, yoff, xsize, ysize):
+    """Map extent of an input pixel window"""
+    x0, y0 = ORIGIN
+    return (x0 + xoff * PIXEL_SIZE, y0 - (yoff + ysize) * PIXEL_SIZE,
+            x0 + (xoff + xsize) * PIXEL_SIZE, y0 - yoff * PIXEL_SIZE)
+
+
+def test_distant_windows_stay_separate():
+    groups = group_windows([(0, 0, 10, 10), (100, 100, 10, 10)], 5)
+    assert sorted(members for _, members in groups) == [[0], [1]]
+
+
+def test_windows_within_margin_are_merged():
+    # 6 px apart: the 4 px margins of both windows overlap
+    groups = group_windows([(0, 0, 10, 10), (16, 0, 10, 10)], 4)
+    assert groups == [((0, 0, 26, 10), [0, 1])]
+    # ...but 3 px margins only touch
+    assert len(group_windows([(0, 0, 10, 10), (16, 0, 10, 10)], 3)) == 2
+
+
+def test_merging_is_transitive():
+    # Windows 0 and 3 only connect through window 1
+    windows = [(0, 0, 10, 10), (12, 0, 10, 10), (40, 0, 10, 10), (24, 0, 10, 10)]
+    groups = group_windows(windows, 2)
+    assert len(groups) == 2
+    window, members = max(groups, key=lambda group: len(group[1]))
+    assert window == (0, 0, 34, 10)
+    assert sorted(members) == [0, 1, 3]
+
+
+def test_groups_are_disjoint_after_growing():
+    windows = [(x * 7, (x * 13) % 50, 5, 5) for x in range(12)]
+    margin = 2
+    groups = group_windows(windows, margin)
+    assert sorted(i for _, members in groups for i in members) == list(range(len(windows)))
+    for a in range(len(groups)):
+        for b in range(a + 1, len(groups)):
+            wa, wb = groups[a][0], groups[b][0]
+            assert (wa[0] + wa[2] + margin <= wb[0] - margin or wb[0] + wb[2] + margin <= wa[0] - margin
+                    or wa[1] + wa[3] + margin <= wb[1] - margin or wb[1] + wb[3] + margin <= wa[1] - margin)
+
+
+def test_extent_output_is_written(tmp_path, input_file):
+    output_file = str(tmp_path / 'output.tif')
+    result = aoi.downscale_dem_aoi(input_file, output_file, 2, 4.0, extent=pixel_extent(8, 8, 24, 16),
+                                   margin=4, max_iterations=5, workers=1)
+    assert result['output_size'] == (48, 32)
+    assert os.path.isfile(output_file)
+
+
+def test_cancelled_run_removes_partial_output(tmp_path, input_file):
+    output_file = str(tmp_path / 'output.tif')
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(DownscalingCancelled):
+        aoi.downscale_dem_aoi(input_file, output_file, 2, 4.0, extent=pixel_extent(8, 8, 24, 16),
+                              margin=4, max_iterations=5, cancel_token=token)
+    assert not os.path.exists(output_file)
+
+
+def test_failed_part_removes_output_and_drops_pending_parts(tmp_path, input_file, monkeypatch):
+    read_windows = []
+    read_window = aoi.read_window
+
+    def failing_read_window(fn, xoff, yoff, xsize, ysize):
+        read_windows.append((xoff, yoff))
+        if len(read_windows) == 1:
+            raise RuntimeError("read error")
+        return read_window(fn, xoff, yoff, xsize, ysize)
+
+    monkeypatch.setattr(aoi, 'read_window', failing_read_window)
+    # Three independent parts side by side, run one at a time
+    monkeypatch.setattr(aoi, 'group_windows', lambda windows, margin: [
+        ((x, 8, 8, 8), [0]) for x in (4, 40, 76)
+    ])
+    output_file = str(tmp_path / 'output.tif')
+    with pytest.raises(RuntimeError, match="read error"):
+        aoi.downscale_dem_aoi(input_file, output_file, 2, 4.0, extent=pixel_extent(4, 8, 80, 8),
+                              margin=2, max_iterations=5, workers=1)
+    assert not os.path.exists(output_file)
+    assert len(read_windows) == 1
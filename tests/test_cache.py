@@ -0,0 +1,87 @@
+"""Tests of the LRU directory cache behind the staging and result caches (dem_cache)"""
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from dem_cache import LruFileCache  # noqa: E402
+
+KB = 1024
+
+
+def add_entry(cache, key, size, age=None):
+    build_dir = cache.new_entry_dir()
+    with open(os.path.join(build_dir, 'data'), 'wb') as f:
+        f.write(b'x' * size)
+    cache.commit(key, build_dir)
+    if age is not None:
+        # Pretend the entry was last used age seconds ago
+        stamp = os.stat(cache.entry_dir(key)).st_mtime - age
+        os.utime(cache.entry_dir(key), (stamp, stamp))
+
+
+def keys(cache):
+    return sorted(key for key, _ in cache.entries())
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = LruFileCache(str(tmp_path), max_size_mb=3 * KB / (1024 * 1024))
+    add_entry(cache, 'a', KB, age=30)
+    add_entry(cache, 'b', KB, age=20)
+    add_entry(cache, 'c', KB, age=10)
+    assert cache.lookup('a') is not None  # a becomes the most recently used
+    add_entry(cache, 'd', KB)
+    assert keys(cache) == ['a', 'c', 'd']
+    assert not os.path.exists(cache.entry_dir('b'))
+
+
+def test_lookup_does_not_rewrite_the_index(tmp_path):
+    cache = LruFileCache(str(tmp_path), max_size_mb=1)
+    add_entry(cache, 'a', KB)
+    index_file = os.path.join(str(tmp_path), LruFileCache.INDEX_NAME)
+    before = os.stat(index_file).st_mtime_ns
+    assert cache.lookup('a') is not None
+    assert cache.lookup('missing') is None
+    assert os.stat(index_file).st_mtime_ns == before
+    add_entry(cache, 'b', KB)
+    with open(index_file, 'r', encoding='utf-8') as f:
+        assert json.load(f)['a']['hits'] == 1
+
+
+def test_entries_missing_from_the_index_are_counted_and_evicted(tmp_path):
+    cache = LruFileCache(str(tmp_path), max_size_mb=2 * KB / (1024 * 1024))
+    orphan = os.path.join(str(tmp_path), 'orphan')
+    os.makedirs(orphan)
+    with open(os.path.join(orphan, 'data'), 'wb') as f:
+        f.write(b'x' * KB)
+    os.utime(orphan, (1, 1))
+    assert cache.total_size_mb() == pytest.approx(KB / (1024 * 1024))
+    add_entry(cache, 'a', KB)
+    add_entry(cache, 'b', KB)
+    assert keys(cache) == ['a', 'b']
+    assert not os.path.exists(orphan)
+
+
+def test_purge_removes_unindexed_entries(tmp_path):
+    cache = LruFileCache(str(tmp_path), max_size_mb=1)
+    add_entry(cache, 'a', KB)
+    os.makedirs(os.path.join(str(tmp_path), 'orphan'))
+    cache.purge()
+    assert cache.entries() == []
+    assert not os.path.exists(os.path.join(str(tmp_path), 'orphan'))
+
+
+def _store(args):
+    cache_dir, key = args
+    add_entry(LruFileCache(cache_dir, max_size_mb=100), key, KB)
+
+
+def test_concurrent_processes_keep_every_index_update(tmp_path):
+    cache_dir = str(tmp_path)
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(_store, [(cache_dir, f'k{i:02d}') for i in range(24)]))
+    with open(os.path.join(cache_dir, LruFileCache.INDEX_NAME), 'r', encoding='utf-8') as f:
+        assert len(json.load(f)) == 24
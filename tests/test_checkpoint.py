@@ -0,0 +1,71 @@
+"""Tests of checkpointing and resuming runs (dem_downscaling_algorithm)"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / 'input.dem'
+    path.write_bytes(b'not a raster: checkpoint_metadata only looks at the file on disk')
+    return str(path)
+
+
+def test_round_trip(tmp_path, input_file):
+    fn = str(tmp_path / 'run.checkpoint.npz')
+    dscal = np.arange(16, dtype=np.float64).reshape(4, 4)
+    meta = algorithm.checkpoint_metadata(input_file, 2, 4.0, -9999)
+    algorithm.save_checkpoint(fn, dscal, 25, 1.5, [3.0, 2.0, 1.5], meta)
+
+    checkpoint = algorithm.load_checkpoint(fn, expected_meta=meta)
+    np.testing.assert_array_equal(checkpoint['dscal'], dscal)
+    assert checkpoint['iteration'] == 25
+    assert checkpoint['energy_old'] == 1.5
+    assert list(checkpoint['energy_history']) == [3.0, 2.0, 1.5]
+    assert checkpoint['meta'] == meta
+    assert not os.path.exists(fn + ".tmp.npz")
+
+
+@pytest.mark.parametrize('change', ['zoom', 'rsme', 'input'])
+def test_checkpoint_of_another_run_is_rejected(tmp_path, input_file, change):
+    fn = str(tmp_path / 'run.checkpoint.npz')
+    meta = algorithm.checkpoint_metadata(input_file, 2, 4.0, None)
+    algorithm.save_checkpoint(fn, np.zeros((4, 4)), 5, 1.0, [1.0], meta)
+
+    if change == 'zoom':
+        expected = algorithm.checkpoint_metadata(input_file, 4, 4.0, None)
+    elif change == 'rsme':
+        expected = algorithm.checkpoint_metadata(input_file, 2, 2.0, None)
+    else:
+        with open(input_file, 'ab') as f:
+            f.write(b' edited')
+        expected = algorithm.checkpoint_metadata(input_file, 2, 4.0, None)
+    with pytest.raises(ValueError, match='does not match'):
+        algorithm.load_checkpoint(fn, expected_meta=expected)
+
+
+def test_resumed_run_matches_uninterrupted_run():
+    rng = np.random.default_rng(0)
+    goc = rng.random((12, 12)) * 100
+    full, full_info = algorithm.downscale_array(goc, 2, 4.0, threshold=0.0, max_iterations=8, engine='loop')
+
+    saved = {}
+
+    def keep(dscal, iteration, energy, energy_history):
+        saved.update(dscal=dscal.copy(), iteration=iteration, energy=energy, history=list(energy_history))
+
+    algorithm.downscale_array(goc, 2, 4.0, threshold=0.0, max_iterations=4, engine='loop',
+                              checkpoint_callback=keep, checkpoint_interval=4)
+    assert saved['iteration'] == 4
+    resumed, resumed_info = algorithm.downscale_array(
+        goc, 2, 4.0, threshold=0.0, max_iterations=8, engine='loop',
+        initial_dscal=saved['dscal'], start_iteration=saved['iteration'],
+        initial_energy=saved['energy'], energy_history=saved['history']
+    )
+    np.testing.assert_allclose(resumed, full)
+    assert resumed_info['iterations'] == full_info['iterations']
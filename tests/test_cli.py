@@ -0,0 +1,33 @@
+"""Tests of the batch planning helpers of the command line (dem_downscaling_cli)"""
+import os
+
+import pytest
+
+pytest.importorskip('osgeo')
+
+from dem_downscaling_cli import expand_inputs, output_path_for, plan_workers  # noqa: E402
+
+
+@pytest.mark.parametrize('job_memory_mb, max_jobs, budget_mb, expected', [
+    ([1000, 2000, 500], 8, 8000, 4),  # the largest job decides
+    ([1000], 2, 8000, 2),             # capped by --jobs
+    ([5000], 4, 1000, 1),             # never below one job
+    ([], 3, 1000, 3),                 # nothing to size
+    ([0, 0], 3, 1000, 3)
+])
+def test_plan_workers(job_memory_mb, max_jobs, budget_mb, expected):
+    assert plan_workers(job_memory_mb, max_jobs, budget_mb) == expected
+
+
+def test_expand_inputs_merges_globs_and_list_file(tmp_path):
+    for name in ('a.tif', 'b.tif', 'c.img'):
+        (tmp_path / name).write_bytes(b'')
+    list_file = tmp_path / 'jobs.txt'
+    list_file.write_text(f"# comment\n{tmp_path / 'c.img'}\n\n{tmp_path / 'a.tif'}\n", encoding='utf-8')
+    paths = expand_inputs([str(tmp_path / '*.tif')], list_file=str(list_file))
+    assert [os.path.basename(path) for path in paths] == ['a.tif', 'b.tif', 'c.img']
+
+
+def test_output_path_for(tmp_path):
+    assert output_path_for('/data/dem.img') == os.path.join('/data', 'dem_downscaled.tif')
+    assert output_path_for('/data/dem.img', str(tmp_path), '_4x') == os.path.join(str(tmp_path), 'dem_4x.tif')
@@ -0,0 +1,70 @@
+"""Tests of incremental updates (dem_downscaling_incremental)"""
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+from dem_downscaling_algorithm import downscale_dem  # noqa: E402
+from dem_downscaling_incremental import (  # noqa: E402
+    block_hashes, changed_blocks, changed_window, downscale_dem_incremental
+)
+from benchmarks.terrain import make_dem, write_dem  # noqa: E402
+
+
+def test_block_hashes_cover_partial_edge_blocks():
+    hashes = block_hashes(np.zeros((10, 7), dtype=np.float32), 4)
+    assert len(hashes) == 3
+    assert all(len(row) == 2 for row in hashes)
+
+
+def test_only_edited_blocks_change():
+    data = np.arange(64 * 48, dtype=np.float32).reshape(64, 48)
+    before = block_hashes(data, 16)
+    edited = data.copy()
+    edited[20, 40] += 1.0
+    changed = changed_blocks(before, block_hashes(edited, 16))
+    assert changed.shape == (4, 3)
+    assert list(zip(*np.nonzero(changed))) == [(1, 2)]
+
+
+def test_block_hashes_see_strided_views_by_content():
+    data = np.arange(32 * 32, dtype=np.float64).reshape(32, 32)
+    assert block_hashes(data[::2, ::2], 8) == block_hashes(np.ascontiguousarray(data[::2, ::2]), 8)
+
+
+def test_changed_window_grows_by_margin_and_clips():
+    changed = np.zeros((4, 4), dtype=bool)
+    changed[1, 2] = True
+    changed[2, 1] = True
+    # Blocks of 16 px on a 60 x 50 raster: union of the blocks is x 16..48, y 16..48, y clipped at 50
+    assert changed_window(changed, 16, 60, 50, 4) == (12, 12, 40, 38)
+    # Edge block clipped to the raster size
+    changed = np.zeros((4, 4), dtype=bool)
+    changed[3, 3] = True
+    assert changed_window(changed, 16, 60, 50, 8) == (40, 40, 20, 10)
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    data, _ = make_dem(48, 32, seed=5)
+    return write_dem(str(tmp_path / 'input.tif'), data)
+
+
+def test_unchanged_input_is_not_recomputed(tmp_path, input_file):
+    output_file = str(tmp_path / 'output.tif')
+    first = downscale_dem_incremental(input_file, output_file, 2, 4.0, max_iterations=5, block_size=16, halo=8)
+    assert not first['incremental']
+    second = downscale_dem_incremental(input_file, output_file, 2, 4.0, max_iterations=5, block_size=16, halo=8)
+    assert second['incremental'] and second['changed_blocks'] == 0
+    for key in ('input_size', 'output_size', 'nodata_preserved', 'stopped_early'):
+        assert second[key] == first[key]
+
+
+def test_output_of_another_run_is_not_patched(tmp_path, input_file):
+    output_file = str(tmp_path / 'output.tif')
+    downscale_dem_incremental(input_file, output_file, 2, 4.0, max_iterations=5, block_size=16, halo=8)
+    # A plain run with another zoom replaces the output; the fingerprint stays behind
+    downscale_dem(input_file, output_file, 3, 4.0, max_iterations=5)
+    result = downscale_dem_incremental(input_file, output_file, 2, 4.0, max_iterations=5, block_size=16, halo=8)
+    assert not result['incremental']
+    assert result['output_size'] == (96, 64)
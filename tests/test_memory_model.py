@@ -0,0 +1,21 @@
+"""Checks of estimate_memory_usage against measured peaks (see benchmarks/memory_model.py)"""
+import pytest
+
+pytest.importorskip('osgeo')
+pytest.importorskip('scipy')
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+from benchmarks.memory_model import measure, within_tolerance  # noqa: E402
+
+
+def test_vectorized_peak_within_tolerance(tmp_path):
+    record = measure('vectorized', 64, 2, 'coastal', 'float32', str(tmp_path))
+    assert within_tolerance(record, 0.15, 0.5), record
+
+
+def test_dtype_only_changes_input_buffer():
+    float32 = algorithm.estimate_memory_usage(512, 512, 4, engine='vectorized', dtype='float32')
+    int16 = algorithm.estimate_memory_usage(512, 512, 4, engine='vectorized', dtype='int16')
+    assert float32['output_mb'] == int16['output_mb']
+    assert float32['temp_mb'] == int16['temp_mb']
+    assert float32['input_mb'] - int16['input_mb'] == pytest.approx(512 * 512 * 2 / (1024 * 1024))
@@ -0,0 +1,114 @@
+"""Tests of tiled, pipelined and preview runs (dem_downscaling_pipeline)"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+import dem_downscaling_pipeline as pipeline  # noqa: E402
+from dem_downscaling_algorithm import (  # noqa: E402
+    CancellationToken, DownscalingCancelled, downscale_array, downscale_dem, open_raster
+)
+from benchmarks.terrain import make_dem, write_dem  # noqa: E402
+
+
+@pytest.fixture
+def dem():
+    data, _ = make_dem(96, 80, seed=1)
+    return data
+
+
+@pytest.fixture
+def input_file(tmp_path, dem):
+    return write_dem(str(tmp_path / 'input.tif'), dem)
+
+
+def read_output(fn):
+    ds = open_raster(fn)
+    data = ds.GetRasterBand(1).ReadAsArray()
+    ds = None
+    return data
+
+
+def test_tiled_run_agrees_with_full_raster_run(dem):
+    full, _ = downscale_array(dem, 2, 4.0, threshold=0.0, max_iterations=50)
+    errors = {}
+    for halo in (0, 16):
+        tiled, info = pipeline.downscale_array_tiled(dem, 2, 4.0, threshold=0.0, max_iterations=50,
+                                                     tile_size=32, halo=halo, workers=2)
+        assert info['tiles'] == 9
+        errors[halo] = np.abs(tiled - full).max()
+    # Within a small fraction of the relief with a halo; without one the seams show
+    assert errors[16] <= 1e-3 * np.ptp(full)
+    assert errors[0] > 100 * errors[16]
+
+
+def test_pipelined_output_agrees_with_downscale_dem(tmp_path, input_file):
+    downscale_dem(input_file, str(tmp_path / 'full.tif'), 2, 4.0, threshold=0.0, max_iterations=20)
+    result = pipeline.downscale_dem_pipelined(input_file, str(tmp_path / 'tiled.tif'), 2, 4.0, threshold=0.0,
+                                              max_iterations=20, tile_size=32, halo=16, workers=2)
+    assert result['tiles'] == 9
+    assert result['output_size'] == (192, 160)
+    full = read_output(str(tmp_path / 'full.tif'))
+    tiled = read_output(str(tmp_path / 'tiled.tif'))
+    assert np.abs(tiled - full).max() <= 1e-3 * np.ptp(full)
+
+
+def test_cancelled_pipeline_removes_partial_output(tmp_path, input_file):
+    output_file = str(tmp_path / 'output.tif')
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(DownscalingCancelled):
+        pipeline.downscale_dem_pipelined(input_file, output_file, 2, 4.0, max_iterations=5, tile_size=32,
+                                         workers=2, cancel_token=token)
+    assert not os.path.exists(output_file)
+
+
+@pytest.mark.parametrize('output_mode', ['single', 'chunks'])
+def test_failed_tile_removes_partial_output(tmp_path, input_file, monkeypatch, output_mode):
+    downscale_tile = pipeline.downscale_tile
+    computed = []
+
+    def failing_downscale_tile(goc, window, *args, **kwargs):
+        computed.append(window.tile_id)
+        if window.tile_id == '1_1':
+            raise RuntimeError("compute error")
+        return downscale_tile(goc, window, *args, **kwargs)
+
+    monkeypatch.setattr(pipeline, 'downscale_tile', failing_downscale_tile)
+    output_file = str(tmp_path / 'output.tif')
+    with pytest.raises(RuntimeError, match="compute error"):
+        pipeline.downscale_dem_pipelined(input_file, output_file, 2, 4.0, max_iterations=5, tile_size=32,
+                                         workers=2, output_mode=output_mode)
+    assert '1_1' in computed
+    assert not os.path.exists(output_file)
+    assert not os.path.exists(pipeline.chunk_directory(output_file))
+
+
+def test_preview_decimates_large_windows(tmp_path, input_file):
+    output_file = str(tmp_path / 'preview.tif')
+    result = pipeline.downscale_preview(input_file, output_file, 2, 4.0, max_input_pixels=24 * 20, max_iterations=5)
+    assert result['decimation'] == 4
+    assert result['window'] == (0, 0, 96, 80)
+    assert result['output_size'] == (48, 40)
+    ds = open_raster(output_file)
+    # Output pixels cover 4x the input pixel size / zoom factor 2
+    assert ds.GetGeoTransform()[1] == pytest.approx(30.0 * 4 / 2)
+    ds = None
+
+
+def test_preview_of_small_extent_is_full_resolution(tmp_path, input_file):
+    # 16 x 10 input pixels of 30 m at the top left corner of the DEM
+    extent = (500000.0, 2000000.0 - 10 * 30.0, 500000.0 + 16 * 30.0, 2000000.0)
+    result = pipeline.downscale_preview(input_file, str(tmp_path / 'preview.tif'), 2, 4.0, extent=extent,
+                                        max_iterations=5)
+    assert result['decimation'] == 1
+    assert result['window'] == (0, 0, 16, 10)
+    assert result['output_size'] == (32, 20)
+
+
+@pytest.mark.parametrize('cpu_count, workers', [(None, 1), (1, 1), (2, 1), (4, 3), (16, 4)])
+def test_default_workers_leave_a_core_free(monkeypatch, cpu_count, workers):
+    monkeypatch.setattr(os, 'cpu_count', lambda: cpu_count)
+    assert pipeline._default_workers() == workers
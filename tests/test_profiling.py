@@ -0,0 +1,30 @@
+"""Tests of the run recorders (dem_downscaling_profiling)"""
+import time
+
+import pytest
+
+from dem_downscaling_profiling import TraceRecorder
+
+
+def test_trace_timestamps_share_the_unix_epoch():
+    first = TraceRecorder(process_name='first')
+    time.sleep(0.01)
+    second = TraceRecorder(process_name='second')
+    t0 = time.perf_counter()
+    first.add_span('a', t0, t0 + 0.001)
+    second.add_span('b', t0, t0 + 0.001)
+    spans = [event for event in first.events + second.events if event['ph'] == 'X']
+    # The same instant gets the same timestamp in both recorders
+    assert abs(spans[0]['ts'] - spans[1]['ts']) < 1000
+    assert abs(spans[0]['ts'] - time.time() * 1e6) < 1e6
+    assert spans[0]['dur'] == pytest.approx(1000)
+
+
+def test_trace_records_thread_names_once():
+    trace = TraceRecorder()
+    with trace.phase('read', pixels=4):
+        pass
+    trace.instant('warning')
+    names = [event for event in trace.events if event['name'] == 'thread_name']
+    assert len(names) == 1
+    assert trace.as_dict()['traceEvents'][-1]['name'] == 'warning'
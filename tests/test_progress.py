@@ -0,0 +1,107 @@
+"""Tests of the typed progress events (dem_downscaling_progress)"""
+import pytest
+
+from dem_downscaling_progress import (
+    IterationStats, LegacyProgressAdapter, PhaseEventRecorder, PhaseFinished, PhaseStarted,
+    ProgressCoalescer, ProgressListener, ProgressWarning, StatusMessage, TileDone, iteration_fraction,
+    message_callback, progress_emitter
+)
+
+
+def test_iteration_fraction_uses_share_of_max_iterations_without_threshold():
+    assert iteration_fraction(25, 100, 0.5, 1.0, 0) == pytest.approx(0.25)
+    assert iteration_fraction(250, 100, 0.5, 1.0, None) == 1.0
+    assert iteration_fraction(3, 0, 0.5, 1.0, 0) == 0.0
+
+
+def test_iteration_fraction_follows_convergence_on_log_scale():
+    # Half way from 1.0 to 1e-4 on a log scale
+    assert iteration_fraction(2, 1000, 1e-2, 1.0, 1e-4) == pytest.approx(0.5)
+    # The sign of the energy change does not matter
+    assert iteration_fraction(2, 1000, -1e-2, 1.0, 1e-4) == pytest.approx(0.5)
+    assert iteration_fraction(2, 1000, 1e-5, 1.0, 1e-4) == 1.0
+    # A delta above the reference falls back to the share of max_iterations
+    assert iteration_fraction(10, 100, 2.0, 1.0, 1e-4) == pytest.approx(0.1)
+
+
+def test_legacy_adapter_keeps_last_percentage_and_drops_quiet_events():
+    calls = []
+    adapter = LegacyProgressAdapter(lambda message, percentage: calls.append((message, percentage)))
+    adapter(StatusMessage("Reading", 10))
+    adapter(PhaseStarted('iterate', percentage=20))
+    adapter(PhaseFinished('iterate', 1.5))
+    adapter(ProgressWarning("No convergence"))
+    assert calls == [("Reading", 10), ("No convergence", 20)]
+
+
+def test_progress_emitter_normalizes_callbacks():
+    assert progress_emitter(None) is None
+    listener = ProgressListener(lambda event: None)
+    assert progress_emitter(listener) is listener
+    assert isinstance(progress_emitter(lambda message, percentage: None), LegacyProgressAdapter)
+
+
+def test_message_callback_emits_status_messages():
+    events = []
+    callback = message_callback(ProgressListener(events.append))
+    callback("Writing", 90)
+    assert isinstance(events[0], StatusMessage)
+    assert (events[0].message, events[0].percentage) == ("Writing", 90)
+    # Handing the wrapper on does not wrap it twice
+    assert progress_emitter(callback) is callback.emit
+    message_callback(ProgressListener(events.append), keep_percentage=True)("Step", 55)
+    assert events[1].percentage is None
+    assert message_callback(None) is None
+
+
+def test_event_metrics():
+    stats = IterationStats(3, 100, 1.25, 0.01, 0.5, pixels=2000000)
+    assert stats.mpix_per_s == pytest.approx(4.0)
+    assert IterationStats(3, 100, 1.25, 0.01, 0.0, pixels=2000000).mpix_per_s is None
+    assert "Iteration 3/100" in stats.message
+    assert TileDone(2, 5, iterations=40).message == "Tile 2/5 done (40 iterations)"
+
+
+def test_phase_recorder_skips_steps_inside_iterations():
+    events = []
+    recorder = PhaseEventRecorder(events.append)
+    with recorder.phase('read'):
+        pass
+    with recorder.phase('iteration'):
+        with recorder.phase('gradient'):
+            pass
+    with pytest.raises(RuntimeError):
+        with recorder.phase('write'):
+            raise RuntimeError
+    assert [(type(event), event.phase) for event in events] == [
+        (PhaseStarted, 'read'), (PhaseFinished, 'read'), (PhaseStarted, 'write')
+    ]
+
+
+def test_coalescer_take_returns_changes_since_previous_call():
+    coalescer = ProgressCoalescer()
+    assert coalescer.take() is None
+    coalescer(PhaseStarted('iterate', percentage=20))
+    coalescer(IterationStats(1, 100, 2.0, 0.5, 0.1, percentage=21))
+    coalescer(StatusMessage("Iterating"))
+    coalescer(IterationStats(2, 100, 1.5, 0.5, 0.1, percentage=22))
+    coalescer(ProgressWarning("Slow convergence"))
+    state = coalescer.take()
+    assert state['message'] == "Slow convergence"
+    assert state['percentage'] == 22
+    assert state['phase'] == 'iterate'
+    assert [event.iteration for event in state['iterations']] == [1, 2]
+    assert [event.text for event in state['warnings']] == ["Slow convergence"]
+    assert coalescer.take() is None
+
+
+def test_coalescer_keeps_latest_state_between_takes():
+    coalescer = ProgressCoalescer()
+    coalescer(StatusMessage("Reading", 10))
+    coalescer.take()
+    coalescer(PhaseFinished('read', 0.5))
+    state = coalescer.take()
+    # Quiet events do not replace the message, and the lists start empty again
+    assert (state['message'], state['percentage']) == ("Reading", 10)
+    assert state['iterations'] == [] and state['warnings'] == []
+    assert coalescer.percentage == 10
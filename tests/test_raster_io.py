@@ -0,0 +1,37 @@
+"""Tests of raster reading and writing (dem_downscaling_algorithm)"""
+import numpy as np
+import pytest
+
+pytest.importorskip('osgeo')
+
+import dem_downscaling_algorithm as algorithm  # noqa: E402
+from benchmarks.terrain import make_dem, write_dem  # noqa: E402
+
+GEOT = (500000.0, 15.0, 0.0, 2000000.0, 0.0, -15.0)
+
+
+def read_back(fn):
+    ds = algorithm.open_raster(fn)
+    band = ds.GetRasterBand(1)
+    return band.ReadAsArray(), band.GetNoDataValue(), ds.GetGeoTransform()
+
+
+def test_create_raster_round_trip(tmp_path):
+    fn = str(tmp_path / 'output.tif')
+    data = np.arange(40 * 30, dtype=np.float64).reshape(30, 40) / 7.0
+    algorithm.create_raster(fn, data, GEOT, '', nodata_value=-32768)
+    written, nodata_value, geot = read_back(fn)
+    np.testing.assert_allclose(written, data.astype(np.float32))
+    assert nodata_value == -32768
+    assert tuple(geot) == GEOT
+
+
+def test_mapped_input_gives_same_result_as_copy(tmp_path):
+    data, nodata_value = make_dem(40, 32, nodata='coastal', seed=2)
+    input_file = write_dem(str(tmp_path / 'input.tif'), data, nodata_value)
+    outputs = {}
+    for io_mode in ('copy', 'mmap'):
+        output_file = str(tmp_path / f'output_{io_mode}.tif')
+        algorithm.downscale_dem(input_file, output_file, 2, 4.0, max_iterations=5, io_mode=io_mode)
+        outputs[io_mode] = read_back(output_file)[0]
+    np.testing.assert_array_equal(outputs['mmap'], outputs['copy'])
@@ -0,0 +1,42 @@
+"""Tests of the regression gate's comparison (benchmarks/regression_gate.py)"""
+import pytest
+
+pytest.importorskip('osgeo')
+
+from benchmarks.regression_gate import (  # noqa: E402
+    BASELINE_FILE, DEFAULT_TOLERANCES, FAILING_STATUSES, GATE_WORKLOADS, METRICS, compare, load_baseline
+)
+from benchmarks.run_benchmarks import workload_name  # noqa: E402
+
+
+def statuses(baseline, current):
+    return {(row['workload'], row['metric']): row['status'] for row in compare(baseline, current, DEFAULT_TOLERANCES)}
+
+
+def test_slower_and_larger_runs_are_regressions():
+    baseline = {'w': {'iteration_mpix_per_s': 10.0, 'peak_memory_mb': 100.0}}
+    current = {'w': {'iteration_mpix_per_s': 7.0, 'peak_memory_mb': 105.0}}
+    result = statuses(baseline, current)
+    assert result[('w', 'iteration_mpix_per_s')] == 'regression'
+    assert result[('w', 'peak_memory_mb')] == 'ok'
+
+
+def test_missing_workload_fails_the_gate():
+    baseline = {'w': {'iteration_mpix_per_s': 10.0}, 'gone': {'iteration_mpix_per_s': 10.0}}
+    current = {'w': {'iteration_mpix_per_s': 10.0}}
+    result = statuses(baseline, current)
+    assert result[('gone', 'iteration_mpix_per_s')] == 'missing'
+    assert 'missing' in FAILING_STATUSES
+
+
+def test_info_metrics_never_fail():
+    result = statuses({'w': {'initialize_mpix_per_s': 100.0}}, {'w': {'initialize_mpix_per_s': 1.0}})
+    assert result[('w', 'initialize_mpix_per_s')] == 'info'
+
+
+def test_committed_baseline_covers_every_gated_metric():
+    baseline = load_baseline(BASELINE_FILE)
+    assert baseline['environment'].get('cpu_count')
+    for workload in GATE_WORKLOADS:
+        measured = baseline['workloads'][workload_name(workload)]
+        assert all(measured.get(metric) for metric in METRICS)